@@ -0,0 +1,40 @@
+import sys
+
+import click
+
+from interpreter import benchmark, pipeline
+
+
+@click.command()
+@click.option('--size', 'sizes', type=int, multiple=True,
+        default=benchmark.SIZES)
+@click.option('--engine', 'engines', multiple=True,
+        type=click.Choice(sorted(pipeline.ENGINES)), default=['closure'])
+@click.option('--program', 'programs', multiple=True,
+        type=click.Choice(sorted(benchmark.PROGRAMS)))
+@click.option('--repeat', type=int, default=3)
+@click.option('--output', type=click.Path(), help='Where to save the results')
+@click.option('--compare', type=click.Path(exists=True),
+        help='Results of an earlier run to check for regressions against')
+@click.option('--threshold', type=float, default=1.1)
+def main(sizes, engines, programs, repeat, output, compare, threshold):
+    # the stages always include the reference tree-walker
+    stage_engines = list(dict.fromkeys(['tree', *engines]))
+    results = benchmark.bench_stages(sizes, stage_engines, repeat)
+    results += benchmark.bench_programs(sizes, engines, repeat, programs)
+    print(benchmark.table(results))
+    if output:
+        benchmark.save(results, output)
+
+    if compare:
+        regressions = benchmark.compare(
+            results, benchmark.load(compare), threshold,
+        )
+        for key, ratio in regressions:
+            print(f'REGRESSION {key}: {ratio:.2f}x slower')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,3 @@
-import readline
 import traceback
 
 import click
@@ -6,27 +5,37 @@ import click
 from interpreter import evaluator, pipeline
 
 
-def run_repl(environment):
+def run_repl(environment, engine):
+    # only needed for line editing in the REPL; see run.py for running files
+    import readline
+
     while True:
         code = input('>> ')
         if not code:
             continue
         try:
-            value = pipeline.run_code(environment, code)
+            value = pipeline.run_code(environment, code, engine)
             print(f'-> {value}')
         except Exception as e:
             traceback.print_exc()
 
 
 @click.command()
-@click.option('--builtins', type=click.File('r'),
+@click.option('--builtins', type=click.Path(exists=True, dir_okay=False),
         default='src/interpreter/builtins.lisp')
-def main(builtins):
+@click.option('--engine', type=click.Choice(sorted(pipeline.ENGINES)),
+        default='closure')
+@click.option('--cache/--no-cache', default=True,
+        help='Cache the parsed builtins on disk')
+def main(builtins, engine, cache):
     env = evaluator.Environment()
     env.begin_toplevel()
-    if builtins:
-        pipeline.run_code(env, builtins.read())
-    run_repl(env)
+    if builtins and cache:
+        pipeline.run_file(env, builtins, engine)
+    elif builtins:
+        with open(builtins) as f:
+            pipeline.run_stream(env, f, engine)
+    run_repl(env, engine)
         
 
 if __name__ == '__main__':
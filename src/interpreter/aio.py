@@ -0,0 +1,70 @@
+"""Running programs on an asyncio event loop, with the VM.
+
+`run_code` is a coroutine that runs a program in slices of `steps` calls of
+lambdas, letting the other tasks on the loop run between them, so that many
+programs can share one event loop without any of them holding it up. Since
+it awaits between slices, the task running it can be cancelled, and its
+`timeout` counts the time spent waiting for other tasks too.
+
+Builtins that call lambdas, such as `map`, make all their calls within one
+slice, so they can't be cancelled, but with a `timeout` they are stopped
+once it runs out."""
+import asyncio
+import time
+from typing import Optional
+
+from . import bytecode, desugarizer, lexer, parser, vm
+from .evaluator import Environment
+from .types import Value, NIL, RuntimeError
+
+
+# calls of lambdas between yields to the event loop
+STEPS = 1000
+
+
+async def run_node(
+    env: Environment, node: Value, steps: int = STEPS,
+    deadline: Optional[float] = None,
+) -> Value:
+    """Runs `node`, raising asyncio.TimeoutError if a builtin's calls of
+    lambdas are still running at `deadline`, by time.monotonic."""
+    if steps < 1:
+        raise RuntimeError(f'Steps must be positive, not {steps}')
+    try:
+        result = vm.start(
+            env, bytecode.compile_toplevel(node), steps, deadline,
+        )
+        while result.__class__ is vm.Suspended:
+            await asyncio.sleep(0)
+            result = vm.resume(env, result, steps, deadline)
+    except vm.DeadlinePassed:
+        raise asyncio.TimeoutError from None
+    return result
+
+
+async def _run_code(
+    env: Environment, code: str, steps: int, deadline: Optional[float],
+) -> Value:
+    trees = desugarizer.desugar_iter(lexer.tokenize(code))
+    nodes = [parser.parse(tree) for tree in trees]
+    value = NIL
+    for node in nodes:
+        value = await run_node(env, node, steps, deadline)
+    return value
+
+
+async def run_code(
+    env: Environment, code: str, steps: int = STEPS,
+    timeout: Optional[float] = None,
+) -> Value:
+    """Like `pipeline.run_code` with the 'vm' engine. Raises
+    asyncio.TimeoutError if it takes more than `timeout` seconds. Forms that
+    finished before it was cancelled or timed out keep their effects."""
+    if timeout is None:
+        return await _run_code(env, code, steps, None)
+    # `wait_for` only gets to time out when the run yields, which calls from
+    # builtins don't, so they check the deadline themselves.
+    deadline = time.monotonic() + timeout
+    return await asyncio.wait_for(
+        _run_code(env, code, steps, deadline), timeout,
+    )
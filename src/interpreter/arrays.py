@@ -0,0 +1,70 @@
+"""Support for NDARRAY values, which wrap NumPy arrays, for the array
+builtins in builtin_handlers.py.
+
+NumPy is optional: without it, the array builtins raise a RuntimeError, and
+no NDARRAY values can be made. It is slow to import, so it is only imported
+by the first array builtin that runs. The arithmetic and comparison builtins work on
+arrays too, elementwise, since they operate on the `value`s of their
+arguments; `result` turns what NumPy gives back into Values."""
+from .types import Value, ValueType, RuntimeError, vector_items
+
+# NumPy, once an array builtin has imported it. Until then there are no
+# arrays, so `result` doesn't need it.
+numpy = None
+
+
+def numpy_module():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            raise RuntimeError(
+                'Arrays need NumPy, which is not installed'
+            ) from None
+        numpy = module
+    return numpy
+
+
+def result(value, value_type: ValueType) -> Value:
+    """A Value of `value_type` for `value`, unless it is an array or a NumPy
+    scalar."""
+    if numpy is not None:
+        if isinstance(value, numpy.ndarray):
+            return Value(ValueType.NDARRAY, value)
+        if isinstance(value, numpy.generic):
+            value = value.item()
+            if value.__class__ is bool:
+                return Value.boolean(value)
+    if value_type == ValueType.BOOLEAN:
+        return Value.boolean(value)
+    return Value.number(value)
+
+
+def to_python(value: Value):
+    """`value` as (nested) Python lists of numbers and booleans."""
+    variant = value.variant
+    if variant in (ValueType.NUMBER, ValueType.BOOLEAN):
+        return value.value
+    elif variant in (ValueType.CONS, ValueType.NIL):
+        return [to_python(cons.value.car) for cons in value]
+    elif variant == ValueType.VECTOR:
+        return [to_python(item) for item in vector_items(value.value)]
+    elif variant == ValueType.NDARRAY:
+        return value.value
+    raise RuntimeError(f'Cannot make an array from {value}')
+
+
+def to_lisp(value) -> Value:
+    """The inverse of `to_python`, making lists of lists."""
+    if value.__class__ is list:
+        return Value.list_to_cons([to_lisp(item) for item in value])
+    if value.__class__ is bool:
+        return Value.boolean(value)
+    return Value.number(value)
+
+
+def unwrap(value: Value):
+    if value.variant != ValueType.NDARRAY:
+        raise RuntimeError(f'Expected an array but got {value}')
+    return value.value
@@ -0,0 +1,167 @@
+"""Evaluating many programs, or one function on many inputs, in a pool of
+worker processes.
+
+Each worker loads the prelude and runs `setup` once, when it starts, and
+freezes the globals they defined in a Prelude. Every program, or call of the
+function, then runs in an Environment of its own on top of it, so that they
+can't see each other's definitions. Inputs and results are sent between
+processes as plain Python data; see `to_python` and `from_python`."""
+import multiprocessing
+import os
+from typing import Any, Iterable, List, Optional
+
+import attr
+
+from . import pipeline
+from .evaluator import Environment, Prelude
+from .types import Value, ValueType, Cons, NIL, RuntimeError, vector_items
+
+
+PRELUDE = os.path.join(os.path.dirname(__file__), 'builtins.lisp')
+
+
+def to_python(value: Value):
+    """`value` as plain Python data: lists for lists and vectors, dicts for
+    hashmaps, and numbers, booleans and strings for atoms."""
+    variant = value.variant
+    if variant in (ValueType.NUMBER, ValueType.BOOLEAN, ValueType.STRING):
+        return value.value
+    elif variant in (ValueType.CONS, ValueType.NIL):
+        items = []
+        while value.variant == ValueType.CONS:
+            items.append(to_python(value.value.car))
+            value = value.value.cdr
+        if value.variant != ValueType.NIL:
+            raise RuntimeError('Cannot convert a list that ends in '
+                               f'{value} to Python')
+        return items
+    elif variant == ValueType.VECTOR:
+        return [to_python(item) for item in vector_items(value.value)]
+    elif variant == ValueType.HASHMAP:
+        return {
+            to_python(k): to_python(v) for k, v in value.value.items()
+        }
+    elif variant == ValueType.NDARRAY:
+        return value.value.tolist()
+    raise RuntimeError(f'Cannot convert {value} to Python')
+
+
+def from_python(data) -> Value:
+    """The inverse of `to_python`, making lists for lists and tuples. None
+    is nil."""
+    cls = data.__class__
+    if cls is bool:
+        return Value.boolean(data)
+    elif cls is int or cls is float:
+        return Value.number(data)
+    elif cls is str:
+        return Value.symbol(data)
+    elif cls is list or cls is tuple:
+        result = NIL
+        for item in reversed(data):
+            result = Cons(from_python(item), result)
+        return result
+    elif cls is dict:
+        return Value(ValueType.HASHMAP, {
+            from_python(k): from_python(v) for k, v in data.items()
+        })
+    elif data is None:
+        return NIL
+    raise RuntimeError(f'Cannot convert {data!r} to a Lisp value')
+
+
+@attr.s(auto_attribs=True, slots=True)
+class _Worker:
+    engine: str
+    # the globals after the prelude and setup have run
+    prelude: Prelude
+    function: Optional[Value]
+    return_exceptions: bool
+
+
+# set up in each worker process by `_initialize`
+_worker: Optional[_Worker] = None
+
+
+def _initialize(engine, prelude, setup, function, return_exceptions):
+    global _worker
+    env = Environment()
+    env.begin_toplevel()
+    if prelude:
+        with open(prelude) as f:
+            pipeline.run_stream(env, f, engine)
+    if setup:
+        pipeline.run_code(env, setup, engine)
+    fn = pipeline.run_code(env, function, engine) if function else None
+    _worker = _Worker(engine, Prelude.freeze(env), fn, return_exceptions)
+
+
+def _run_program(code: str):
+    try:
+        env = _worker.prelude.environment()
+        return to_python(pipeline.run_code(env, code, _worker.engine))
+    except Exception as e:
+        if _worker.return_exceptions:
+            return e
+        raise
+
+
+def _call_function(data):
+    try:
+        env = _worker.prelude.environment()
+        return to_python(pipeline.call(
+            env, _worker.function, [from_python(data)], _worker.engine,
+        ))
+    except Exception as e:
+        if _worker.return_exceptions:
+            return e
+        raise
+
+
+def _run(
+    run, items, processes, chunksize, engine, prelude, setup, function,
+    return_exceptions,
+) -> List[Any]:
+    with multiprocessing.Pool(
+        processes, _initialize,
+        (engine, prelude, setup, function, return_exceptions),
+    ) as pool:
+        return pool.map(run, items, chunksize)
+
+
+def run_programs(
+    programs: Iterable[str],
+    processes: Optional[int] = None,
+    engine: str = 'closure',
+    prelude: Optional[str] = PRELUDE,
+    setup: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """The value of the last form of each program, in the same order.
+
+    An error in a program is raised here, unless `return_exceptions` is set,
+    in which case the exception is returned as its result."""
+    return _run(
+        _run_program, programs, processes, chunksize, engine, prelude, setup,
+        None, return_exceptions,
+    )
+
+
+def map_function(
+    function: str,
+    inputs: Iterable[Any],
+    processes: Optional[int] = None,
+    engine: str = 'closure',
+    prelude: Optional[str] = PRELUDE,
+    setup: Optional[str] = None,
+    chunksize: Optional[int] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """The results of calling the function that the code `function`
+    evaluates to, e.g. a lambda or a name defined by `setup`, with each of
+    `inputs` as its argument, in the same order."""
+    return _run(
+        _call_function, inputs, processes, chunksize, engine, prelude, setup,
+        function, return_exceptions,
+    )
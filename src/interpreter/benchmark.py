@@ -0,0 +1,279 @@
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import attr
+
+from interpreter import lexer, desugarizer, parser, pipeline
+from interpreter.evaluator import Environment
+from interpreter.types import RuntimeError
+
+
+PRELUDE = os.path.join(os.path.dirname(__file__), 'builtins.lisp')
+
+SIZES = (100, 1000, 10000)
+
+
+@attr.s(auto_attribs=True, slots=True)
+class Result:
+    name: str
+    engine: Optional[str]
+    size: int
+    # best time over the repeats
+    seconds: float
+    # how much work was done, in `unit`s, for the throughput
+    units: int
+    unit: str
+    # peak memory allocated while running it once, in bytes
+    peak: int
+    # why it was skipped, if it failed to run; the numbers are then all 0
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        engine = f'[{self.engine}]' if self.engine else ''
+        return f'{self.name}{engine}/{self.size}'
+
+    @property
+    def throughput(self) -> float:
+        if self.error is not None:
+            return 0.0
+        return self.units / self.seconds if self.seconds else float('inf')
+
+
+def _measure(run: Callable[[], object], repeat: int) -> Tuple[float, int]:
+    """Best time of `repeat` calls to `run`, and its peak memory use over
+    one more call."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    # tracemalloc slows everything down, so it's measured separately
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def _environment(engine: str, prelude: bool = True) -> Environment:
+    env = Environment()
+    env.begin_toplevel()
+    if prelude:
+        with open(PRELUDE) as f:
+            pipeline.run_stream(env, f, engine)
+    return env
+
+
+# Stages
+
+def stage_source(size: int) -> str:
+    """A program of `size` top-level forms, with comments, for timing the
+    stages."""
+    forms = ['(def total 0) ; running total']
+    for i in range(size - 1):
+        forms.append(
+            f'(set total (+ total ((lambda (x y) (* x (- y 1.5))) '
+            f'{i} {i % 7}))) ; form {i}'
+        )
+    return '\n'.join(forms) + '\n'
+
+
+def bench_stages(
+    sizes: Iterable[int] = SIZES,
+    engines: Iterable[str] = ('tree',),
+    repeat: int = 3,
+) -> List[Result]:
+    results = []
+    for size in sizes:
+        source = stage_source(size)
+        tokens = lexer.lex(source)
+        trees = desugarizer.desugar(tokens)
+        nodes = [parser.parse(tree) for tree in trees]
+
+        stages = [
+            # The lexer skips the comments itself, as the pipeline relies on,
+            # so it gets the source as it is. Its tokens are made lazily.
+            ('lex', lambda: list(lexer.tokenize(source)), len(source),
+                'chars'),
+            ('desugar', lambda: desugarizer.desugar(tokens), len(tokens),
+                'tokens'),
+            ('parse', lambda: [parser.parse(tree) for tree in trees],
+                len(trees), 'forms'),
+        ]
+        for name, run, units, unit in stages:
+            seconds, peak = _measure(run, repeat)
+            results.append(
+                Result(name, None, size, seconds, units, unit, peak)
+            )
+
+        for engine in engines:
+            def run():
+                env = _environment(engine, prelude=False)
+                pipeline._run_nodes(env, nodes, engine)
+            seconds, peak = _measure(run, repeat)
+            results.append(
+                Result('eval', engine, size, seconds, len(nodes), 'forms', peak)
+            )
+    return results
+
+
+# Programs, run end to end with the prelude loaded. Each is a function of the
+# size, and `PROGRAM_SIZES` scales the sizes down for the slow ones.
+
+def fib_program(n: int) -> str:
+    return f'''
+    (def fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+    (fib {n})
+    '''
+
+
+def map_filter_reduce_program(n: int) -> str:
+    return f'''
+    (def upto (lambda (n acc) (if (= n 0) acc (upto (- n 1) (cons n acc)))))
+    (reduce (lambda (a b) (+ a b))
+        (filter (lambda (x) (= (% x 2) 0))
+            (map (lambda (x) (* x x)) (upto {n} nil)))
+        0)
+    '''
+
+
+def deep_closures_program(n: int) -> str:
+    # a chain of n closures, each calling the one it captured
+    return f'''
+    (def wrap (lambda (n f)
+        (if (= n 0) f (wrap (- n 1) (lambda (x) (f (+ x 1)))))))
+    ((wrap {n} (lambda (x) x)) 0)
+    '''
+
+
+def big_literal_program(n: int) -> str:
+    numbers = ' '.join(str(i) for i in range(n))
+    # a quoted form evaluates to the whole (quote ...) form
+    return f'(length (car (cdr (quote ({numbers})))))'
+
+
+PROGRAMS: Dict[str, Callable[[int], str]] = {
+    'fib': fib_program,
+    'map_filter_reduce': map_filter_reduce_program,
+    'deep_closures': deep_closures_program,
+    'big_literal': big_literal_program,
+}
+
+# fib is exponential, so its sizes are the argument's logarithm-ish.
+PROGRAM_SIZES: Dict[str, Callable[[int], int]] = {
+    'fib': lambda size: max(1, size.bit_length() + 5),
+}
+
+
+def bench_programs(
+    sizes: Iterable[int] = SIZES,
+    engines: Iterable[str] = ('closure',),
+    repeat: int = 3,
+    programs: Optional[Iterable[str]] = None,
+) -> List[Result]:
+    results = []
+    for name in programs or PROGRAMS:
+        make = PROGRAMS[name]
+        scale = PROGRAM_SIZES.get(name, lambda size: size)
+        for engine in engines:
+            for size in sizes:
+                n = scale(size)
+                code = make(n)
+                env = _environment(engine)
+
+                def run():
+                    return pipeline.run_code(env, code, engine)
+                try:
+                    seconds, peak = _measure(run, repeat)
+                except (RecursionError, RuntimeError) as e:
+                    # e.g. the tree-walker, which recurses in Python for each
+                    # call, on the larger sizes, or on deep_closures at all,
+                    # since its dynamic scoping makes `f` call itself. The
+                    # other benchmarks still run.
+                    results.append(Result(
+                        name, engine, n, 0.0, 0, 'n', 0,
+                        f'{e.__class__.__name__}: {e}',
+                    ))
+                    continue
+                results.append(
+                    Result(name, engine, n, seconds, n, 'n', peak)
+                )
+    return results
+
+
+# Reporting
+
+def metadata() -> dict:
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def to_json(results: List[Result]) -> dict:
+    return {
+        'metadata': metadata(),
+        'results': [
+            dict(attr.asdict(result), key=result.key,
+                 throughput=result.throughput)
+            for result in results
+        ],
+    }
+
+
+def save(results: List[Result], path: str):
+    with open(path, 'w') as f:
+        json.dump(to_json(results), f, indent=2)
+
+
+def load(path: str) -> Dict[str, dict]:
+    """The results saved in `path`, by key."""
+    with open(path) as f:
+        return {result['key']: result for result in json.load(f)['results']}
+
+
+def table(results: List[Result]) -> str:
+    lines = [
+        f'{"benchmark":<36} {"time (ms)":>12} {"throughput":>22} '
+        f'{"peak (KiB)":>12}'
+    ]
+    for result in results:
+        if result.error is not None:
+            lines.append(f'{result.key:<36} skipped: {result.error}')
+            continue
+        throughput = f'{result.throughput:,.0f} {result.unit}/s'
+        lines.append(
+            f'{result.key:<36} {result.seconds * 1000:>12.3f} '
+            f'{throughput:>22} {result.peak / 1024:>12.1f}'
+        )
+    return '\n'.join(lines)
+
+
+def compare(
+    results: List[Result], baseline: Dict[str, dict], threshold: float = 1.1
+) -> List[Tuple[str, float]]:
+    """The benchmarks that got slower than `baseline` by more than a factor
+    of `threshold`, with how many times slower they were."""
+    regressions = []
+    for result in results:
+        old = baseline.get(result.key)
+        if old is None or not old['seconds'] or result.error is not None:
+            continue
+        ratio = result.seconds / old['seconds']
+        if ratio > threshold:
+            regressions.append((result.key, ratio))
+    return regressions
@@ -1,6 +1,14 @@
+import array
+import collections
 import functools
 
-from .types import Value, ValueType, Cons, RuntimeError
+import attr
+
+from . import arrays
+from .types import (
+    Value, ValueType, Cons, NIL, HASHABLE, LispTypeError, RuntimeError,
+    vector_items,
+)
 
 
 BUILTINS = {
@@ -13,29 +21,138 @@ BUILTINS = {
     # '^', '&', '|',
     # list
     'cons', 'car', 'cdr', 'set_car', 'set_cdr', 'concat', 'length', 'list',
+    'range', 'reverse', 'nth', 'append', 'zip',
+    # higher-order list functions
+    'map', 'filter', 'reduce', 'foldr', 'sort', 'pmap',
+    # vector
+    'vector', 'int_vector', 'float_vector', 'vector_get', 'vector_set',
+    'vector_slice', 'vector_push', 'vector_to_list', 'list_to_vector',
+    # hashmap
+    'hashmap', 'hashmap_get', 'hashmap_put', 'hashmap_delete',
+    'hashmap_contains', 'hashmap_keys', 'hashmap_values', 'hashmap_size',
+    # memoization
+    'memoize', 'memo_hits', 'memo_misses', 'memo_size', 'memo_clear',
+    # instrumentation; see instrumentation.py
+    'eval_counters',
+    # ndarray; these need NumPy (see arrays.py)
+    'array', 'array_range', 'array_to_list', 'array_sum', 'array_mean',
+    'array_min', 'array_max', 'array_dot', 'array_mask',
 }
 
 
 HANDLERS = {}
 
+# Builtins that call Lisp functions. Their handlers take a second argument,
+# `call(fn, args)`, from the engine running them, which calls the Lisp function
+# `fn` with a list of arguments and returns its result.
+CALLS_FUNCTIONS = set()
+
+# Builtins that also need the environment they run in. Their handlers take it
+# as a third argument, after `call`.
+NEEDS_ENVIRONMENT = set()
+
+# Builtins that make cons cells, with functions of their arguments and result
+# that say how many they made, for the limits in instrumentation.py. The other
+# builtins make none, or only return cells that already exist.
+ALLOCATIONS = {}
+
+# Builtins that build lists whose size is known from their arguments, with
+# functions of the arguments that say how many cells they will make, so that
+# the limits can stop them before they build a list that is too big.
+ALLOCATIONS_AHEAD = {}
+
+
+def _cells(args, result) -> int:
+    """The cells of `result`, a list made by the builtin."""
+    return sum(1 for _ in result)
+
+
+def _nested_cells(args, result) -> int:
+    """The cells of `result` and of the lists in it, all made by the
+    builtin."""
+    count = 0
+    for cons in result:
+        count += 1
+        if cons.value.car.variant == ValueType.CONS:
+            count += _nested_cells(args, cons.value.car)
+    return count
+
+
+def _number(n) -> Value:
+    cls = n.__class__
+    if cls is int or cls is float:
+        return Value.number(n)
+    # Arithmetic on arrays makes arrays, and NumPy's reductions make scalars
+    # of NumPy's own types.
+    return arrays.result(n, ValueType.NUMBER)
+
+
+def _boolean(b) -> Value:
+    if b.__class__ is bool:
+        return Value.boolean(b)
+    return arrays.result(b, ValueType.BOOLEAN)
+
+
+# Makes the result of a handler into a value of the handler's value type,
+# reusing the shared instances where there are some.
+_WRAPPERS = {
+    ValueType.NUMBER: _number,
+    ValueType.BOOLEAN: _boolean,
+}
+
+
+def handler(
+    name, value_type=None, minimum=None, maximum=None, exact=None,
+    calls=False, allocates=None, allocates_ahead=None, environment=False,
+):
+    wrap = None
+    if value_type:
+        wrap = _WRAPPERS.get(value_type, functools.partial(Value, value_type))
+    if exact is not None:
+        minimum = maximum = exact
+    low = minimum or 0
+    high = maximum if maximum is not None else float('inf')
+    checked = minimum is not None or maximum is not None
 
-def handler(name, value_type=None, minimum=None, maximum=None, exact=None):
     def wrapped(f):
-        @functools.wraps(f)
-        def g(args):
-            argc = len(args)
-            if exact is not None:
-                assert argc == exact
-            if minimum is not None:
-                assert argc >= minimum
-            if maximum is not None:
-                assert argc <= maximum
-
-            result = f(args)
-            return Value(value_type, result) if value_type else result
+        # A wrapper is made for every builtin when this module is imported,
+        # and runs on every call, so it only does what the handler needs.
+        if not checked and wrap is None:
+            g = f
+        elif environment:
+            def g(args, call, env):
+                assert low <= len(args) <= high
+                result = f(args, call, env)
+                return wrap(result) if wrap else result
+        elif calls:
+            def g(args, call):
+                assert low <= len(args) <= high
+                result = f(args, call)
+                return wrap(result) if wrap else result
+        elif not checked:
+            def g(args):
+                return wrap(f(args))
+        else:
+            def g(args):
+                assert low <= len(args) <= high
+                result = f(args)
+                return wrap(result) if wrap else result
 
         assert name in BUILTINS
         HANDLERS[name] = g
+        if calls or environment:
+            CALLS_FUNCTIONS.add(name)
+        if environment:
+            NEEDS_ENVIRONMENT.add(name)
+        if allocates:
+            ALLOCATIONS[name] = allocates
+        if allocates_ahead:
+            def ahead(args):
+                # a wrong number of arguments is left to the handler
+                if not low <= len(args) <= high:
+                    return 0
+                return allocates_ahead(args)
+            ALLOCATIONS_AHEAD[name] = ahead
         return g
     return wrapped
 
@@ -126,7 +243,7 @@ def ge(args):
     return args[0].value >= args[1].value
 
 
-@handler('cons', ValueType.CONS, exact=2)
+@handler('cons', exact=2, allocates=lambda args, result: 1)
 def cons(args):
     return Cons(args[0], args[1])
 
@@ -159,37 +276,516 @@ def set_cdr(args):
     return args[1]
 
 
-@handler('concat')
+@handler('concat', allocates=_cells)
 def concat(args):
-    result = Value(ValueType.NIL)
-    result_ptr = result
-    for l in args:
-        for cons in l:
-            result_ptr.type_ = ValueType.CONS
-            result_ptr.value = Cons(car=cons.value.car)
-            result_ptr = result_ptr.value.cdr
-    return result
+    return Value.list_to_cons([cons.value.car for l in args for cons in l])
 
 
 @handler('length', ValueType.NUMBER, exact=1)
 def length(args):
+    if args[0].variant in (
+        ValueType.VECTOR, ValueType.HASHMAP, ValueType.NDARRAY,
+    ):
+        return len(args[0].value)
     return sum(1 for cons in args[0])
 
 
-@handler('list')
+@handler('list', allocates=_cells, allocates_ahead=len)
 def _list(args):
-    result = Value(ValueType.NIL)
-    result_ptr = result
-    for v in args:
-        result_ptr.type_ = ValueType.CONS
-        result_ptr.value = Cons(car=v)
-        result_ptr = result_ptr.value.cdr
-    print('list result:', result)
+    return Value.list_to_cons(args)
+
+
+def _vector(value: Value):
+    if value.variant != ValueType.VECTOR:
+        raise RuntimeError(f'Expected a vector but got {value}')
+    return value.value
+
+
+def _index(vector, value: Value) -> int:
+    index = value.value
+    if value.variant != ValueType.NUMBER or index.__class__ is not int:
+        raise RuntimeError(f'Vector index must be an integer but got {value}')
+    if not 0 <= index < len(vector):
+        raise RuntimeError(
+            f'Vector index {index} out of range for length {len(vector)}'
+        )
+    return index
+
+
+def _numbers(typecode: str, values) -> array.array:
+    """An array of the numbers in `values`, for a typed vector."""
+    result = array.array(typecode)
+    for value in values:
+        _append(result, value)
+    return result
+
+
+def _append(vector, value: Value):
+    if isinstance(vector, array.array):
+        if value.variant != ValueType.NUMBER:
+            raise RuntimeError(f'Cannot store {value} in a numeric vector')
+        try:
+            vector.append(value.value)
+        except (TypeError, OverflowError) as e:
+            raise RuntimeError(f'Cannot store {value} in a numeric vector') \
+                from e
+    else:
+        vector.append(value)
+
+
+@handler('vector', ValueType.VECTOR)
+def vector(args):
+    return list(args)
+
+
+@handler('int_vector', ValueType.VECTOR)
+def int_vector(args):
+    return _numbers('q', args)
+
+
+@handler('float_vector', ValueType.VECTOR)
+def float_vector(args):
+    return _numbers('d', args)
+
+
+@handler('vector_get', exact=2)
+def vector_get(args):
+    vector = _vector(args[0])
+    item = vector[_index(vector, args[1])]
+    if isinstance(vector, array.array):
+        return Value.number(item)
+    return item
+
+
+@handler('vector_set', exact=3)
+def vector_set(args):
+    vector = _vector(args[0])
+    index = _index(vector, args[1])
+    if isinstance(vector, array.array):
+        # checks the type of the new element
+        vector[index] = _numbers(vector.typecode, args[2:])[0]
+    else:
+        vector[index] = args[2]
+    return args[2]
+
+
+@handler('vector_slice', ValueType.VECTOR, minimum=2, maximum=3)
+def vector_slice(args):
+    vector = _vector(args[0])
+    bounds = []
+    for bound in args[1:]:
+        if bound.variant != ValueType.NUMBER or \
+                bound.value.__class__ is not int:
+            raise RuntimeError(
+                f'Slice bounds must be integers but got {bound}'
+            )
+        bounds.append(bound.value)
+    return vector[slice(*bounds)] if len(bounds) == 2 else vector[bounds[0]:]
+
+
+@handler('vector_push', exact=2)
+def vector_push(args):
+    _append(_vector(args[0]), args[1])
+    return args[0]
+
+
+@handler('vector_to_list', exact=1, allocates=_cells)
+def vector_to_list(args):
+    return Value.list_to_cons(list(vector_items(_vector(args[0]))))
+
+
+@handler('list_to_vector', ValueType.VECTOR, exact=1)
+def list_to_vector(args):
+    return [cons.value.car for cons in args[0]]
+
+
+def _hashmap(value: Value) -> dict:
+    if value.variant != ValueType.HASHMAP:
+        raise RuntimeError(f'Expected a hashmap but got {value}')
+    return value.value
+
+
+def _key(value: Value) -> Value:
+    if value.variant not in HASHABLE:
+        raise RuntimeError(f'Cannot use {value} as a hashmap key')
+    return value
+
+
+@handler('hashmap', ValueType.HASHMAP)
+def hashmap(args):
+    # (hashmap key1 value1 key2 value2 ...)
+    if len(args) % 2:
+        raise RuntimeError('hashmap takes keys and values in pairs')
+    return {_key(args[i]): args[i + 1] for i in range(0, len(args), 2)}
+
+
+@handler('hashmap_get', minimum=2, maximum=3)
+def hashmap_get(args):
+    # (hashmap_get map key [default])
+    result = _hashmap(args[0]).get(_key(args[1]))
+    if result is not None:
+        return result
+    if len(args) == 3:
+        return args[2]
+    raise RuntimeError(f'Key not found: {args[1]}')
+
+
+@handler('hashmap_put', exact=3)
+def hashmap_put(args):
+    _hashmap(args[0])[_key(args[1])] = args[2]
+    return args[0]
+
+
+@handler('hashmap_delete', exact=2)
+def hashmap_delete(args):
+    _hashmap(args[0]).pop(_key(args[1]), None)
+    return args[0]
+
+
+@handler('hashmap_contains', ValueType.BOOLEAN, exact=2)
+def hashmap_contains(args):
+    return _key(args[1]) in _hashmap(args[0])
+
+
+@handler('hashmap_keys', exact=1, allocates=_cells)
+def hashmap_keys(args):
+    return Value.list_to_cons(list(_hashmap(args[0])))
+
+
+@handler('hashmap_values', exact=1, allocates=_cells)
+def hashmap_values(args):
+    return Value.list_to_cons(list(_hashmap(args[0]).values()))
+
+
+@handler('hashmap_size', ValueType.NUMBER, exact=1)
+def hashmap_size(args):
+    return len(_hashmap(args[0]))
+
+
+def _items(value: Value):
+    """The elements of the list `value`."""
+    if value.variant not in (ValueType.CONS, ValueType.NIL):
+        raise RuntimeError(f'Expected a list but got {value}')
+    return [cons.value.car for cons in value]
+
+
+def _integer(value: Value) -> int:
+    if value.variant != ValueType.NUMBER or value.value.__class__ is not int:
+        raise RuntimeError(f'Expected an integer but got {value}')
+    return value.value
+
+
+def _test(result: Value) -> bool:
+    # Predicates are held to the same rule as the condition of an `if`.
+    if result.variant != ValueType.BOOLEAN:
+        raise RuntimeError(f'Condition returned non-bool value: {result}')
+    return result.value
+
+
+@handler(
+    'range', minimum=1, maximum=3, allocates=_cells,
+    allocates_ahead=lambda args: len(range(*map(_integer, args))),
+)
+def range_(args):
+    # (range end), (range start end) or (range start end step)
+    return Value.list_to_cons(
+        [Value.number(i) for i in range(*map(_integer, args))]
+    )
+
+
+@handler(
+    'reverse', exact=1, allocates=_cells,
+    allocates_ahead=lambda args: len(_items(args[0])),
+)
+def reverse(args):
+    result = NIL
+    for item in _items(args[0]):
+        result = Cons(item, result)
+    return result
+
+
+@handler('nth', exact=2)
+def nth(args):
+    items = _items(args[0])
+    index = _integer(args[1])
+    if not 0 <= index < len(items):
+        raise RuntimeError(
+            f'Index {index} out of range for list of length {len(items)}'
+        )
+    return items[index]
+
+
+def _append_cells(args, result) -> int:
+    # the last list isn't copied
+    return sum(len(_items(l)) for l in args[:-1])
+
+
+@handler(
+    'append', allocates=_append_cells,
+    allocates_ahead=lambda args: _append_cells(args, None),
+)
+def append(args):
+    # Like concat, but the last list is shared with the result instead of
+    # being copied.
+    if not args:
+        return NIL
+    result = args[-1]
+    for l in reversed(args[:-1]):
+        for item in reversed(_items(l)):
+            result = Cons(item, result)
+    return result
+
+
+@handler(
+    'zip', minimum=1, allocates=_nested_cells,
+    # a list of the shortest length, of lists of one item from each
+    allocates_ahead=lambda args: min(len(_items(l)) for l in args) * (
+        len(args) + 1
+    ),
+)
+def zip_(args):
+    return Value.list_to_cons([
+        Value.list_to_cons(items) for items in zip(*map(_items, args))
+    ])
+
+
+@handler(
+    'map', exact=2, calls=True, allocates=_cells,
+    allocates_ahead=lambda args: len(_items(args[1])),
+)
+def map_(args, call):
+    f = args[0]
+    return Value.list_to_cons([call(f, [item]) for item in _items(args[1])])
+
+
+@handler('filter', exact=2, calls=True, allocates=_cells)
+def filter_(args, call):
+    f = args[0]
+    return Value.list_to_cons(
+        [item for item in _items(args[1]) if _test(call(f, [item]))]
+    )
+
+
+@handler('pmap', minimum=2, maximum=3, environment=True, allocates=_cells)
+def pmap(args, call, env):
+    # (pmap f l) or (pmap f l chunk_size); see parallel.py
+    from . import parallel
+    chunk_size = _integer(args[2]) if len(args) == 3 else None
+    return Value.list_to_cons(
+        parallel.pmap(env, args[0], _items(args[1]), call, chunk_size)
+    )
+
+
+@handler('reduce', exact=3, calls=True)
+def reduce(args, call):
+    # (reduce f l init) folds from the left: (f (f init l0) l1) ...
+    f, l, result = args
+    for item in _items(l):
+        result = call(f, [result, item])
+    return result
+
+
+@handler('foldr', exact=3, calls=True)
+def foldr(args, call):
+    # (foldr f l init) folds from the right: (f l0 (f l1 ... init))
+    f, l, result = args
+    for item in reversed(_items(l)):
+        result = call(f, [item, result])
     return result
 
 
+@handler('sort', minimum=1, maximum=2, calls=True, allocates=_cells)
+def sort(args, call):
+    # (sort l) sorts numbers or strings in increasing order; (sort l less)
+    # sorts by the function `less`. The sort is stable.
+    items = _items(args[0])
+    try:
+        if len(args) == 1:
+            items.sort()
+        else:
+            less = args[1]
+            items.sort(key=functools.cmp_to_key(
+                lambda a, b: -1 if _test(call(less, [a, b])) else 0
+            ))
+    except LispTypeError as e:
+        raise RuntimeError(str(e)) from e
+    return Value.list_to_cons(items)
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Memoized:
+    """`value` of a lambda made by `memoize`.
+
+    Each engine calls it with `call`, giving it its own way to call `fn`."""
+    fn: Value
+    max_size: int
+    # from tuples of arguments to results, least recently used first
+    cache: collections.OrderedDict = attr.ib(factory=collections.OrderedDict)
+    hits: int = 0
+    misses: int = 0
+
+    def call(self, args, call) -> Value:
+        # Equal numbers of different types, like 1 and 1.0, are equal values,
+        # but must not share results. The type is named rather than kept, so
+        # that the cache can be saved in a snapshot.
+        key = tuple((arg, arg.value.__class__.__name__) for arg in args)
+        try:
+            result = self.cache.get(key)
+        except LispTypeError:
+            # Only numbers, strings and booleans can be hashed, so calls with
+            # anything else aren't cached.
+            return call(self.fn, args)
+        # Memoized functions in a Prelude are shared between threads, so
+        # another thread may have removed the entry or emptied the cache.
+        if result is not None:
+            self.hits += 1
+            try:
+                self.cache.move_to_end(key)
+            except KeyError:
+                pass
+            return result
+        self.misses += 1
+        result = call(self.fn, args)
+        self.cache[key] = result
+        if len(self.cache) > self.max_size:
+            try:
+                self.cache.popitem(last=False)
+            except KeyError:
+                pass
+        return result
+
+    def __str__(self):
+        return f'<memoized {self.fn}>'
+
+
+def _memoized(value: Value) -> Memoized:
+    if value.variant != ValueType.LAMBDA or \
+            value.value.__class__ is not Memoized:
+        raise RuntimeError(f'Expected a memoized function but got {value}')
+    return value.value
+
+
+@handler('memoize', ValueType.LAMBDA, minimum=1, maximum=2)
+def memoize(args):
+    # (memoize f [max_size]); the least recently used results are dropped
+    # when there are more than max_size of them
+    fn = args[0]
+    if fn.variant != ValueType.LAMBDA:
+        raise RuntimeError(f'Cannot memoize {fn}')
+    max_size = _integer(args[1]) if len(args) == 2 else 1024
+    if max_size < 1:
+        raise RuntimeError(f'Cache size must be positive but got {max_size}')
+    return Memoized(fn, max_size)
+
+
+@handler('memo_hits', ValueType.NUMBER, exact=1)
+def memo_hits(args):
+    return _memoized(args[0]).hits
+
+
+@handler('memo_misses', ValueType.NUMBER, exact=1)
+def memo_misses(args):
+    return _memoized(args[0]).misses
+
+
+@handler('memo_size', ValueType.NUMBER, exact=1)
+def memo_size(args):
+    return len(_memoized(args[0]).cache)
+
+
+@handler('memo_clear', exact=1)
+def memo_clear(args):
+    # empties the cache and resets the counters
+    memoized = _memoized(args[0])
+    memoized.cache.clear()
+    memoized.hits = memoized.misses = 0
+    return args[0]
+
+
+@handler('eval_counters', exact=0)
+def eval_counters(args):
+    # InstrumentedEnvironment handles this itself, since it needs the
+    # environment.
+    raise RuntimeError(
+        'eval_counters needs an InstrumentedEnvironment and the tree engine'
+    )
+
+
+@handler('array', ValueType.NDARRAY, exact=1)
+def ndarray(args):
+    # from a list, vector or array; nested lists make arrays of more dimensions
+    return arrays.numpy_module().array(arrays.to_python(args[0]))
+
+
+@handler('array_range', ValueType.NDARRAY, minimum=1, maximum=3)
+def array_range(args):
+    # like `range`, but the bounds may be floats
+    bounds = [arrays.to_python(arg) for arg in args]
+    return arrays.numpy_module().arange(*bounds)
+
+
+@handler('array_to_list', exact=1, allocates=_nested_cells)
+def array_to_list(args):
+    return arrays.to_lisp(arrays.unwrap(args[0]).tolist())
+
+
+@handler('array_sum', ValueType.NUMBER, exact=1)
+def array_sum(args):
+    return arrays.unwrap(args[0]).sum()
+
+
+@handler('array_mean', ValueType.NUMBER, exact=1)
+def array_mean(args):
+    return arrays.unwrap(args[0]).mean()
+
+
+def _reduction(name, args):
+    values = arrays.unwrap(args[0])
+    if not values.size:
+        raise RuntimeError(f'Cannot take the {name} of an empty array')
+    return getattr(values, name)()
+
+
+@handler('array_min', ValueType.NUMBER, exact=1)
+def array_min(args):
+    return _reduction('min', args)
+
+
+@handler('array_max', ValueType.NUMBER, exact=1)
+def array_max(args):
+    return _reduction('max', args)
+
+
+@handler('array_dot', ValueType.NUMBER, exact=2)
+def array_dot(args):
+    # a number for two vectors, otherwise an array
+    a = arrays.unwrap(args[0])
+    b = arrays.unwrap(args[1])
+    try:
+        return arrays.numpy_module().dot(a, b)
+    except ValueError as e:
+        raise RuntimeError(str(e)) from e
+
+
+@handler('array_mask', ValueType.NDARRAY, exact=2)
+def array_mask(args):
+    # the elements of the first array where the second, of booleans, is true
+    values = arrays.unwrap(args[0])
+    mask = arrays.unwrap(args[1])
+    if mask.dtype != bool or mask.shape != values.shape:
+        raise RuntimeError(
+            'A mask must be an array of booleans of the same shape as the '
+            'array'
+        )
+    return values[mask]
+
+
 assert BUILTINS == set(HANDLERS.keys()), BUILTINS - set(HANDLERS.keys())
 
 
-def handle(name: str, args) -> Value:
+def handle(name: str, args, call=None, env=None) -> Value:
+    if name in NEEDS_ENVIRONMENT:
+        return HANDLERS[name](args, call, env)
+    if name in CALLS_FUNCTIONS:
+        return HANDLERS[name](args, call)
     return HANDLERS[name](args)
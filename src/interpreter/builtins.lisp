@@ -9,22 +9,11 @@
 (def if (lambda (pred then else) (if pred then else)))
 (def lambda (lambda (args body) (lambda args body)))  ; whoaa
 
-(def filter
-	 (lambda (f l)
-	   (if (= l nil)
-		 nil
-		 (if (f (car l))
-		   (cons (car l) (filter f (cdr l)))
-		   (filter f (cdr l))))))
-
-(def map
-	 (lambda (f l)
-	   (if (= l nil)
-		 nil
-		 (cons (f (car l)) (map f (cdr l))))))
-
-(def reduce
-	 (lambda (f l init)
-	   (if (= l nil)
-		 init
-		 (reduce f (cdr l) (f init (car l))))))
+; map, filter, reduce, foldr, reverse, range, nth, append, sort and zip are
+; builtins. These make the ones that take functions, and reverse, values too,
+; so that they can be passed around as they could when they were defined here.
+(def map (lambda (f l) (map f l)))
+(def filter (lambda (f l) (filter f l)))
+(def reduce (lambda (f l init) (reduce f l init)))
+(def foldr (lambda (f l init) (foldr f l init)))
+(def reverse (lambda (l) (reverse l)))
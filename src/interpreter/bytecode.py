@@ -0,0 +1,320 @@
+import array
+from typing import Any, Dict, List, Optional
+
+import attr
+
+from .types import Value, ValueType, NIL, RuntimeError
+from .evaluator import KEYWORDS, _assert, _assert_arity
+from .resolver import Scope, UNDEFINED, body_statements, new_scope
+from . import builtin_handlers
+
+
+# Every instruction is two ints: the opcode and its argument. Local variables
+# are addressed as `depth << 16 | slot`; see `resolver`.
+CONST = 0          # push consts[arg]
+LOAD_LOCAL = 1     # push slot `arg` of the current frame
+LOAD_OUTER = 2     # push the local at address `arg`
+LOAD_GLOBAL = 3    # push the global named names[arg]
+SET_LOCAL = 4      # store the top of the stack at address `arg`, which must
+                   # already be defined; leaves the value on the stack
+DEF_LOCAL = 5      # store the top of the stack at address `arg`
+SET_GLOBAL = 6
+DEF_GLOBAL = 7
+POP = 8
+JUMP = 9           # continue at instruction index `arg`
+JUMP_IF_FALSE = 10 # pop a boolean, and jump to `arg` if it is false
+ENTER_SCOPE = 11   # make a frame with `arg` undefined slots
+LEAVE_SCOPE = 12
+MAKE_CLOSURE = 13  # push a closure of the CodeObject consts[arg]
+CALL = 14          # pop the function then `arg` arguments, and call it
+TAIL_CALL = 15     # like CALL, but replaces the current call
+# consts[arg] is (handler, argument count, whether it calls Lisp functions)
+CALL_BUILTIN = 16
+LIST = 17          # pop `arg` values and push them as a list
+EVAL = 18          # pop a value and evaluate it in the Scope consts[arg]
+RAISE = 19         # raise a RuntimeError with message consts[arg]
+RETURN = 20
+
+OPNAMES = [
+    'CONST', 'LOAD_LOCAL', 'LOAD_OUTER', 'LOAD_GLOBAL', 'SET_LOCAL',
+    'DEF_LOCAL', 'SET_GLOBAL', 'DEF_GLOBAL', 'POP', 'JUMP', 'JUMP_IF_FALSE',
+    'ENTER_SCOPE', 'LEAVE_SCOPE', 'MAKE_CLOSURE', 'CALL', 'TAIL_CALL',
+    'CALL_BUILTIN', 'LIST', 'EVAL', 'RAISE', 'RETURN',
+]
+
+_MAX_SLOT = 0xFFFF
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class CodeObject:
+    """Bytecode for a top-level form, a lambda body or an `eval`."""
+    code: array.array
+    consts: List[Any]
+    names: List[str]
+    # names of the local variables accessed by the instruction at each index,
+    # for error messages
+    local_names: Dict[int, str]
+    # The rest only apply to lambda bodies, and to `eval`s that need a frame
+    # of their own.
+    arity: int = 0
+    padding: List = attr.ib(factory=list)
+    args: Optional[Value] = None
+    body: Optional[Value] = None
+    scope: Optional[Scope] = None
+
+
+class _Assembler:
+    def __init__(self):
+        self.code = array.array('l')
+        self.consts = []
+        self.names = []
+        self.local_names = {}
+        self._const_indices = {}
+        self._name_indices = {}
+
+    def emit(self, op: int, arg: int = 0) -> int:
+        """Returns the index of the instruction's argument, for patching."""
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) - 1
+
+    def here(self) -> int:
+        return len(self.code)
+
+    def patch(self, index: int, target: int) -> None:
+        self.code[index] = target
+
+    def const(self, value: Any) -> int:
+        key = id(value)
+        if key not in self._const_indices:
+            self._const_indices[key] = len(self.consts)
+            self.consts.append(value)
+        return self._const_indices[key]
+
+    def name(self, name: str) -> int:
+        if name not in self._name_indices:
+            self._name_indices[name] = len(self.names)
+            self.names.append(name)
+        return self._name_indices[name]
+
+    def assemble(self, **kwargs) -> CodeObject:
+        self.emit(RETURN)
+        return CodeObject(
+            code=self.code,
+            consts=self.consts,
+            names=self.names,
+            local_names=self.local_names,
+            **kwargs,
+        )
+
+    # Node compilers
+
+    def node(self, node: Value, scope: Optional[Scope], tail: bool) -> None:
+        variant = node.variant
+        if variant in (ValueType.NUMBER, ValueType.BOOLEAN, ValueType.NIL):
+            self.emit(CONST, self.const(node))
+        elif variant == ValueType.STRING:
+            self.variable(node.value, scope)
+        elif variant == ValueType.CONS:
+            fn_node = node.value.car
+            fn_args = node.value.cdr
+
+            if fn_node.value == 'quote':
+                # Quote prevents further evaluation
+                _assert_arity('quote', fn_args, 1)
+                self.emit(CONST, self.const(node))
+                return
+
+            if fn_node.variant == ValueType.STRING:
+                if fn_node.value in KEYWORDS:
+                    keyword = getattr(self, 'keyword_' + fn_node.value)
+                    keyword(fn_args, scope, tail)
+                    return
+                if fn_node.value in builtin_handlers.BUILTINS:
+                    self.builtin(fn_node.value, fn_args, scope)
+                    return
+            self.application(fn_node, fn_args, scope, tail)
+        else:
+            raise RuntimeError(f'Cannot evaluate {node}')
+
+    def _address(self, name: str, scope: Optional[Scope]) -> Optional[int]:
+        address = scope.resolve(name) if scope is not None else None
+        if address is None:
+            return None
+        depth, slot = address
+        _assert(slot <= _MAX_SLOT, f'Too many variables in scope of {name}')
+        return depth << 16 | slot
+
+    def variable(self, name: str, scope: Optional[Scope]) -> None:
+        address = self._address(name, scope)
+        if address is None:
+            self.emit(LOAD_GLOBAL, self.name(name))
+            return
+        self.local_names[self.here()] = name
+        self.emit(LOAD_LOCAL if address <= _MAX_SLOT else LOAD_OUTER, address)
+
+    def statements(
+        self, statements: List[Value], scope: Optional[Scope], tail: bool
+    ) -> None:
+        if not statements:
+            self.emit(CONST, self.const(NIL))
+            return
+        for statement in statements[:-1]:
+            self.node(statement, scope, False)
+            self.emit(POP)
+        self.node(statements[-1], scope, tail)
+
+    def scoped(
+        self, statements: List[Value], scope: Optional[Scope], tail: bool
+    ) -> None:
+        block_scope = new_scope(scope, (), statements)
+        if not block_scope:
+            self.statements(statements, scope, tail)
+            return
+        self.emit(ENTER_SCOPE, len(block_scope))
+        self.statements(statements, block_scope, tail)
+        self.emit(LEAVE_SCOPE)
+
+    def keyword_block(self, args, scope, tail):
+        self.scoped([arg.value.car for arg in args], scope, tail)
+
+    def keyword_if(self, args, scope, tail):
+        _assert_arity('if', args, 3)
+        cond, if_true, if_false = (arg.value.car for arg in args)
+        self.node(cond, scope, False)
+        to_else = self.emit(JUMP_IF_FALSE)
+        self.node(if_true, scope, tail)
+        to_end = self.emit(JUMP)
+        self.patch(to_else, self.here())
+        self.node(if_false, scope, tail)
+        self.patch(to_end, self.here())
+
+    def keyword_list(self, args, scope, tail):
+        # order of evaluation matters
+        count = 0
+        for arg in args:
+            self.node(arg.value.car, scope, False)
+            count += 1
+        self.emit(LIST, count)
+
+    def keyword_lambda(self, args, scope, tail):
+        _assert_arity('lambda', args, 2)
+        fn_args, body = args
+        fn_args = fn_args.value.car
+        body = body.value.car
+        if fn_args.variant not in (ValueType.CONS, ValueType.NIL) or any(
+            arg.value.car.variant != ValueType.STRING for arg in fn_args
+        ):
+            # Reported when the lambda is created, like any other runtime
+            # error.
+            self.emit(RAISE, self.const(f'Invalid argument list: {fn_args}'))
+            return
+        params = [arg.value.car.value for arg in fn_args]
+        _assert(
+            len(set(params)) == len(params),
+            f'Duplicate argument names: {params}',
+        )
+        statements = body_statements(body)
+        fn_scope = new_scope(scope, params, statements)
+        body_assembler = _Assembler()
+        # the body is in tail position
+        body_assembler.statements(statements, fn_scope, True)
+        function = body_assembler.assemble(
+            arity=len(params),
+            padding=[UNDEFINED] * (len(fn_scope) - len(params)),
+            args=fn_args,
+            body=body,
+            scope=fn_scope,
+        )
+        self.emit(MAKE_CLOSURE, self.const(function))
+
+    def _keyword_set(self, name, args, scope):
+        _assert_arity(name, args, 2)
+        key_node, value_node = args
+        assert key_node.value.car.variant == ValueType.STRING
+        key = key_node.value.car.value
+        self.node(value_node.value.car, scope, False)
+        address = self._address(key, scope)
+        if address is None:
+            op = SET_GLOBAL if name == 'set' else DEF_GLOBAL
+            self.emit(op, self.name(key))
+            return
+        self.local_names[self.here()] = key
+        self.emit(SET_LOCAL if name == 'set' else DEF_LOCAL, address)
+
+    def keyword_set(self, args, scope, tail):
+        self._keyword_set('set', args, scope)
+
+    def keyword_def(self, args, scope, tail):
+        self._keyword_set('def', args, scope)
+
+    def keyword_eval(self, args, scope, tail):
+        _assert_arity('eval', args, 1)
+        arg, = args
+        self.node(arg.value.car, scope, False)
+        self.emit(EVAL, self.const(scope))
+
+    def builtin(self, name, args, scope):
+        count = 0
+        for arg in args:
+            self.node(arg.value.car, scope, False)
+            count += 1
+        handler = builtin_handlers.HANDLERS[name]
+        # 2 if the handler takes `call` and the environment, 1 if it only
+        # takes `call`
+        if name in builtin_handlers.NEEDS_ENVIRONMENT:
+            calls = 2
+        else:
+            calls = int(name in builtin_handlers.CALLS_FUNCTIONS)
+        self.emit(CALL_BUILTIN, self.const((handler, count, calls)))
+
+    def application(self, fn_node, args, scope, tail):
+        # Arguments are evaluated before the function, as in
+        # `Environment.eval`.
+        count = 0
+        for arg in args:
+            self.node(arg.value.car, scope, False)
+            count += 1
+        self.node(fn_node, scope, False)
+        self.emit(TAIL_CALL if tail else CALL, count)
+
+
+def compile_toplevel(node: Value) -> CodeObject:
+    assembler = _Assembler()
+    assembler.node(node, None, False)
+    return assembler.assemble()
+
+
+def compile_eval(node: Value, scope: Optional[Scope]) -> CodeObject:
+    """Compiles quoted code passed to `eval` in the scope of the `eval`.
+
+    Since frames have a fixed size, any new local `def`s get a scope of their
+    own, whose slots are given by `padding`."""
+    assembler = _Assembler()
+    if scope is None:
+        assembler.node(node, None, False)
+        return assembler.assemble()
+    eval_scope = new_scope(scope, (), [node])
+    if not eval_scope:
+        assembler.node(node, scope, False)
+        return assembler.assemble()
+    assembler.node(node, eval_scope, False)
+    return assembler.assemble(
+        padding=[UNDEFINED] * len(eval_scope), scope=eval_scope,
+    )
+
+
+def disassemble(code_object: CodeObject) -> str:
+    lines = []
+    code = code_object.code
+    for pc in range(0, len(code), 2):
+        op, arg = code[pc], code[pc + 1]
+        line = f'{pc:>5} {OPNAMES[op]:<14}{arg}'
+        if op in (CONST, MAKE_CLOSURE, CALL_BUILTIN, EVAL, RAISE):
+            line += f' ({code_object.consts[arg]})'
+        elif op in (LOAD_GLOBAL, SET_GLOBAL, DEF_GLOBAL):
+            line += f' ({code_object.names[arg]})'
+        elif pc in code_object.local_names:
+            line += f' ({code_object.local_names[pc]})'
+        lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,134 @@
+"""An on-disk cache of parsed source files.
+
+The parsed forms of a file are saved under the hash of its contents, so that
+running the same file again skips the front end (lexing, desugaring and
+parsing). Entries are also keyed by the version of the front end, so editing
+the interpreter invalidates them."""
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from typing import List, Optional
+
+from . import lexer, desugarizer, parser, types
+from .types import Value, ValueType, Cons, NIL, TRUE, FALSE
+
+
+# The modules whose code decides what a source file parses to, including
+# `types`, which has the values the forms are made of. This module, which
+# decides how they are saved, is hashed with them.
+_FRONT_END = (lexer, desugarizer, parser, types)
+
+_version: Optional[bytes] = None
+
+
+def version() -> bytes:
+    """Identifies the front end and the format of the cache files."""
+    global _version
+    if _version is None:
+        digest = hashlib.sha256()
+        digest.update(sys.implementation.cache_tag.encode())
+        digest.update(str(marshal.version).encode())
+        for path in [module.__file__ for module in _FRONT_END] + [__file__]:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        _version = digest.digest()
+    return _version
+
+
+def default_directory() -> str:
+    directory = os.environ.get('LISP_CACHE_DIR')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'lisp_interpreter')
+
+
+# Parsed forms are saved as plain Python data, which marshal reads quickly:
+# lists for lists, and Python numbers, strings and booleans for atoms.
+
+def _encode(node: Value):
+    variant = node.variant
+    if variant == ValueType.CONS or variant == ValueType.NIL:
+        return [_encode(cons.value.car) for cons in node]
+    return node.value
+
+
+def _decode(data) -> Value:
+    cls = data.__class__
+    if cls is list:
+        return _decode_list(data)
+    elif cls is bool:
+        return Value.boolean(data)
+    elif cls is str:
+        return Value.symbol(data)
+    return Value.number(data)
+
+
+def _decode_list(data: list) -> Value:
+    # The atoms are decoded inline, since most of the elements of lists are
+    # atoms and this is the hot loop of loading from the cache.
+    symbol = Value.symbol
+    number = Value.number
+    result = NIL
+    for item in reversed(data):
+        cls = item.__class__
+        if cls is list:
+            item = _decode_list(item)
+        elif cls is str:
+            item = symbol(item)
+        elif cls is bool:
+            item = TRUE if item else FALSE
+        else:
+            item = number(item)
+        result = Cons(item, result)
+    return result
+
+
+def parse(source: str) -> List[Value]:
+    trees = desugarizer.desugar_iter(lexer.tokenize(source))
+    return [parser.parse(tree) for tree in trees]
+
+
+def _path(directory: str, source: bytes) -> str:
+    digest = hashlib.sha256(version())
+    digest.update(source)
+    return os.path.join(directory, digest.hexdigest() + '.forms')
+
+
+def load(path: str, directory: Optional[str] = None) -> List[Value]:
+    """The parsed top-level forms of the file at `path`, from the cache if
+    they are there, and saved to it otherwise."""
+    with open(path, 'rb') as f:
+        source = f.read()
+    cache_path = _path(directory or default_directory(), source)
+    try:
+        with open(cache_path, 'rb') as f:
+            return [_decode(form) for form in marshal.load(f)]
+    except (OSError, EOFError, ValueError, TypeError):
+        # missing or unreadable
+        pass
+
+    forms = parse(source.decode())
+    save(cache_path, forms)
+    return forms
+
+
+def save(cache_path: str, forms: List[Value]):
+    # Written to a temporary file and moved into place, so that other
+    # processes never see half a file. The cache is only an optimization, so
+    # failing to write it is not an error.
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump([_encode(form) for form in forms], f)
+            os.replace(temporary, cache_path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    except OSError:
+        pass
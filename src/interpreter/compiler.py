@@ -0,0 +1,379 @@
+from typing import Callable, List, Optional
+
+import attr
+
+from .types import ValueType, Value, NIL, RuntimeError
+from .evaluator import KEYWORDS, Environment, to_list, _assert, _assert_arity
+from .resolver import Frame, Scope, UNDEFINED, body_statements, new_scope
+from . import builtin_handlers
+from .builtin_handlers import Memoized
+
+
+# A compiled node: takes the environment holding the globals and the current
+# frame, and returns the value of the node.
+Code = Callable[[Environment, Frame], Value]
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Function:
+    """Everything about a lambda that is known at compile time."""
+    args: Value
+    body: Value
+    scope: Scope
+    code: Code
+    arity: int
+    # initial contents of the slots for the lambda's own `def`s
+    padding: List
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class TailCall:
+    """Returned by a call in tail position instead of making the call.
+
+    `call` makes the call in a loop, so that tail calls do not grow the Python
+    stack."""
+    fn: Value
+    args: List[Value]
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Closure:
+    """`value` of a lambda created by compiled code."""
+    function: Function
+    frame: Optional[Frame]
+
+    def __str__(self):
+        arg_str = ' '.join([arg.value.car.value for arg in self.function.args])
+        return f'<lambda: ({arg_str})>'
+
+
+def _undefined(name):
+    return RuntimeError(f'Variable {name} not defined')
+
+
+def _error(message: str) -> Code:
+    def error(env, frame):
+        raise RuntimeError(message)
+    return error
+
+
+def _constant(value: Value) -> Code:
+    return lambda env, frame: value
+
+
+def _global(name: str) -> Code:
+    def global_(env, frame):
+        try:
+            return env.scopes[0][name]
+        except KeyError:
+            raise _undefined(name) from None
+    return global_
+
+
+def _local(name: str, depth: int, slot: int) -> Code:
+    # The common depths get their own closures so that no loop is needed.
+    if depth == 0:
+        def local(env, frame):
+            value = frame[slot]
+            if value is UNDEFINED:
+                raise _undefined(name)
+            return value
+    elif depth == 1:
+        def local(env, frame):
+            value = frame[0][slot]
+            if value is UNDEFINED:
+                raise _undefined(name)
+            return value
+    else:
+        def local(env, frame):
+            for _ in range(depth):
+                frame = frame[0]
+            value = frame[slot]
+            if value is UNDEFINED:
+                raise _undefined(name)
+            return value
+    return local
+
+
+def _variable(name: str, scope: Optional[Scope]) -> Code:
+    address = scope.resolve(name) if scope is not None else None
+    if address is None:
+        return _global(name)
+    return _local(name, *address)
+
+
+def _compile_statements(
+    statements: List[Value], scope: Optional[Scope], tail: bool
+) -> Code:
+    codes = [compile_node(statement, scope) for statement in statements[:-1]]
+    if statements:
+        codes.append(compile_node(statements[-1], scope, tail))
+    if not codes:
+        return _constant(NIL)
+    if len(codes) == 1:
+        return codes[0]
+
+    def statements_(env, frame):
+        for code in codes:
+            value = code(env, frame)
+        return value
+    return statements_
+
+
+def _compile_scoped(
+    statements: List[Value], scope: Optional[Scope], tail: bool
+) -> Code:
+    """Compiles statements that get their own scope, like those of a block.
+
+    A frame is only made at runtime if the statements `def` something."""
+    block_scope = new_scope(scope, (), statements)
+    if not block_scope:
+        return _compile_statements(statements, scope, tail)
+    code = _compile_statements(statements, block_scope, tail)
+    padding = [UNDEFINED] * len(block_scope)
+
+    def scoped(env, frame):
+        return code(env, [frame, *padding])
+    return scoped
+
+
+def _compile_block(args: Value, scope: Optional[Scope], tail: bool) -> Code:
+    return _compile_scoped([arg.value.car for arg in args], scope, tail)
+
+
+def _compile_if(args: Value, scope: Optional[Scope], tail: bool) -> Code:
+    _assert_arity('if', args, 3)
+    cond, if_true, if_false = (arg.value.car for arg in args)
+    cond = compile_node(cond, scope)
+    if_true = compile_node(if_true, scope, tail)
+    if_false = compile_node(if_false, scope, tail)
+
+    def if_(env, frame):
+        cond_result = cond(env, frame)
+        # Checked inline rather than with `_assert` so that the message is
+        # only formatted on failure.
+        if cond_result.variant != ValueType.BOOLEAN or \
+                not isinstance(cond_result.value, bool):
+            raise RuntimeError(
+                f'Condition returned non-bool value: {cond_result}'
+            )
+        if cond_result.value:
+            return if_true(env, frame)
+        return if_false(env, frame)
+    return if_
+
+
+def _compile_list(args: Value, scope: Optional[Scope], tail: bool) -> Code:
+    codes = [compile_node(arg.value.car, scope) for arg in args]
+    # order of evaluation matters
+    return lambda env, frame: to_list([code(env, frame) for code in codes])
+
+
+def _compile_lambda(args: Value, scope: Optional[Scope], tail: bool) -> Code:
+    _assert_arity('lambda', args, 2)
+    fn_args, body = args
+    fn_args = fn_args.value.car
+    body = body.value.car
+    if fn_args.variant not in (ValueType.CONS, ValueType.NIL) or any(
+        arg.value.car.variant != ValueType.STRING for arg in fn_args
+    ):
+        # Reported when the lambda is created, like any other runtime error.
+        return _error(f'Invalid argument list: {fn_args}')
+    params = [arg.value.car.value for arg in fn_args]
+    _assert(
+        len(set(params)) == len(params),
+        f'Duplicate argument names: {params}',
+    )
+    statements = body_statements(body)
+    fn_scope = new_scope(scope, params, statements)
+    function = Function(
+        args=fn_args,
+        body=body,
+        scope=fn_scope,
+        # the body is in tail position
+        code=_compile_statements(statements, fn_scope, True),
+        arity=len(params),
+        padding=[UNDEFINED] * (len(fn_scope) - len(params)),
+    )
+    # The closure shares the frame it was created in, so it sees later
+    # changes to the variables it captured.
+    return lambda env, frame: Value(ValueType.LAMBDA, Closure(function, frame))
+
+
+def lazy_code(function: Function) -> Code:
+    """Code for `function` that compiles its body the first time it runs, for
+    functions whose code was not kept, like those restored by `snapshot`."""
+    def compile_and_run(env, frame):
+        statements = body_statements(function.body)
+        function.code = _compile_statements(statements, function.scope, True)
+        return function.code(env, frame)
+    return compile_and_run
+
+
+def _compile_set(
+    name: str, args: Value, scope: Optional[Scope], tail: bool
+) -> Code:
+    _assert_arity(name, args, 2)
+    key_node, value_node = args
+    assert key_node.value.car.variant == ValueType.STRING
+    key = key_node.value.car.value
+    value_code = compile_node(value_node.value.car, scope)
+    address = scope.resolve(key) if scope is not None else None
+
+    if address is None:
+        if name == 'def':
+            def def_global(env, frame):
+                value = value_code(env, frame)
+                env.scopes[0][key] = value
+                return value
+            return def_global
+
+        def set_global(env, frame):
+            value = value_code(env, frame)
+            globals_ = env.scopes[0]
+            if key not in globals_:
+                raise _undefined(key)
+            globals_[key] = value
+            return value
+        return set_global
+
+    depth, slot = address
+    check_defined = name == 'set'
+
+    def set_local(env, frame):
+        value = value_code(env, frame)
+        for _ in range(depth):
+            frame = frame[0]
+        if check_defined and frame[slot] is UNDEFINED:
+            raise _undefined(key)
+        frame[slot] = value
+        return value
+    return set_local
+
+
+def _compile_eval(args: Value, scope: Optional[Scope], tail: bool) -> Code:
+    _assert_arity('eval', args, 1)
+    arg, = args
+    arg_code = compile_node(arg.value.car, scope)
+
+    def eval_(env, frame):
+        to_reeval = arg_code(env, frame)
+        quoted = (
+            (to_reeval.variant == ValueType.CONS) and
+            (to_reeval.value.car.variant == ValueType.STRING) and
+            (to_reeval.value.car.value == 'quote')
+        )
+        # Each evaluation removes one layer of quoting, if necessary. The
+        # quoted code is only known now, so it is compiled on the spot, in the
+        # scope of the `eval`. Since the frame here has a fixed size, any new
+        # local `def`s get a scope of their own.
+        if quoted:
+            code = to_reeval.value.cdr.value.car
+            if scope is None:
+                return compile_node(code, None, tail)(env, frame)
+            return _compile_scoped([code], scope, tail)(env, frame)
+        return to_reeval
+    return eval_
+
+
+_KEYWORD_COMPILERS = {
+    'block': _compile_block,
+    'if': _compile_if,
+    'list': _compile_list,
+    'lambda': _compile_lambda,
+    'set': lambda args, scope, tail: _compile_set('set', args, scope, tail),
+    'def': lambda args, scope, tail: _compile_set('def', args, scope, tail),
+    'eval': _compile_eval,
+}
+
+assert KEYWORDS == set(_KEYWORD_COMPILERS.keys())
+
+
+def _compile_builtin(name: str, args: Value, scope: Optional[Scope]) -> Code:
+    handler = builtin_handlers.HANDLERS[name]
+    codes = [compile_node(arg.value.car, scope) for arg in args]
+    if name in builtin_handlers.NEEDS_ENVIRONMENT:
+        return lambda env, frame: handler(
+            [code(env, frame) for code in codes],
+            lambda fn, args: call(env, fn, args),
+            env,
+        )
+    if name in builtin_handlers.CALLS_FUNCTIONS:
+        return lambda env, frame: handler(
+            [code(env, frame) for code in codes],
+            lambda fn, args: call(env, fn, args),
+        )
+    return lambda env, frame: handler([code(env, frame) for code in codes])
+
+
+def call(env: Environment, fn: Value, args: List[Value]) -> Value:
+    while True:
+        if fn.variant != ValueType.LAMBDA:
+            raise RuntimeError(f'Cannot call {fn}')
+        closure = fn.value
+        if closure.__class__ is Memoized:
+            return closure.call(args, lambda fn, args: call(env, fn, args))
+        function = closure.function
+        if len(args) != function.arity:
+            raise RuntimeError(
+                f'{closure} takes {function.arity} argument(s) but got '
+                f'{len(args)}'
+            )
+        result = function.code(env, [closure.frame, *args, *function.padding])
+        if result.__class__ is not TailCall:
+            return result
+        fn = result.fn
+        args = result.args
+
+
+def _compile_application(
+    fn_node: Value, args: Value, scope: Optional[Scope], tail: bool
+) -> Code:
+    fn_code = compile_node(fn_node, scope)
+    codes = [compile_node(arg.value.car, scope) for arg in args]
+
+    # Arguments are evaluated before the function, as in `Environment.eval`.
+    if tail:
+        def tail_apply(env, frame):
+            arg_values = [code(env, frame) for code in codes]
+            return TailCall(fn_code(env, frame), arg_values)
+        return tail_apply
+
+    def apply_(env, frame):
+        arg_values = [code(env, frame) for code in codes]
+        return call(env, fn_code(env, frame), arg_values)
+    return apply_
+
+
+def compile_node(
+    node: Value, scope: Optional[Scope] = None, tail: bool = False
+) -> Code:
+    """Compiles `node` into a closure.
+
+    Variables are resolved lexically against `scope`; a scope of None means
+    the top level, where variables are globals looked up by name. Run the
+    result of compiling a top-level form with a frame of None.
+
+    If `tail` is set, the node is in tail position of a lambda body, and a
+    call made by it is returned as a `TailCall` for `call` to make."""
+    variant = node.variant
+    if variant in (ValueType.NUMBER, ValueType.BOOLEAN, ValueType.NIL):
+        return _constant(node)
+    elif variant == ValueType.STRING:
+        return _variable(node.value, scope)
+    elif variant == ValueType.CONS:
+        fn_node = node.value.car
+        fn_args = node.value.cdr
+
+        if fn_node.value == 'quote':
+            # Quote prevents further evaluation
+            _assert_arity('quote', fn_args, 1)
+            return _constant(node)
+
+        if fn_node.variant == ValueType.STRING:
+            if fn_node.value in KEYWORDS:
+                return _KEYWORD_COMPILERS[fn_node.value](fn_args, scope, tail)
+            if fn_node.value in builtin_handlers.BUILTINS:
+                return _compile_builtin(fn_node.value, fn_args, scope)
+        return _compile_application(fn_node, fn_args, scope, tail)
+    raise RuntimeError(f'Cannot evaluate {node}')
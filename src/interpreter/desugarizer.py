@@ -1,68 +1,92 @@
-import collections
-from typing import Optional, List
-
-import attr
+from typing import Iterable, Iterator, List, Union
 
 from .types import Token, TokenType, TokenTree, ParseError
 
 
-def desugar(tokens: List[Token]) -> List[TokenTree]:
-    if (tokens.count(Token(TokenType.OPEN_PAREN)) != 
-            tokens.count(Token(TokenType.CLOSE_PAREN))):
-        raise ParseError('Unbalanced parentheses')
+def _position(token: Token) -> str:
+    return f'line {token.line}, column {token.column}'
+
+
+_CLOSERS = {
+    TokenType.OPEN_PAREN: TokenType.CLOSE_PAREN,
+    TokenType.OPEN_BRACKET: TokenType.CLOSE_BRACKET,
+}
+_OPENERS = {TokenType.OPEN_PAREN: '(', TokenType.OPEN_BRACKET: '['}
 
-    result = TokenTree()  # actually the value of this will be returned
-    curr = result
-    parents = collections.deque()
-    for token in tokens:
-        if token.variant == TokenType.OPEN_PAREN:
-            parents.append(curr)
-            child = TokenTree()
-            curr.value.append(child)
-            curr = child
-        elif token.variant == TokenType.CLOSE_PAREN:
-            curr = parents.pop()
-        else:
-            curr.value.append(token)
 
-    # traverse result and replace sugar
-    q = collections.deque()
-    q.append(result)
-    while q:
-        # TODO should catch syntax errors here
-        curr = q.pop()
+def desugar_iter(
+    tokens: Iterable[Token]
+) -> Iterator[Union[Token, TokenTree]]:
+    """Builds the tree of each top-level form in a single pass over `tokens`,
+    replacing sugar as each list is closed, and yields each form as soon as
+    it is complete.
 
-        # handle commas
-        if any(isinstance(t, Token) and t.variant == TokenType.THEN
-                for t in curr.value):
-            new_value = []
-            new_value.append(Token(TokenType.STRING, 'block'))
-            for t in curr.value:
-                if isinstance(t, TokenTree) or t.variant != TokenType.THEN:
-                    new_value.append(t)
-            curr.value = new_value
+    Sugar:
+    - `(a, b)` is `(block a b)`
+    - `'x` is `(quote x)`
+    - `[a b]` is `(vector a b)`; commas between its elements are ignored
+    """
+    # the enclosing lists, with the state to restore when they continue
+    parents = []
+    items = []
+    # number of quotes waiting for the next element
+    quotes = 0
+    has_then = False
+    open_paren = None
 
-        # handle quoting
-        if any(isinstance(t, Token) and t.variant == TokenType.QUOTE
-                for t in curr.value):
-            sugar_level = 0
-            new_value = []
-            for t in curr.value:
-                if isinstance(t, Token) and t.variant == TokenType.QUOTE:
-                    sugar_level += 1
-                else:
-                    to_append = t
-                    for _ in range(sugar_level):
-                        to_append = TokenTree(
-                            [Token(TokenType.STRING, 'quote'), to_append]
-                        )
-                    new_value.append(to_append)
-                    sugar_level = 0
-            curr.value = new_value
+    for token in tokens:
+        variant = token.variant
+        if variant == TokenType.OPEN_PAREN or \
+                variant == TokenType.OPEN_BRACKET:
+            parents.append((items, quotes, has_then, open_paren))
+            items = []
+            quotes = 0
+            has_then = False
+            open_paren = token
+            continue
+        elif variant == TokenType.CLOSE_PAREN or \
+                variant == TokenType.CLOSE_BRACKET:
+            if not parents:
+                raise ParseError(f'Unbalanced parentheses at {_position(token)}')
+            if _CLOSERS[open_paren.variant] != variant:
+                raise ParseError(
+                    f'Mismatched brackets at {_position(token)}: opened at '
+                    f'{_position(open_paren)}'
+                )
+            if quotes:
+                raise ParseError(f'Nothing to quote at {_position(token)}')
+            if variant == TokenType.CLOSE_BRACKET:
+                items.insert(0, Token(TokenType.STRING, 'vector'))
+            elif has_then:
+                items.insert(0, Token(TokenType.STRING, 'block'))
+            element = TokenTree(items)
+            items, quotes, has_then, open_paren = parents.pop()
+        elif variant == TokenType.QUOTE:
+            quotes += 1
+            continue
+        elif variant == TokenType.THEN:
+            # Between top-level forms, a comma is just a separator.
+            has_then = True
+            continue
+        else:
+            element = token
+
+        for _ in range(quotes):
+            element = TokenTree([Token(TokenType.STRING, 'quote'), element])
+        quotes = 0
+        if parents:
+            items.append(element)
+        else:
+            yield element
 
-        for tr in curr.value:
-            if isinstance(tr, TokenTree):
-                q.append(tr)
+    if parents:
+        raise ParseError(
+            f'Unbalanced parentheses: unclosed {_OPENERS[open_paren.variant]} '
+            f'at {_position(open_paren)}'
+        )
+    if quotes:
+        raise ParseError('Nothing to quote at end of input')
 
-    return result.value
 
+def desugar(tokens: Iterable[Token]) -> List[Union[Token, TokenTree]]:
+    return list(desugar_iter(tokens))
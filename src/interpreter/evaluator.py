@@ -1,10 +1,13 @@
 import collections
 from itertools import islice
-from typing import Deque, Dict, Any, Tuple, List
+from types import MappingProxyType
+from typing import Deque, Dict, Any, Tuple, List, Mapping
 
 import attr
 
-from .types import ValueType, Value, LambdaValue, Cons, RuntimeError
+from .types import (
+    ValueType, Value, LambdaValue, Captured, Cons, NIL, RuntimeError,
+)
 from . import builtin_handlers
 
 
@@ -21,15 +24,36 @@ def _assert_arity(name, args, count):
 
 
 def to_list(values: List[Value]) -> Value:
-    result = Value(ValueType.NIL)
+    result = NIL
     for v in reversed(values):
-        result = Value(ValueType.CONS, Cons(car=v, cdr=result))
+        result = Cons(v, result)
     return result
 
 
 KEYWORDS = {'block', 'if', 'list', 'lambda', 'set', 'def', 'eval'}
 
 
+class Overlay(dict):
+    """Globals over the frozen globals `base`, which may be shared with other
+    environments. Names not defined in the overlay are read from `base`, and
+    defining or setting a name does it in the overlay, so `base` is never
+    changed."""
+    __slots__ = ('base',)
+
+    def __init__(self, base: Mapping[str, Value]):
+        super().__init__()
+        self.base = base
+
+    def __missing__(self, key: str) -> Value:
+        value = self.base[key]
+        # copied, so that reading it again is a plain dict lookup
+        self[key] = value
+        return value
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or key in self.base
+
+
 @attr.s(auto_attribs=True, slots=True)
 class Environment:
     scopes: Deque[Dict[str, Value]] = attr.ib(factory=collections.deque)
@@ -95,7 +119,7 @@ class Environment:
             # at lambda creation time, no variables bound; body is totally
             # unevaluated
             return Value(ValueType.LAMBDA, LambdaValue(
-                args=fn_args.value.car, body=body.value.car, scope={}
+                args=fn_args.value.car, body=body.value.car,
             ))
         elif name in ('set', 'def'):
             _assert_arity(name, args, 2)
@@ -127,13 +151,13 @@ class Environment:
                 node.value in builtin_handlers.BUILTINS)
 
     def _handle_builtin(self, name: str, args: List[Value]) -> Value:
-        return builtin_handlers.handle(name, args)
+        return builtin_handlers.handle(name, args, self.apply, self)
 
     def begin_toplevel(self):
         self.push_empty_scope()
 
     def eval(self, node: Value) -> Value:
-        if node.variant in {ValueType.NUMBER, ValueType.BOOLEAN}:
+        if node.variant in (ValueType.NUMBER, ValueType.BOOLEAN):
             return node
         elif node.variant == ValueType.STRING:
             return self.lookup(node.value)
@@ -144,7 +168,7 @@ class Environment:
             try:
                 fn_args = next(x)
             except StopIteration:
-                fn_args = Value(ValueType.NIL)
+                fn_args = NIL
 
             if fn_node.value == 'quote':
                 # Quote prevents further evaluation
@@ -162,22 +186,65 @@ class Environment:
             if self._is_builtin(fn_node):
                 return self._handle_builtin(fn_node.value, args)
             else:
-                fn = self.eval(fn_node)
-                fn_scope = fn.value.scope
-                arg_scope = {
-                    k.value.car.value: v for k, v in zip(fn.value.args, args)
-                }
-                self.push_scope(fn_scope)
-                self.push_scope(arg_scope)
-                return_value = self.eval(fn.value.body)
-                # Set new scope on function
-                updated_arg_scope = self.pop_scope()
-                updated_fn_scope = self.pop_scope()
-                if return_value.variant == ValueType.LAMBDA:
-                    # need to merge here. order matters
-                    return_value_scope = updated_fn_scope.copy()
-                    return_value_scope.update(updated_arg_scope)
-                    return_value.value.scope = return_value_scope
-                fn.value.scope = updated_fn_scope
-                return return_value
-
+                return self.apply(self.eval(fn_node), args)
+
+    def apply(self, fn: Value, args: List[Value]) -> Value:
+        if fn.value.__class__ is builtin_handlers.Memoized:
+            return fn.value.call(args, self.apply)
+        captured = fn.value.scope
+        arg_scope = {
+            k.value.car.value: v for k, v in zip(fn.value.args, args)
+        }
+        # The captured scopes go under the arguments, outermost first. They
+        # are pushed as they are, so `set`s of captured variables are seen by
+        # every closure that shares them.
+        depth = len(self.scopes)
+        if captured is not None:
+            chain = []
+            while captured is not None:
+                chain.append(captured.variables)
+                captured = captured.parent
+            for variables in reversed(chain):
+                self.push_scope(variables)
+        self.push_scope(arg_scope)
+        return_value = self.eval(fn.value.body)
+        while len(self.scopes) > depth:
+            self.pop_scope()
+        if return_value.variant == ValueType.LAMBDA and \
+                return_value.value.__class__ is LambdaValue and \
+                return_value.value.scope is None:
+            # A lambda that hasn't captured anything yet captures the
+            # arguments of this call and what the function had captured. It
+            # is a new lambda, since the one returned may be shared, e.g. by
+            # a Prelude.
+            lambda_ = return_value.value
+            return_value = Value(ValueType.LAMBDA, LambdaValue(
+                args=lambda_.args, body=lambda_.body,
+                scope=Captured(arg_scope, fn.value.scope),
+            ))
+        return return_value
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class Prelude:
+    """Globals, e.g. from builtins.lisp, that are loaded once and shared by
+    many environments, possibly in different threads. Each environment gets
+    an Overlay of its own for its definitions."""
+    globals: Mapping[str, Value]
+
+    @staticmethod
+    def freeze(env: Environment) -> 'Prelude':
+        """The globals of `env`. Their values are shared, not copied, so
+        lists and vectors in them shouldn't be changed afterwards. If `env`
+        was made from a Prelude, the result has its globals too."""
+        globals_ = env.scopes[0]
+        merged = {}
+        if isinstance(globals_, Overlay):
+            merged.update(globals_.base)
+        merged.update(globals_)
+        return Prelude(MappingProxyType(merged))
+
+    def environment(self) -> Environment:
+        env = Environment()
+        env.push_scope(Overlay(self.globals))
+        return env
@@ -0,0 +1,168 @@
+"""Counting what the tree-walker, `Environment.eval`, does, and limiting it.
+
+An `InstrumentedEnvironment` counts the nodes it evaluates, the lambdas and
+builtins it calls, the cons cells made, and the deepest its scopes get, in
+`counters`. Once one of them, or the time spent evaluating, goes over its
+`limits`, it raises `LimitExceeded`. Whatever a top-level form raises, the
+scopes of the calls it was in are dropped, so the environment can still be
+used afterwards.
+
+Lisp code can read the counters with `(eval_counters)`, which gives the list
+(nodes calls conses max_depth).
+
+The timeout is only checked between the evaluations of nodes, every
+CLOCK_INTERVAL of them, so a call of a builtin that does a lot of work by
+itself, like `sort`, `range` or `pmap` on a large list, can run past it;
+it is caught once evaluation goes on after the call. Builtins that call
+lambdas, like `map`, evaluate their bodies here, so are stopped in time.
+The cells a builtin makes are counted after it returns, but those that build
+a list of a size known from their arguments, like `range`, are stopped
+before they start if it would go over the limit.
+
+Like profiling, this only works with the 'tree' engine, since the other
+engines don't go through `eval`."""
+import time
+from typing import Dict, List, Optional
+
+import attr
+
+from . import builtin_handlers
+from .evaluator import Environment
+from .types import Value, RuntimeError
+
+
+# how many nodes are evaluated between readings of the clock for the timeout
+CLOCK_INTERVAL = 256
+
+
+class LimitExceeded(RuntimeError):
+    pass
+
+
+@attr.s(auto_attribs=True, slots=True)
+class Limits:
+    # None for no limit
+    steps: Optional[int] = None
+    depth: Optional[int] = None
+    allocations: Optional[int] = None
+    # in seconds; checked between nodes, not during calls of builtins
+    timeout: Optional[float] = None
+
+
+@attr.s(auto_attribs=True, slots=True)
+class Counters:
+    nodes: int = 0
+    calls: int = 0
+    conses: int = 0
+    max_depth: int = 0
+    # time spent evaluating, in seconds
+    seconds: float = 0.0
+
+
+@attr.s(auto_attribs=True, slots=True)
+class InstrumentedEnvironment(Environment):
+    """An Environment that keeps `counters` of what `eval` does, and stops it
+    at its `limits`. The limits are on the counters since they were last
+    `reset`."""
+    limits: Limits = attr.ib(factory=Limits)
+    counters: Counters = attr.ib(factory=Counters)
+    # when the timeout runs out, by time.monotonic, while evaluating
+    _deadline: Optional[float] = None
+    # whether a top-level form is being evaluated
+    _running: bool = False
+
+    def reset(self):
+        self.counters = Counters()
+
+    def eval(self, node: Value) -> Value:
+        if not self._running:
+            return self._eval_toplevel(node)
+        counters = self.counters
+        counters.nodes += 1
+        limit = self.limits.steps
+        if limit is not None and counters.nodes > limit:
+            raise LimitExceeded(f'Evaluated more than {limit} nodes')
+        if self._deadline is not None and \
+                not counters.nodes % CLOCK_INTERVAL and \
+                time.monotonic() > self._deadline:
+            raise LimitExceeded(
+                f'Ran for more than {self.limits.timeout} seconds'
+            )
+        return super().eval(node)
+
+    def _eval_toplevel(self, node: Value) -> Value:
+        depth = len(self.scopes)
+        start = time.monotonic()
+        if self.limits.timeout is not None:
+            self._deadline = start + self.limits.timeout - \
+                self.counters.seconds
+        self._running = True
+        try:
+            return self.eval(node)
+        except RecursionError:
+            # The tree-walker recurses in Python for each call, so deep
+            # recursion in Lisp runs out of Python's stack first.
+            raise LimitExceeded('Recursed too deeply for the Python stack') \
+                from None
+        finally:
+            self._running = False
+            self._deadline = None
+            self.counters.seconds += time.monotonic() - start
+            # the scopes of calls that didn't return
+            while len(self.scopes) > depth:
+                self.scopes.pop()
+
+    def push_scope(self, contents: Dict[str, Value]) -> None:
+        super().push_scope(contents)
+        depth = len(self.scopes)
+        if depth > self.counters.max_depth:
+            self.counters.max_depth = depth
+        limit = self.limits.depth
+        if limit is not None and depth > limit:
+            raise LimitExceeded(f'Scopes nested more than {limit} deep')
+
+    def _allocated(self, count: int):
+        self.counters.conses += count
+        limit = self.limits.allocations
+        if limit is not None and self.counters.conses > limit:
+            raise LimitExceeded(f'Made more than {limit} cons cells')
+
+    def _allocating(self, count: int):
+        # before making `count` cells, which are counted once they are made
+        limit = self.limits.allocations
+        if limit is not None and self.counters.conses + count > limit:
+            raise LimitExceeded(f'Would make more than {limit} cons cells')
+
+    def _handle_keyword(self, name: str, args) -> Value:
+        result = super()._handle_keyword(name, args)
+        if name == 'list':
+            self._allocated(
+                builtin_handlers.ALLOCATIONS['list'](args, result)
+            )
+        return result
+
+    def _handle_builtin(self, name: str, args: List[Value]) -> Value:
+        self.counters.calls += 1
+        if name == 'eval_counters':
+            if args:
+                raise RuntimeError('eval_counters takes no arguments')
+            counters = self.counters
+            return Value.list_to_cons([
+                Value.number(n) for n in (
+                    counters.nodes, counters.calls, counters.conses,
+                    counters.max_depth,
+                )
+            ])
+        if self.limits.allocations is not None:
+            ahead = builtin_handlers.ALLOCATIONS_AHEAD.get(name)
+            if ahead is not None:
+                self._allocating(ahead(args))
+        result = super()._handle_builtin(name, args)
+        allocations = builtin_handlers.ALLOCATIONS.get(name)
+        if allocations is not None:
+            self._allocated(allocations(args, result))
+        return result
+
+    def apply(self, fn: Value, args: List[Value]) -> Value:
+        self.counters.calls += 1
+        return super().apply(fn, args)
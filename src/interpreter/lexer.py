@@ -1,5 +1,6 @@
+import re
 import string
-from typing import Optional, List
+from typing import Iterable, Iterator, Optional, List
 
 import attr
 
@@ -8,30 +9,58 @@ from .types import Token, TokenType
 
 atomic_characters = set(string.ascii_letters + string.digits + '_.')
 
-operator_characters = '+-*/%^&<>=|'
+operator_characters = '+-*/%^&<>=|!'
 
 
-syntactic_tokens = {
-    '(': Token(TokenType.OPEN_PAREN),
-    ')': Token(TokenType.CLOSE_PAREN),
-    '\'': Token(TokenType.QUOTE),
-    ',': Token(TokenType.THEN),
+syntactic_types = {
+    '(': TokenType.OPEN_PAREN,
+    ')': TokenType.CLOSE_PAREN,
+    '[': TokenType.OPEN_BRACKET,
+    ']': TokenType.CLOSE_BRACKET,
+    '\'': TokenType.QUOTE,
+    ',': TokenType.THEN,
 }
 
 
+# An atom is a run of atomic and operator characters. Whitespace, comments
+# (from ';' to the end of the line) and any other characters separate tokens;
+# each match skips them, then takes one token.
+_atom_class = re.escape(''.join(sorted(atomic_characters)) + operator_characters)
+_TOKEN_RE = re.compile(
+    r'(?:[^' + _atom_class + r'()\[\]\',;]+|;[^\n]*)*'
+    r'(?:(?P<atom>[' + _atom_class + r']+)|(?P<syntax>[()\[\]\',]))?'
+)
+
+_OPERATOR_RE = re.compile('[' + re.escape(operator_characters) + ']+')
+
+_INT_RE = re.compile(r'[+-]?[0-9][0-9_]*')
+
+# Words that Python's float() accepts, so they have to go through _number.
+_FLOAT_WORDS = {'inf', 'infinity', 'nan'}
+
+
 @attr.s(auto_attribs=True, slots=True, frozen=True)
 class InvalidToken(Exception):
     value: str
     char: int = -1
+    line: int = 0
+    column: int = 0
 
 
 def _operator(s: str):
-    if not all(c in operator_characters for c in s):
+    if _OPERATOR_RE.fullmatch(s) is None:
         return None
     return s
 
 
 def _number(s: str):
+    # Checked first, since raising and catching the ValueError from int() is
+    # slow for the common case of floats.
+    if _INT_RE.fullmatch(s) is None:
+        try:
+            return float(s)
+        except ValueError:
+            return None
     try:
         return int(s)
     except ValueError:
@@ -41,57 +70,95 @@ def _number(s: str):
             return None
 
 
-def _token_from_state(state: str) -> Optional[Token]:
+def _token_from_state(
+    state: str, line: int = 0, column: int = 0
+) -> Optional[Token]:
     if state == '':
         return None
+    first = state[0]
+    # Most atoms are names, which can skip the number parsing.
+    if (first.isalpha() or first == '_') and \
+            state.lower() not in _FLOAT_WORDS:
+        return Token(TokenType.STRING, state, line, column)
     operator_value = _operator(state)
     if operator_value is not None:
-        return Token(TokenType.OPERATOR, operator_value)
+        return Token(TokenType.OPERATOR, operator_value, line, column)
     number_value = _number(state)
     if number_value is not None:
-        return Token(TokenType.NUMBER, number_value)
+        return Token(TokenType.NUMBER, number_value, line, column)
     else:
         if state[0].isnumeric():
             raise InvalidToken(state)
-        return Token(TokenType.STRING, state)
+        return Token(TokenType.STRING, state, line, column)
+
+
+def tokenize_chunks(chunks: Iterable[str]) -> Iterator[Token]:
+    """Lazily yields the tokens of the source text made up of `chunks`, with
+    their line and column (both starting at 1).
+
+    Tokens and comments may be split across chunks, so only the unfinished
+    end of one chunk is kept around while reading the next."""
+    line = 1
+    # index in `buffer` of the first character of the current line; negative
+    # if the line started in an earlier chunk
+    line_start = 0
+    # index in the whole source of the start of `buffer`
+    offset = 0
+    buffer = ''
+    chunks = iter(chunks)
+    done = False
+    while not done:
+        chunk = next(chunks, None)
+        if chunk is None:
+            done = True
+        else:
+            buffer += chunk
+        end = len(buffer)
+        consumed = end
+        # index up to which newlines have been counted
+        counted = 0
+        for match in _TOKEN_RE.finditer(buffer):
+            if not done and match.end() == end:
+                # The last token or comment may continue in the next chunk.
+                consumed = match.start()
+                break
+            kind = match.lastgroup
+            if kind is None:
+                # only separators were left
+                continue
+            start = match.start(kind)
+            newlines = buffer.count('\n', counted, start)
+            if newlines:
+                line += newlines
+                line_start = buffer.rfind('\n', counted, start) + 1
+            counted = start
+            column = start - line_start + 1
+            if kind == 'syntax':
+                yield Token(
+                    syntactic_types[match.group(kind)], None, line, column,
+                )
+                continue
+            try:
+                yield _token_from_state(match.group(kind), line, column)
+            except InvalidToken as e:
+                raise InvalidToken(
+                    e.value, offset + start, line, column,
+                ) from e
+
+        newlines = buffer.count('\n', counted, consumed)
+        if newlines:
+            line += newlines
+            line_start = buffer.rfind('\n', counted, consumed) + 1
+        buffer = buffer[consumed:]
+        line_start -= consumed
+        offset += consumed
+
+
+def tokenize(s: str) -> Iterator[Token]:
+    """Lazily yields the tokens of `s`, with their line and column (both
+    starting at 1)."""
+    return tokenize_chunks((s,))
 
 
 def lex(s: str) -> List[Token]:
-    i = 0
-    result = []
-
-    state = ''
-    in_number = False
-    for i, c in enumerate(s):
-        # The operator is continuing
-        if c in operator_characters:
-            state = state + c
-            continue
-
-        # The token is continuing
-        if c in atomic_characters:
-            state = state + c
-            continue
-
-        # Wrap up the current token
-        finished_token = _token_from_state(state)
-
-        if finished_token:
-            result.append(finished_token)
-            state = ''
-
-        # syntactic tokens
-        token = syntactic_tokens.get(c, None)
-        if token:
-            result.append(token)
-            continue
-
-    # Wrap up the current token
-    try:
-        finished_token = _token_from_state(state)
-    except InvalidToken as e:
-        raise InvalidToken(e.value, char=i) from e
-    if finished_token:
-        result.append(finished_token)
-
-    return result
+    return list(tokenize(s))
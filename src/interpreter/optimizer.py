@@ -0,0 +1,445 @@
+"""A pass over parsed forms, run between `parser.parse` and evaluation, that
+does at parse time what would otherwise be done every time they run:
+
+- calls of pure builtins on literal numbers and booleans, such as `(+ 1 2)`
+  or `(< 1 2)`, are replaced by their results;
+- `if`s whose condition is a literal boolean are replaced by the branch it
+  picks;
+- blocks directly inside other blocks are spliced into them, when they
+  don't `def` anything and so need no scope of their own.
+
+Forms are never changed in place; a form that changes is rebuilt, and one
+that doesn't is returned as it is. A fold that would fail, e.g. a division
+by zero, is left for evaluation, so that it fails when and if it runs.
+
+`Inliner` replaces calls of small functions with their bodies; unlike
+`optimize`, it needs the whole program at once, and is opt-in."""
+import collections
+from typing import Dict, List, Optional, Set, Tuple
+
+import attr
+
+from . import builtin_handlers
+from .evaluator import KEYWORDS
+from .types import Value, ValueType, Cons, NIL
+
+
+# Builtins without side effects whose results are literals, so can be
+# computed once from literal arguments.
+FOLDABLE = {
+    '+', '-', '/', '//', '*', '%', '**', 'abs',
+    '=', '!=', '&&', '||', '!', '<', '>', '<=', '>=',
+}
+
+# powers with larger exponents are left for evaluation, since their results
+# can take long to compute and be huge
+MAX_EXPONENT = 64
+
+_LITERALS = (ValueType.NUMBER, ValueType.BOOLEAN)
+
+# Forms through which a block's statements can define names in its scope.
+# Those inside lambdas, quotes and nested blocks don't.
+_DEFINES = {'def', 'eval'}
+_OWN_SCOPE = {'lambda', 'quote', 'block'}
+
+
+def _list(items: List[Value]) -> Value:
+    result = NIL
+    for item in reversed(items):
+        result = Cons(item, result)
+    return result
+
+
+def _head(node: Value):
+    """The name at the head of an application, or None."""
+    if node.variant != ValueType.CONS:
+        return None
+    head = node.value.car
+    return head.value if head.variant == ValueType.STRING else None
+
+
+def _defines(node: Value) -> bool:
+    """Whether evaluating `node` could define a name in the scope it is
+    evaluated in."""
+    if node.variant != ValueType.CONS:
+        return False
+    head = _head(node)
+    if head in _DEFINES:
+        return True
+    if head in _OWN_SCOPE:
+        return False
+    return any(_defines(cons.value.car) for cons in node)
+
+
+def _fold(name: str, args: List[Value]):
+    """The result of the builtin `name` on `args`, or None if it is left for
+    evaluation."""
+    if name == '**' and len(args) == 2 and \
+            abs(args[1].value) > MAX_EXPONENT:
+        return None
+    try:
+        result = builtin_handlers.handle(name, args)
+    except Exception:
+        return None
+    return result if result.variant in _LITERALS else None
+
+
+def _flatten(statements: List[Value]) -> List[Value]:
+    """`statements`, with the statements of the blocks among them that don't
+    define anything in their place."""
+    flattened = []
+    for statement in statements:
+        if _head(statement) == 'block' and \
+                statement.value.cdr.variant == ValueType.CONS and \
+                not any(_defines(s.value.car) for s in statement.value.cdr):
+            flattened.extend(s.value.car for s in statement.value.cdr)
+        else:
+            flattened.append(statement)
+    return flattened
+
+
+def optimize(node: Value) -> Value:
+    """`node`, with constants folded, dead branches removed and blocks
+    flattened."""
+    if node.variant != ValueType.CONS:
+        return node
+    head = _head(node)
+    if head == 'quote':
+        return node
+    items = [cons.value.car for cons in node]
+
+    if head == 'lambda':
+        # only the body is evaluated
+        if len(items) != 3:
+            return node
+        body = optimize(items[2])
+        if body is items[2]:
+            return node
+        return _list([items[0], items[1], body])
+    if head in ('def', 'set'):
+        if len(items) != 3:
+            return node
+        value = optimize(items[2])
+        if value is items[2]:
+            return node
+        return _list([items[0], items[1], value])
+
+    optimized = [optimize(item) for item in items]
+    if head == 'block':
+        optimized = [optimized[0], *_flatten(optimized[1:])]
+    changed = len(optimized) != len(items) or \
+        any(a is not b for a, b in zip(optimized, items))
+
+    if head == 'if' and len(items) == 4:
+        cond = optimized[1]
+        if cond.variant == ValueType.BOOLEAN:
+            return optimized[2] if cond.value else optimized[3]
+    elif head in FOLDABLE and \
+            all(arg.variant in _LITERALS for arg in optimized[1:]):
+        result = _fold(head, optimized[1:])
+        if result is not None:
+            return result
+
+    return _list(optimized) if changed else node
+
+
+# Builtins that change their arguments or depend on state other than them,
+# so that their calls can't be moved.
+EFFECTS = {
+    'set_car', 'set_cdr', 'vector_set', 'vector_push', 'hashmap_put',
+    'hashmap_delete', 'memoize', 'memo_hits', 'memo_misses', 'memo_size',
+    'memo_clear', 'eval_counters',
+}
+
+# names whose calls never go to a variable of the same name
+_RESERVED = builtin_handlers.BUILTINS | KEYWORDS | {'quote'}
+
+# the largest body, in atoms, that `Inliner` inlines by default
+INLINE_SIZE = 24
+
+
+def _size(node: Value) -> int:
+    if node.variant != ValueType.CONS:
+        return 1
+    return sum(_size(cons.value.car) for cons in node)
+
+
+def _symbols(node: Value, result: Set[str]) -> Set[str]:
+    """Adds the names of all the symbols in `node` to `result`."""
+    if node.variant == ValueType.STRING:
+        result.add(node.value)
+    elif node.variant == ValueType.CONS:
+        for cons in node:
+            _symbols(cons.value.car, result)
+    return result
+
+
+def _pure(node: Value) -> bool:
+    """Whether evaluating `node` has no effects, so that it can be moved
+    around the evaluation of other forms: whether it only has literals,
+    variables, `if`s, `list`s and calls of builtins that don't call
+    functions or change anything."""
+    if node.variant != ValueType.CONS:
+        return True
+    head = _head(node)
+    if head == 'if':
+        if len(node) != 4:
+            return False
+    elif head != 'list' and (
+        head in KEYWORDS or head not in builtin_handlers.BUILTINS or
+        head in EFFECTS or head in builtin_handlers.CALLS_FUNCTIONS
+    ):
+        return False
+    return all(_pure(cons.value.car) for cons in node.value.cdr)
+
+
+def _simple(node: Value) -> bool:
+    """Whether `node` only has literals, variables and calls of `FOLDABLE`
+    builtins, so that evaluating it more than once, or in a different order,
+    only costs time."""
+    if node.variant != ValueType.CONS:
+        return node.variant in _LITERALS or node.variant == ValueType.STRING
+    return _head(node) in FOLDABLE and \
+        all(_simple(cons.value.car) for cons in node.value.cdr)
+
+
+def _uses(node: Value, params: Set[str], conditional: bool,
+          result: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """Adds the uses of `params` in the pure form `node` to `result`, in the
+    order they are evaluated, with whether they are only evaluated in some
+    branches of an `if`."""
+    if node.variant == ValueType.STRING:
+        if node.value in params:
+            result.append((node.value, conditional))
+    elif node.variant == ValueType.CONS:
+        args = [cons.value.car for cons in node.value.cdr]
+        if _head(node) == 'if':
+            _uses(args[0], params, conditional, result)
+            args = args[1:]
+            conditional = True
+        for arg in args:
+            _uses(arg, params, conditional, result)
+    return result
+
+
+def _leading(node: Value, params: Set[str], result: List[str]) -> bool:
+    """Adds the uses of `params` that the pure form `node` evaluates before
+    anything else, such as reading another variable or calling a builtin, to
+    `result`. Returns whether it only evaluates those."""
+    if node.variant == ValueType.STRING:
+        if node.value not in params:
+            return False
+        result.append(node.value)
+        return True
+    if node.variant != ValueType.CONS:
+        return True
+    args = [cons.value.car for cons in node.value.cdr]
+    if _head(node) == 'if':
+        # then the condition is checked, and a branch picked
+        args = args[:1]
+    for arg in args:
+        if not _leading(arg, params, result):
+            return False
+    # then the builtin is called
+    return False
+
+
+def _substitute(node: Value, bindings: Dict[str, Value]) -> Value:
+    if node.variant == ValueType.STRING:
+        return bindings.get(node.value, node)
+    if node.variant != ValueType.CONS:
+        return node
+    return _list([node.value.car, *(
+        _substitute(cons.value.car, bindings) for cons in node.value.cdr
+    )])
+
+
+def _names(node: Value, defined: collections.Counter, set_: Set[str],
+           params: Set[str]) -> None:
+    """Collects the names `def`'d, `set` and bound by lambdas in `node`,
+    including in quoted forms, which may be `eval`'d."""
+    if node.variant != ValueType.CONS:
+        return
+    head = _head(node)
+    items = [cons.value.car for cons in node]
+    if len(items) > 1 and items[1].variant == ValueType.STRING:
+        if head == 'def':
+            defined[items[1].value] += 1
+        elif head == 'set':
+            set_.add(items[1].value)
+    if head == 'lambda' and len(items) > 1 and \
+            items[1].variant == ValueType.CONS:
+        _symbols(items[1], params)
+    for item in items:
+        _names(item, defined, set_, params)
+
+
+def _definition(node: Value) -> Optional[Tuple[str, Value]]:
+    """The name and lambda of a top-level `(def name (lambda ...))`."""
+    if _head(node) != 'def' or len(node) != 3:
+        return None
+    _, name, value = (cons.value.car for cons in node)
+    if name.variant != ValueType.STRING or _head(value) != 'lambda' or \
+            len(value) != 3:
+        return None
+    return name.value, value
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class _Template:
+    """The body of an inlinable function, and what is needed to decide
+    whether a call of it can be inlined."""
+    params: List[str]
+    body: Value
+    # the names of variables in the body other than the parameters
+    free: Set[str]
+    uses: List[Tuple[str, bool]]
+    # the parameters the body reads before it does anything else
+    leading: List[str]
+
+    def expand(self, args: List[Value], bound: Set[str], max_size: int) \
+            -> Optional[Value]:
+        """The body with `args` in place of the parameters, or None if that
+        wouldn't do what the call does."""
+        if self.free & bound:
+            # a variable of the body would be a local of the caller
+            return None
+        bindings = dict(zip(self.params, args))
+        evaluated = [p for p in self.params
+                     if bindings[p].variant not in _LITERALS]
+        uses = [(name, conditional) for name, conditional in self.uses
+                if name in evaluated]
+        if all(_simple(bindings[p]) for p in evaluated):
+            # These can be evaluated any number of times and in any order,
+            # but must still be evaluated, in case they fail.
+            unconditional = {name for name, conditional in uses
+                             if not conditional}
+            if unconditional != set(evaluated):
+                return None
+            expanded = _substitute(self.body, bindings)
+            copied = len(uses) > len(evaluated) and any(
+                bindings[p].variant != ValueType.STRING for p in evaluated
+            )
+            if copied and _size(expanded) > max_size:
+                return None
+            return expanded
+        # Otherwise each must be evaluated once, in order, as by the call,
+        # and before the body does anything that could see their effects or
+        # fail.
+        if [name for name, _ in uses] != evaluated or \
+                any(conditional for _, conditional in uses):
+            return None
+        leading = [name for name in self.leading if name in evaluated]
+        if leading[:len(evaluated)] != evaluated:
+            return None
+        return _substitute(self.body, bindings)
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Inliner:
+    """Replaces calls of small functions with their bodies, with the
+    arguments in place of the parameters, saving the cost of the call.
+
+    The functions inlined are lambdas `def`'d at the top level, never
+    `def`'d again, `set` or used as parameters, whose bodies are at most
+    `max_size` atoms and only use literals, variables, `if`, `list` and
+    builtins without effects (see `_pure`). Calls of them in the top-level
+    forms after their definitions are inlined, including in later
+    functions, which are inlined in turn with what they inlined. Recursive
+    functions are not inlined.
+
+    A call is only inlined if its arguments are evaluated as they would be
+    by the call (see `_Template.expand`). When none of them has effects,
+    they may be evaluated in another order, so that if more than one of
+    them, or the body, fails, a different error may be raised.
+
+    `inlined` counts the calls of each function that were inlined."""
+    max_size: int = INLINE_SIZE
+    inlined: collections.Counter = attr.ib(factory=collections.Counter)
+
+    def inline(self, nodes: List[Value]) -> List[Value]:
+        defined = collections.Counter()
+        set_ = set()
+        params = set()
+        for node in nodes:
+            _names(node, defined, set_, params)
+
+        templates = {}
+        result = []
+        for node in nodes:
+            # The names the form binds. Those it `def`s may be local to a
+            # block or lambda in it, and the rest are globals either way.
+            here = collections.Counter()
+            bound = set()
+            _names(node, here, set(), bound)
+            bound.update(here)
+            node = self._inline(node, templates, bound)
+            definition = _definition(node)
+            if definition is not None:
+                name, lambda_ = definition
+                # Calls of builtins and keywords go to them even if their
+                # names are defined as variables.
+                if defined[name] == 1 and name not in set_ and \
+                        name not in params and name not in _RESERVED:
+                    template = self._template(name, lambda_)
+                    if template is not None:
+                        templates[name] = template
+            result.append(node)
+        return result
+
+    def _template(self, name: str, lambda_: Value) -> Optional[_Template]:
+        _, params, body = (cons.value.car for cons in lambda_)
+        if params.variant not in (ValueType.CONS, ValueType.NIL):
+            return None
+        if any(param.value.car.variant != ValueType.STRING
+               for param in params):
+            return None
+        names = [param.value.car.value for param in params]
+        if len(set(names)) != len(names) or _size(body) > self.max_size or \
+                not _pure(body):
+            return None
+        free = _symbols(body, set()) - set(names)
+        if name in free:
+            return None
+        params = set(names)
+        leading = []
+        _leading(body, params, leading)
+        return _Template(
+            names, body, free, _uses(body, params, False, []), leading,
+        )
+
+    def _inline(self, node: Value, templates: Dict[str, _Template],
+                bound: Set[str]) -> Value:
+        if node.variant != ValueType.CONS:
+            return node
+        head = _head(node)
+        if head == 'quote':
+            return node
+        items = [cons.value.car for cons in node]
+        if head in ('lambda', 'def', 'set'):
+            # only the last item is evaluated
+            if len(items) != 3:
+                return node
+            last = self._inline(items[2], templates, bound)
+            if last is items[2]:
+                return node
+            return _list([items[0], items[1], last])
+
+        inlined = [self._inline(item, templates, bound) for item in items]
+        template = templates.get(head)
+        if template is not None and len(inlined) - 1 == len(template.params):
+            expanded = template.expand(
+                inlined[1:], bound, self.max_size,
+            )
+            if expanded is not None:
+                self.inlined[head] += 1
+                return expanded
+        if any(a is not b for a, b in zip(inlined, items)):
+            return _list(inlined)
+        return node
+
+    def report(self) -> str:
+        lines = [f'{"function":<24} {"calls inlined":>13}']
+        for name, count in self.inlined.most_common():
+            lines.append(f'{name:<24} {count:>13}')
+        return '\n'.join(lines)
@@ -0,0 +1,122 @@
+"""`pmap`, which calls a function on the elements of a list in a pool of
+worker processes.
+
+The function is sent to the workers as a snapshot (see snapshot.py) of it and
+of the scopes it runs in, which hold the globals it may use, and the elements
+are sent in chunks, also as snapshots. Each worker restores the function once
+per `pmap`, for all the chunks it gets. Whatever the function changes in the
+workers, such as variables it `set`s or lists it changes, isn't seen by the
+caller.
+
+The pool is made the first time it is needed, and kept for later calls."""
+import collections
+import itertools
+import multiprocessing
+import os
+from typing import Callable, List, Optional
+
+from . import builtin_handlers, compiler, pipeline, snapshot, vm
+from .evaluator import Environment
+from .types import Value, LambdaValue, RuntimeError
+
+
+# the number of worker processes; None for one per CPU
+PROCESSES: Optional[int] = None
+
+# the number of chunks each worker gets, when the chunk size isn't given
+CHUNKS_PER_PROCESS = 4
+
+_pool = None
+
+# identifies the function of each `pmap`, so that workers know when to
+# restore a new one
+_calls = itertools.count()
+
+# in a worker, (key, environment, function, engine) for the last function
+# restored
+_function = None
+
+
+def _processes() -> int:
+    return PROCESSES or os.cpu_count() or 1
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(_processes())
+    return _pool
+
+
+def shutdown():
+    """Stops the worker processes, if there are any."""
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def _engine(fn: Value) -> str:
+    value = fn.value
+    if value.__class__ is builtin_handlers.Memoized:
+        return _engine(value.fn)
+    elif value.__class__ is compiler.Closure:
+        return 'closure'
+    elif value.__class__ is vm.Closure:
+        return 'vm'
+    elif value.__class__ is LambdaValue:
+        return 'tree'
+    raise RuntimeError(f'Cannot call {fn}')
+
+
+def _run_chunk(task) -> bytes:
+    global _function
+    key, function, chunk = task
+    if _function is None or _function[0] != key:
+        scopes, fn = snapshot.loads_object(function)
+        env = Environment(collections.deque(scopes))
+        _function = (key, env, fn, _engine(fn))
+    _, env, fn, engine = _function
+    return snapshot.dumps_object([
+        pipeline.call(env, fn, [item], engine)
+        for item in snapshot.loads_object(chunk)
+    ])
+
+
+def pmap(
+    env: Environment,
+    fn: Value,
+    items: List[Value],
+    call: Callable[[Value, List[Value]], Value],
+    chunk_size: Optional[int] = None,
+) -> List[Value]:
+    """The results of calling `fn` on each of `items`, in order. `call` runs
+    it here instead, when there is only one chunk, or in a worker, which
+    can't start workers of its own."""
+    _engine(fn)
+    processes = _processes()
+    if chunk_size is None:
+        chunks = processes * CHUNKS_PER_PROCESS
+        chunk_size = max(1, -(-len(items) // chunks))
+    if chunk_size < 1:
+        raise RuntimeError(f'Chunk size must be positive, not {chunk_size}')
+    if processes == 1 or len(items) <= chunk_size or \
+            multiprocessing.current_process().daemon:
+        return [call(fn, [item]) for item in items]
+
+    try:
+        function = snapshot.dumps_object((list(env.scopes), fn))
+        chunks = [
+            snapshot.dumps_object(items[i:i + chunk_size])
+            for i in range(0, len(items), chunk_size)
+        ]
+    except snapshot.SnapshotError as e:
+        raise RuntimeError(f'pmap cannot send {fn} to workers: {e}') from e
+    key = (os.getpid(), next(_calls))
+    results = []
+    for chunk in _get_pool().imap(
+        _run_chunk, [(key, function, chunk) for chunk in chunks],
+    ):
+        results.extend(snapshot.loads_object(chunk))
+    return results
@@ -3,19 +3,27 @@ from typing import Optional, Deque, List, Any
 
 import attr
 
-from .types import Token, TokenType, Value, ValueType, TokenTree, ParseError
+from .types import (
+    Token, TokenType, Value, TokenTree, Cons, NIL, ParseError,
+)
+
+
+_BOOLEANS = {'true': Value.boolean(True), 'false': Value.boolean(False)}
 
 
 def parse(token) -> Value:
     if isinstance(token, TokenTree):
-        return Value.list_to_cons([parse(elem) for elem in token.value])
+        # Built back to front, so that every cell is made once with both of
+        # its fields.
+        result = NIL
+        for elem in reversed(token.value):
+            result = Cons(parse(elem), result)
+        return result
     elif isinstance(token, Token):
         if token.variant == TokenType.NUMBER:
-            return Value(ValueType.NUMBER, token.value)
-        elif token.variant == TokenType.STRING and token.value in {
-            'true', 'false'
-        }:
-            return Value(ValueType.BOOLEAN, token.value == 'true')
+            return Value.number(token.value)
+        elif token.variant == TokenType.STRING and token.value in _BOOLEANS:
+            return _BOOLEANS[token.value]
         elif token.variant in (TokenType.STRING, TokenType.OPERATOR):
-            return Value(ValueType.STRING, token.value)
+            return Value.symbol(token.value)
     raise ParseError(f'Could not parse value: {token}')
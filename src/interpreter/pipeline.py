@@ -1,12 +1,99 @@
-import itertools
+from interpreter import lexer, desugarizer, parser, compiler, optimizer
+from interpreter.types import NIL, ValueType, RuntimeError
 
-from interpreter import lexer, desugarizer, parser, preprocessor
 
+def _run_vm(env, node):
+    # The VM and the disk cache are imported when they are first used, so
+    # that running a script with the default engine doesn't pay for them.
+    from interpreter import bytecode, vm
+    return vm.execute(env, bytecode.compile_toplevel(node))
 
-def run_code(env, code):
-    code = preprocessor.remove_comments(code)
-    lexed = desugarizer.desugar(lexer.lex(code))
-    nodes = [parser.parse(tree) for tree in lexed]
+
+# How to evaluate a parsed top-level form. 'tree' is the reference
+# tree-walker, `Environment.eval`.
+ENGINES = {
+    'closure': lambda env, node: compiler.compile_node(node)(env, None),
+    'vm': _run_vm,
+    'tree': lambda env, node: env.eval(node),
+}
+
+
+def _call_vm(env, fn, args):
+    from interpreter import vm
+    return vm.call(env, fn, args)
+
+
+def _call_tree(env, fn, args):
+    if fn.variant != ValueType.LAMBDA:
+        raise RuntimeError(f'Cannot call {fn}')
+    return env.apply(fn, args)
+
+
+# How to call a function made by each engine from Python, with a list of
+# arguments.
+CALLERS = {
+    'closure': compiler.call,
+    'vm': _call_vm,
+    'tree': _call_tree,
+}
+
+# characters read at a time by `run_stream`
+CHUNK_SIZE = 1 << 16
+
+
+def _run_nodes(env, nodes, engine, optimize=False):
+    run = ENGINES[engine]
+    if optimize:
+        nodes = map(optimizer.optimize, nodes)
+    value = NIL
     for node in nodes:
-        value = env.eval(node)
+        value = run(env, node)
     return value
+
+
+def run_code(env, code, engine='closure', optimize=False, inliner=None):
+    """Runs `code` and returns the value of its last form. With `optimize`,
+    the parsed forms go through `optimizer.optimize` first, and with an
+    `optimizer.Inliner`, calls of small functions are inlined before that;
+    see `inliner.inlined` afterwards for what was."""
+    # Comments are skipped by the lexer, and each form is parsed as soon as
+    # the desugarizer has built it. The whole program is parsed before any of
+    # it runs, so that a syntax error means nothing runs.
+    trees = desugarizer.desugar_iter(lexer.tokenize(code))
+    nodes = [parser.parse(tree) for tree in trees]
+    if inliner is not None:
+        nodes = inliner.inline(nodes)
+    return _run_nodes(env, nodes, engine, optimize)
+
+
+def run_stream(env, source, engine='closure', optimize=False):
+    """Runs code from `source`, a file object or an iterable of chunks of
+    source text, one top-level form at a time.
+
+    Each form is evaluated as soon as it has been read, and dropped
+    afterwards, so memory use doesn't grow with the size of the source. Unlike
+    `run_code`, forms before a syntax error will already have run, and calls
+    can't be inlined, since that needs the whole program."""
+    chunks = source
+    if hasattr(source, 'read'):
+        chunks = iter(lambda: source.read(CHUNK_SIZE), '')
+    trees = desugarizer.desugar_iter(lexer.tokenize_chunks(chunks))
+    return _run_nodes(env, map(parser.parse, trees), engine, optimize)
+
+
+def call(env, fn, args, engine='closure'):
+    return CALLERS[engine](env, fn, args)
+
+
+def run_file(
+    env, path, engine='closure', cache_directory=None, optimize=False,
+    inliner=None,
+):
+    """Runs the file at `path`, like `run_code`, but its parsed forms are
+    cached on disk (see `cache`), so that running it again skips parsing.
+    The forms are cached as parsed, before they are optimized."""
+    from interpreter import cache
+    nodes = cache.load(path, cache_directory)
+    if inliner is not None:
+        nodes = inliner.inline(nodes)
+    return _run_nodes(env, nodes, engine, optimize)
@@ -0,0 +1,165 @@
+"""Profiling of the tree-walker, `Environment.eval`, by Lisp function.
+
+cProfile only shows `eval` calling itself. A `ProfilingEnvironment` instead
+times each call of a lambda, named after the variable it was first `def`'d or
+`set` to, and of each builtin. Its `Profiler` keeps, for each function, the
+number of calls and the inclusive and exclusive time, and for each stack of
+calls the exclusive time spent in it, which `collapsed` writes in the format
+that flame graph tools read."""
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import attr
+
+from . import builtin_handlers
+from .evaluator import Environment
+from .types import Value, ValueType
+
+
+# the name of lambdas that were never def'd
+ANONYMOUS = '<lambda>'
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Stats:
+    calls: int = 0
+    # in seconds, including the functions it called; time in recursive calls
+    # is only counted once
+    inclusive: float = 0.0
+    # in seconds, not including the functions it called
+    exclusive: float = 0.0
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class _Node:
+    """A stack of calls, in a tree of them."""
+    name: Optional[str]
+    parent: Optional['_Node']
+    children: Dict[str, '_Node'] = attr.ib(factory=dict)
+    exclusive: float = 0.0
+
+    def child(self, name: str) -> '_Node':
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = _Node(name, self)
+        return node
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Profiler:
+    functions: Dict[str, Stats] = attr.ib(factory=dict)
+    clock: Callable[[], float] = time.perf_counter
+    # The stacks are kept as a tree, so that entering a call doesn't copy the
+    # stack.
+    _root: _Node = attr.ib(factory=lambda: _Node(None, None))
+    # [stack, start time, time spent in calls it made], for each call in
+    # progress
+    _calls: List[list] = attr.ib(factory=list)
+    # how many calls of each function are in progress
+    _active: Dict[str, int] = attr.ib(factory=dict)
+
+    def enter(self, name: str):
+        node = self._calls[-1][0] if self._calls else self._root
+        self._active[name] = self._active.get(name, 0) + 1
+        self._calls.append([node.child(name), self.clock(), 0.0])
+
+    def exit(self):
+        node, start, children = self._calls.pop()
+        elapsed = self.clock() - start
+        name = node.name
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = Stats()
+        stats.calls += 1
+        stats.exclusive += elapsed - children
+        node.exclusive += elapsed - children
+        self._active[name] -= 1
+        if not self._active[name]:
+            stats.inclusive += elapsed
+        if self._calls:
+            self._calls[-1][2] += elapsed
+
+    def stacks(self) -> Iterator[Tuple[Tuple[str, ...], float]]:
+        """Each stack of calls, outermost first, with the exclusive time
+        spent in it."""
+        pending = [((), self._root)]
+        while pending:
+            names, node = pending.pop()
+            if node.exclusive:
+                yield names, node.exclusive
+            for name, child in reversed(list(node.children.items())):
+                pending.append((names + (name,), child))
+
+    def table(self, sort: str = 'exclusive', limit: Optional[int] = None) \
+            -> str:
+        rows = sorted(
+            self.functions.items(),
+            key=lambda item: getattr(item[1], sort), reverse=True,
+        )[:limit]
+        lines = [
+            f'{"function":<30} {"calls":>10} {"inclusive (ms)":>15} '
+            f'{"exclusive (ms)":>15}'
+        ]
+        for name, stats in rows:
+            lines.append(
+                f'{name:<30} {stats.calls:>10} '
+                f'{stats.inclusive * 1000:>15.3f} '
+                f'{stats.exclusive * 1000:>15.3f}'
+            )
+        return '\n'.join(lines)
+
+    def collapsed(self) -> str:
+        """The stacks, one per line, as `outer;inner microseconds`."""
+        lines = []
+        for names, seconds in self.stacks():
+            microseconds = round(seconds * 1e6)
+            if microseconds:
+                lines.append(f'{";".join(names)} {microseconds}')
+        return ''.join(line + '\n' for line in lines)
+
+    def save_collapsed(self, path: str):
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+
+@attr.s(auto_attribs=True, slots=True)
+class ProfilingEnvironment(Environment):
+    """An Environment that records the calls made by `eval` in `profiler`."""
+    profiler: Profiler = attr.ib(factory=Profiler)
+    # the name each lambda was first defined as, by the id of its `value`,
+    # with the value so that the id stays valid
+    names: Dict[int, Tuple[object, str]] = attr.ib(factory=dict)
+
+    def _name(self, key: str, value: Value):
+        if value.variant != ValueType.LAMBDA:
+            return
+        self.names.setdefault(id(value.value), (value.value, key))
+        if value.value.__class__ is builtin_handlers.Memoized:
+            self._name(key, value.value.fn)
+
+    def set(self, key: str, value: Value) -> None:
+        super().set(key, value)
+        self._name(key, value)
+
+    def def_(self, key: str, value: Value) -> None:
+        super().def_(key, value)
+        self._name(key, value)
+
+    def _handle_builtin(self, name: str, args: List[Value]) -> Value:
+        self.profiler.enter(name)
+        try:
+            return super()._handle_builtin(name, args)
+        finally:
+            self.profiler.exit()
+
+    def apply(self, fn: Value, args: List[Value]) -> Value:
+        if fn.value.__class__ is builtin_handlers.Memoized:
+            # Not a call of its own: the function it wraps is named after it,
+            # and its calls are recorded when the cache misses.
+            return super().apply(fn, args)
+        entry = self.names.get(id(fn.value))
+        self.profiler.enter(entry[1] if entry else ANONYMOUS)
+        try:
+            return super().apply(fn, args)
+        finally:
+            self.profiler.exit()
@@ -0,0 +1,102 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import attr
+
+from .types import Value, ValueType
+
+
+# Frames are plain lists: index 0 holds the enclosing frame (None at the top
+# level) and the remaining indices hold the variables of one scope, in the
+# order the resolver assigned them. Globals are not kept in frames; they stay
+# in a dict so they can be looked up by name.
+Frame = List
+
+
+class _Undefined:
+    def __repr__(self):
+        return '<undefined>'
+
+
+# Placeholder for variables that have a slot but have not been `def`'d yet.
+UNDEFINED = _Undefined()
+
+
+# Forms whose bodies get their own scope, or that are never evaluated, so that
+# a `def` inside them does not define anything in the enclosing scope.
+_SCOPE_BOUNDARIES = {'block', 'lambda', 'quote'}
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Scope:
+    """Compile-time description of one frame."""
+    parent: Optional['Scope'] = None
+    names: Dict[str, int] = attr.ib(factory=dict)
+
+    def define(self, name: str) -> int:
+        if name not in self.names:
+            self.names[name] = len(self.names) + 1
+        return self.names[name]
+
+    def resolve(self, name: str) -> Optional[Tuple[int, int]]:
+        """Returns the (depth, slot) address of `name`, or None if it is a
+        global."""
+        depth = 0
+        scope = self
+        while scope is not None:
+            slot = scope.names.get(name)
+            if slot is not None:
+                return depth, slot
+            scope = scope.parent
+            depth += 1
+        return None
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _definitions(node: Value, result: List[str]) -> None:
+    if node.variant != ValueType.CONS:
+        return
+    head = node.value.car
+    if head.variant == ValueType.STRING:
+        if head.value in _SCOPE_BOUNDARIES:
+            return
+        if head.value == 'def':
+            key = node.value.cdr
+            if key.variant == ValueType.CONS and \
+                    key.value.car.variant == ValueType.STRING:
+                result.append(key.value.car.value)
+    for cons in node:
+        _definitions(cons.value.car, result)
+
+
+def definitions(statements: Iterable[Value]) -> List[str]:
+    """Names `def`'d directly in the scope made up of `statements`."""
+    result = []
+    for statement in statements:
+        _definitions(statement, result)
+    return result
+
+
+def body_statements(body: Value) -> List[Value]:
+    """The statements of a lambda body.
+
+    A block directly in the body needs no frame of its own, since the lambda's
+    frame is fresh for every call anyway, so its statements are treated as
+    statements of the body."""
+    if (body.variant == ValueType.CONS and
+            body.value.car.variant == ValueType.STRING and
+            body.value.car.value == 'block'):
+        return [arg.value.car for arg in body.value.cdr]
+    return [body]
+
+
+def new_scope(
+    parent: Optional[Scope], params: Iterable[str], statements: Iterable[Value]
+) -> Scope:
+    scope = Scope(parent)
+    for name in params:
+        scope.define(name)
+    for name in definitions(statements):
+        scope.define(name)
+    return scope
@@ -0,0 +1,292 @@
+"""Saving an Environment, with everything reachable from it, as a binary
+image, and restoring it, possibly in another process.
+
+The image is a flat table of records, one per object, that refer to each
+other by index, so that cycles (from `set_cdr`, or closures stored in the
+frames they capture) and shared structure come back as they were, and long
+lists don't need deep recursion. The table is written with marshal.
+
+Compiled closure code is Python functions, which can't be saved; the
+compiler recompiles each lambda from its source and scope the first time it
+is called after a restore. VM bytecode is saved as is.
+
+`dumps_object` and `loads_object` do the same for other objects, such as a
+lambda and the values to call it with."""
+import array
+import collections
+import enum
+import marshal
+from types import MappingProxyType
+from typing import BinaryIO
+
+import attr
+
+from . import arrays, builtin_handlers, bytecode, compiler, resolver, vm
+from .evaluator import Environment, Overlay
+from .types import (
+    Value, ValueType, LambdaValue, Captured, Cons, NIL, TRUE, FALSE,
+)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# The classes that can be in an image, which are also the only ones that
+# restoring one can make.
+_CLASSES = {
+    f'{cls.__module__.rsplit(".", 1)[-1]}.{cls.__qualname__}': cls
+    for cls in [
+        Value, LambdaValue, Captured, Environment, compiler.Closure,
+        compiler.Function,
+        vm.Closure, bytecode.CodeObject, resolver.Scope,
+        builtin_handlers.Memoized,
+    ]
+}
+_CLASS_NAMES = {cls: name for name, cls in _CLASSES.items()}
+
+# Fields that are not saved, and are set up again by `_restore_hooks`.
+_SKIPPED_FIELDS = {compiler.Function: {'code'}}
+
+_HANDLER_NAMES = {
+    handler: name for name, handler in builtin_handlers.HANDLERS.items()
+}
+
+# bumped when the format of the records changes
+_FORMAT = 2
+
+_ATOMS = (ValueType.NUMBER, ValueType.STRING, ValueType.BOOLEAN)
+
+
+def _fields(cls):
+    skipped = _SKIPPED_FIELDS.get(cls, ())
+    return tuple(f.name for f in attr.fields(cls) if f.name not in skipped)
+
+
+def _layout():
+    """The fields of the classes, which an image can only be restored with if
+    they haven't changed."""
+    return tuple((name, _fields(cls)) for name, cls in sorted(_CLASSES.items()))
+
+
+def dumps(env: Environment) -> bytes:
+    return dumps_object(env)
+
+
+def dumps_object(root) -> bytes:
+    """Saves `root`, which can be anything made of the classes and builtin
+    types an environment can hold."""
+    records = []
+    # from id(obj) to index in `records`, for objects that have been seen
+    indices = {}
+    # the objects, so that their ids stay valid while this runs
+    objects = []
+    # keys for primitives, which are compared by value
+    primitives = {}
+
+    def ref(obj) -> int:
+        cls = obj.__class__
+        if cls in (int, float, str, bool, complex, bytes) or obj is None:
+            key = (cls, obj)
+            index = primitives.get(key)
+            if index is None:
+                index = primitives[key] = len(objects)
+                objects.append(obj)
+            return index
+        index = indices.get(id(obj))
+        if index is None:
+            index = indices[id(obj)] = len(objects)
+            objects.append(obj)
+        return index
+
+    ref(root)
+    # Objects are numbered as they are found and recorded in the same order,
+    # so that each one's record is at its index.
+    while len(records) < len(objects):
+        records.append(_record(objects[len(records)], ref))
+
+    return marshal.dumps((_FORMAT, _layout(), tuple(records)))
+
+
+def _record(obj, ref) -> tuple:
+    cls = obj.__class__
+    if cls in (int, float, str, bool, complex, bytes) or obj is None:
+        return ('p', obj)
+    elif cls is Cons:
+        return ('c', ref(obj.car), ref(obj.cdr))
+    elif cls is Value and obj.variant in _ATOMS:
+        return ('a', obj.variant.value, obj.value)
+    elif cls is Value and obj.variant == ValueType.NIL:
+        return ('nil',)
+    elif obj is resolver.UNDEFINED:
+        return ('undefined',)
+    elif cls is list:
+        return ('list', tuple(map(ref, obj)))
+    elif cls is tuple:
+        return ('tuple', tuple(map(ref, obj)))
+    elif cls is collections.deque:
+        return ('deque', tuple(map(ref, obj)))
+    elif cls is dict or cls is collections.OrderedDict:
+        return (
+            'dict' if cls is dict else 'odict',
+            tuple(map(ref, obj.keys())),
+            tuple(map(ref, obj.values())),
+        )
+    elif cls is Overlay:
+        # The globals of an environment made from a Prelude. Only what was
+        # defined, or read, in the overlay is in its own items.
+        return (
+            'overlay', ref(obj.base),
+            tuple(map(ref, dict.keys(obj))),
+            tuple(map(ref, dict.values(obj))),
+        )
+    elif cls is MappingProxyType:
+        # saved as the dict it is a view of, copied since that can't be
+        # reached from the view
+        return ('proxy', ref(dict(obj)))
+    elif cls is array.array:
+        return ('array', obj.typecode, obj.tobytes())
+    elif isinstance(obj, enum.Enum):
+        if cls is not ValueType:
+            raise SnapshotError(f'Cannot save {obj!r}')
+        return ('enum', obj.value)
+    elif cls in _CLASS_NAMES:
+        return (
+            'object', _CLASS_NAMES[cls],
+            tuple(ref(getattr(obj, name)) for name in _fields(cls)),
+        )
+    elif callable(obj) and obj in _HANDLER_NAMES:
+        return ('handler', _HANDLER_NAMES[obj])
+    elif cls.__module__ == 'numpy' and cls.__name__ == 'ndarray':
+        if obj.dtype.hasobject:
+            raise SnapshotError('Cannot save arrays of Python objects')
+        return ('ndarray', obj.dtype.str, obj.shape, obj.tobytes())
+    raise SnapshotError(f'Cannot save {obj!r}')
+
+
+def loads(data: bytes) -> Environment:
+    env = loads_object(data)
+    if env.__class__ is not Environment:
+        raise SnapshotError('Not a snapshot of an environment')
+    return env
+
+
+def loads_object(data: bytes):
+    try:
+        format_, layout, records = marshal.loads(data)
+    except (EOFError, ValueError, TypeError) as e:
+        raise SnapshotError('Not a snapshot') from e
+    if format_ != _FORMAT or layout != _layout():
+        raise SnapshotError(
+            'The snapshot was made by a different version of the interpreter'
+        )
+
+    # Every object is made first, then the containers are filled in, so that
+    # they can refer to each other in any order.
+    objects = [_make(record) for record in records]
+
+    def get(index):
+        obj = objects[index]
+        if obj is _TUPLE:
+            # Tuples can't be filled in, so they are made when needed. They
+            # can't be in cycles either.
+            obj = objects[index] = tuple(map(get, records[index][1]))
+        elif obj is _PROXY:
+            # likewise for views of dicts, though the dicts they are views of
+            # are filled in as usual
+            obj = objects[index] = MappingProxyType(get(records[index][1]))
+        return obj
+
+    for obj, record in zip(objects, records):
+        kind = record[0]
+        if kind == 'c':
+            obj.car = get(record[1])
+            obj.cdr = get(record[2])
+        elif kind == 'list' or kind == 'deque':
+            obj.extend(map(get, record[1]))
+        elif kind == 'dict' or kind == 'odict':
+            obj.update(zip(map(get, record[1]), map(get, record[2])))
+        elif kind == 'overlay':
+            obj.base = get(record[1])
+            obj.update(zip(map(get, record[2]), map(get, record[3])))
+        elif kind == 'object':
+            set_field = object.__setattr__
+            cls = _CLASSES[record[1]]
+            for name, index in zip(_fields(cls), record[2]):
+                set_field(obj, name, get(index))
+            hook = _restore_hooks.get(cls)
+            if hook is not None:
+                hook(obj)
+
+    return get(0)
+
+
+_TUPLE = object()
+_PROXY = object()
+
+
+def _make(record):
+    kind = record[0]
+    if kind == 'p':
+        return record[1]
+    elif kind == 'c':
+        return Cons()
+    elif kind == 'a':
+        variant = ValueType(record[1])
+        if variant == ValueType.NUMBER:
+            return Value.number(record[2])
+        elif variant == ValueType.STRING:
+            return Value.symbol(record[2])
+        return TRUE if record[2] else FALSE
+    elif kind == 'nil':
+        return NIL
+    elif kind == 'undefined':
+        return resolver.UNDEFINED
+    elif kind == 'list':
+        return []
+    elif kind == 'tuple':
+        return _TUPLE
+    elif kind == 'deque':
+        return collections.deque()
+    elif kind == 'dict':
+        return {}
+    elif kind == 'odict':
+        return collections.OrderedDict()
+    elif kind == 'overlay':
+        return Overlay({})
+    elif kind == 'proxy':
+        return _PROXY
+    elif kind == 'array':
+        result = array.array(record[1])
+        result.frombytes(record[2])
+        return result
+    elif kind == 'enum':
+        return ValueType(record[1])
+    elif kind == 'object':
+        cls = _CLASSES.get(record[1])
+        if cls is None:
+            raise SnapshotError(f'Unknown class {record[1]}')
+        return cls.__new__(cls)
+    elif kind == 'handler':
+        return builtin_handlers.HANDLERS[record[1]]
+    elif kind == 'ndarray':
+        # through `arrays`, which needs to know NumPy is in use
+        numpy = arrays.numpy_module()
+        _, dtype, shape, data = record
+        return numpy.frombuffer(data, dtype=dtype).reshape(shape).copy()
+    raise SnapshotError(f'Unknown record {kind}')
+
+
+_restore_hooks = {
+    compiler.Function: lambda function: setattr(
+        function, 'code', compiler.lazy_code(function),
+    ),
+}
+
+
+def dump(env: Environment, file: BinaryIO):
+    file.write(dumps(env))
+
+
+def load(file: BinaryIO) -> Environment:
+    return loads(file.read())
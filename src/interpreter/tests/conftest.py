@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from interpreter import pipeline
+from interpreter.evaluator import Environment
+
+
+BUILTINS_PATH = os.path.join(
+    os.path.dirname(pipeline.__file__), 'builtins.lisp'
+)
+
+
+def _make_env(engine=None):
+    env = Environment()
+    env.begin_toplevel()
+    if engine is not None:
+        with open(BUILTINS_PATH) as f:
+            pipeline.run_stream(env, f, engine)
+    return env
+
+
+@pytest.fixture
+def make_env():
+    """Makes a new top-level environment, with builtins.lisp run in it by
+    `engine` if one is given."""
+    return _make_env
+
+
+@pytest.fixture
+def run():
+    """Runs code in a new top-level environment, with builtins.lisp first if
+    `prelude`, and returns the value of its last form."""
+    def run(code, engine='closure', prelude=False):
+        env = _make_env(engine if prelude else None)
+        return pipeline.run_code(env, code, engine)
+    return run
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from interpreter import aio, pipeline
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+LOOP = '''
+(def loop (lambda (n) (loop (+ n 1))))
+(loop 0)
+'''
+
+FIB = '''
+(def fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+(fib 15)
+'''
+
+
+@pytest.mark.parametrize('steps', [1, 7, 1000])
+@pytest.mark.parametrize('code', [
+    FIB,
+    '(map (lambda (x) (* x x)) (list 1 2 3))',
+    '(def x 1) (set x (+ x 1)) x',
+    '(eval (quote ((lambda (n) (+ n 1)) 1)))',
+])
+def test_run_code(steps, code, make_env):
+    assert asyncio.run(aio.run_code(make_env(), code, steps)) == \
+        pipeline.run_code(make_env(), code, 'vm')
+
+
+def test_interleaving(make_env):
+    finished = []
+
+    async def run(name, code):
+        await aio.run_code(make_env(), code, steps=10)
+        finished.append(name)
+
+    async def main():
+        await asyncio.gather(
+            run('long', FIB), run('short', '((lambda (x) x) 1)'),
+        )
+
+    asyncio.run(main())
+    assert finished == ['short', 'long']
+
+
+def test_cancel(make_env):
+    env = make_env()
+
+    async def main():
+        task = asyncio.create_task(aio.run_code(env, LOOP))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    # what ran before it was cancelled is kept
+    assert pipeline.run_code(env, 'loop', 'vm').variant == VT.LAMBDA
+
+
+def test_timeout(make_env):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aio.run_code(make_env(), LOOP, timeout=0.05))
+    assert asyncio.run(aio.run_code(make_env(), '(+ 1 2)', timeout=1)) == \
+        V(VT.NUMBER, 3)
+
+
+def test_timeout_in_builtin_callback(make_env):
+    # the callback never returns to the slice, so can't yield
+    code = LOOP.replace('(loop 0)', '(map (lambda (x) (loop 0)) (list 1))')
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aio.run_code(make_env(), code, timeout=0.05))
+
+
+def test_errors(make_env):
+    with pytest.raises(RuntimeError):
+        asyncio.run(aio.run_code(make_env(), '(car 1)'))
+    with pytest.raises(RuntimeError):
+        asyncio.run(aio.run_code(make_env(), '1', steps=0))
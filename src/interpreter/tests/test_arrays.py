@@ -0,0 +1,65 @@
+import sys
+
+import pytest
+
+from interpreter import arrays, pipeline
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+@pytest.fixture
+def numpy():
+    return pytest.importorskip('numpy')
+
+
+array_testdata = [
+    ('(array_to_list (+ (array (list 1 2 3)) 1))', '(list 2 3 4)'),
+    ('(array_to_list (* (array (list 1 2)) (array (list 3 4))))',
+        '(list 3 8)'),
+    ('(array_to_list (- (array_range 3) 1.5))', '(list -1.5 -0.5 0.5)'),
+    ('(array_to_list (/ (array [1 2]) 2))', '(list 0.5 1.0)'),
+    ('(array_to_list (< (array (list 1 5 2)) 2))', '(list true false false)'),
+    ('(array_sum (array (list 1 2 3)))', '6'),
+    ('(array_mean (array (list 1 2 3)))', '2.0'),
+    ('(array_min (array (list 4 2 3)))', '2'),
+    ('(array_max (array (list 4 2 3)))', '4'),
+    ('(array_dot (array (list 1 2)) (array (list 3 4)))', '11'),
+    ('(array_to_list (array_dot (array (list (list 1 0) (list 0 2))) '
+        '(array (list 3 4))))', '(list 3 8)'),
+    ('((def a (array (list 1 5 2 7))), '
+        '(array_to_list (array_mask a (> a 2))))', '(list 5 7)'),
+    ('(= (array (list 1 2)) (array (list 1 2)))', 'true'),
+    ('(= (array (list 1 2)) (array (list 1 3)))', 'false'),
+    ('(length (array (list 1 2)))', '2'),
+]
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+@pytest.mark.parametrize('code,expected', array_testdata)
+def test_arrays(numpy, engine, code, expected, run):
+    assert run(code, engine) == run(expected, engine)
+
+
+def test_scalars_are_plain_numbers(numpy, run):
+    value = run('(array_sum (array (list 1 2)))')
+    assert value.value.__class__ is int
+
+
+@pytest.mark.parametrize('code', [
+    '(array (list 1 (quote x)))',
+    '(array_min (array (list)))',
+    '(array_dot (array (list 1 2)) (array (list 1 2 3)))',
+    '(array_mask (array (list 1 2)) (array (list 1 0)))',
+    '(array_sum (list 1 2))',
+])
+def test_array_errors(numpy, code, run):
+    with pytest.raises(RuntimeError):
+        run(code)
+
+
+def test_without_numpy(monkeypatch, run):
+    monkeypatch.setattr(arrays, 'numpy', None)
+    # makes importing numpy fail
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    with pytest.raises(RuntimeError):
+        run('(array (list 1 2))')
+    assert run('(+ 1 2.5)') == V(VT.NUMBER, 3.5)
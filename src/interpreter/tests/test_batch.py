@@ -0,0 +1,73 @@
+import pytest
+
+from interpreter import batch
+from interpreter.types import Value as V, ValueType as VT, Cons, RuntimeError
+
+
+@pytest.mark.parametrize('data,value', [
+    (1, V(VT.NUMBER, 1)),
+    (2.5, V(VT.NUMBER, 2.5)),
+    (True, V(VT.BOOLEAN, True)),
+    ('a', V(VT.STRING, 'a')),
+    ([], V(VT.NIL)),
+    ([1, [2]], V.list_to_cons([
+        V(VT.NUMBER, 1), V.list_to_cons([V(VT.NUMBER, 2)]),
+    ])),
+    ({'a': [1]}, V(VT.HASHMAP, {
+        V(VT.STRING, 'a'): V.list_to_cons([V(VT.NUMBER, 1)]),
+    })),
+])
+def test_conversions(data, value):
+    assert batch.from_python(data) == value
+    assert batch.to_python(value) == data
+
+
+def test_conversion_errors():
+    with pytest.raises(RuntimeError):
+        batch.from_python(object())
+    with pytest.raises(RuntimeError):
+        # an improper list
+        batch.to_python(Cons(V(VT.NUMBER, 1), V(VT.NUMBER, 2)))
+    assert batch.from_python(None) == V(VT.NIL)
+    assert batch.from_python((1,)) == V.list_to_cons([V(VT.NUMBER, 1)])
+    assert batch.to_python(V(VT.VECTOR, [V(VT.NUMBER, 1)])) == [1]
+
+
+@pytest.mark.parametrize('engine', ['closure', 'vm', 'tree'])
+def test_run_programs(engine):
+    programs = [
+        '(+ 1 2)',
+        '(def x 3) (list x (car (list 1)))',
+        # can't see the definitions of the other programs
+        '(x)',
+        '(setup_value)',
+    ]
+    results = batch.run_programs(
+        programs, processes=2, engine=engine,
+        setup='(def setup_value (lambda () 7))', return_exceptions=True,
+    )
+    assert results[:2] == [3, [3, 1]]
+    assert isinstance(results[2], RuntimeError)
+    assert results[3] == 7
+
+    with pytest.raises(RuntimeError):
+        batch.run_programs(['(car 1)'], processes=1, engine=engine)
+
+
+@pytest.mark.parametrize('engine', ['closure', 'vm', 'tree'])
+def test_map_function(engine):
+    setup = '''
+    (def total (lambda (record)
+        (reduce (lambda (a b) (+ a b)) (car (cdr record)) 0)))
+    '''
+    records = [['a', [1, 2, 3]], ['b', []], ['c', [4.5]]] * 10
+    results = batch.map_function(
+        'total', records, processes=2, engine=engine, setup=setup,
+        chunksize=4,
+    )
+    assert results == [6, 0, 4.5] * 10
+
+    # the prelude, which defines nil, is loaded
+    assert batch.map_function(
+        '(lambda (x) (cons x nil))', [1, []], processes=1, engine=engine,
+    ) == [[1], [[]]]
@@ -0,0 +1,49 @@
+import pytest
+
+from interpreter import benchmark, pipeline
+from interpreter.types import Value as V, ValueType as VT
+
+
+@pytest.mark.parametrize('name,n,expected', [
+    ('fib', 10, 55),
+    ('map_filter_reduce', 4, 4 + 16),
+    ('deep_closures', 50, 50),
+    ('big_literal', 5, 5),
+])
+def test_programs(name, n, expected):
+    env = benchmark._environment('closure')
+    code = benchmark.PROGRAMS[name](n)
+    assert pipeline.run_code(env, code) == V(VT.NUMBER, expected)
+
+
+def test_bench(tmp_path):
+    results = benchmark.bench_stages([10], ['tree', 'vm'], repeat=1)
+    results += benchmark.bench_programs([10], repeat=1)
+    assert [r.key for r in results[:5]] == [
+        'lex/10', 'desugar/10', 'parse/10', 'eval[tree]/10', 'eval[vm]/10',
+    ]
+    assert all(r.seconds > 0 and r.peak > 0 for r in results)
+
+    path = str(tmp_path / 'results.json')
+    benchmark.save(results, path)
+    baseline = benchmark.load(path)
+    assert set(baseline) == {r.key for r in results}
+    assert benchmark.compare(results, baseline) == []
+
+    baseline['lex/10']['seconds'] = results[0].seconds / 2
+    assert benchmark.compare(results, baseline) == [('lex/10', 2.0)]
+
+
+def test_failures_are_skipped():
+    # the tree-walker recurses in Python for each call
+    results = benchmark.bench_programs(
+        [5000, 10], ['tree'], repeat=1, programs=['map_filter_reduce'],
+    )
+    assert [r.key for r in results] == \
+        ['map_filter_reduce[tree]/5000', 'map_filter_reduce[tree]/10']
+    assert results[0].error.startswith('RecursionError')
+    assert results[1].error is None and results[1].seconds > 0
+    assert 'skipped: RecursionError' in benchmark.table(results)
+    assert benchmark.compare(results, {r.key: {'seconds': 1e-9} for r in
+                                       results}) == \
+        [('map_filter_reduce[tree]/10', results[1].seconds / 1e-9)]
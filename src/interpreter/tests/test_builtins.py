@@ -1,8 +1,10 @@
+import array
+
 import pytest
 
 from interpreter.builtin_handlers import handle
 from interpreter.types import (
-    Value as V, ValueType as VT, Cons
+    Value as V, ValueType as VT, Cons, RuntimeError
 )
 
 
@@ -95,3 +97,178 @@ def test_set_car_cdr():
     assert cons.value.car == V(VT.BOOLEAN, True)
     handle('set_cdr', [cons, V(VT.BOOLEAN, False)])
     assert cons.value.cdr == V(VT.BOOLEAN, False)
+
+
+def _numbers(*ns):
+    return [V(VT.NUMBER, n) for n in ns]
+
+
+@pytest.mark.parametrize('op,test_case,expected', [
+    ('vector', _numbers(1, 2), V(VT.VECTOR, _numbers(1, 2))),
+    ('int_vector', _numbers(1, 2), V(VT.VECTOR, _numbers(1, 2))),
+    ('float_vector', _numbers(1, 2.5), V(VT.VECTOR, _numbers(1.0, 2.5))),
+    ('length', [V(VT.VECTOR, _numbers(1, 2, 3))], V(VT.NUMBER, 3)),
+    ('vector_get', [V(VT.VECTOR, _numbers(4, 5)), V(VT.NUMBER, 1)],
+        V(VT.NUMBER, 5)),
+    ('vector_slice', [V(VT.VECTOR, _numbers(4, 5, 6)), V(VT.NUMBER, 1)],
+        V(VT.VECTOR, _numbers(5, 6))),
+    ('vector_slice',
+        [V(VT.VECTOR, _numbers(4, 5, 6)), V(VT.NUMBER, 0), V(VT.NUMBER, 2)],
+        V(VT.VECTOR, _numbers(4, 5))),
+    ('vector_to_list', [V(VT.VECTOR, _numbers(4, 5))],
+        V.list_to_cons(_numbers(4, 5))),
+    ('list_to_vector', [V.list_to_cons(_numbers(4, 5))],
+        V(VT.VECTOR, _numbers(4, 5))),
+])
+def test_vector(op, test_case, expected):
+    assert handle(op, test_case) == expected
+
+
+@pytest.mark.parametrize('make', ['vector', 'int_vector'])
+def test_vector_set_push(make):
+    vector = handle(make, _numbers(1, 2))
+    handle('vector_set', [vector, V(VT.NUMBER, 0), V(VT.NUMBER, 7)])
+    assert handle('vector_push', [vector, V(VT.NUMBER, 8)]) is vector
+    assert vector == V(VT.VECTOR, _numbers(7, 2, 8))
+    assert handle('vector_get', [vector, V(VT.NUMBER, 2)]) == V(VT.NUMBER, 8)
+
+
+def test_typed_vector_storage():
+    vector = handle('int_vector', _numbers(1, 2))
+    assert isinstance(vector.value, array.array)
+    assert str(vector) == '[1 2]'
+
+
+@pytest.mark.parametrize('op,test_case', [
+    ('vector_get', [V(VT.VECTOR, _numbers(4)), V(VT.NUMBER, 1)]),
+    ('vector_get', [V(VT.VECTOR, _numbers(4)), V(VT.NUMBER, -1)]),
+    ('vector_get', [V(VT.VECTOR, _numbers(4)), V(VT.NUMBER, 0.5)]),
+    ('vector_get', [V.list_to_cons(_numbers(4)), V(VT.NUMBER, 0)]),
+    ('int_vector', [V(VT.NUMBER, 1.5)]),
+    ('float_vector', [V(VT.STRING, 'x')]),
+])
+def test_vector_errors(op, test_case):
+    with pytest.raises(RuntimeError):
+        handle(op, test_case)
+
+
+def _hashmap():
+    return handle('hashmap', [
+        V(VT.STRING, 'a'), V(VT.NUMBER, 1),
+        V(VT.NUMBER, 2), V(VT.STRING, 'b'),
+        V(VT.BOOLEAN, True), V(VT.NIL),
+    ])
+
+
+@pytest.mark.parametrize('op,test_case,expected', [
+    ('hashmap_get', [V(VT.STRING, 'a')], V(VT.NUMBER, 1)),
+    ('hashmap_get', [V(VT.NUMBER, 2.0)], V(VT.STRING, 'b')),
+    ('hashmap_get', [V(VT.BOOLEAN, True)], V(VT.NIL)),
+    ('hashmap_get', [V(VT.NUMBER, 1), V(VT.NUMBER, 0)], V(VT.NUMBER, 0)),
+    ('hashmap_contains', [V(VT.STRING, 'a')], V(VT.BOOLEAN, True)),
+    # a number is not the boolean it is equal to in Python
+    ('hashmap_contains', [V(VT.NUMBER, 1)], V(VT.BOOLEAN, False)),
+    ('hashmap_size', [], V(VT.NUMBER, 3)),
+    ('length', [], V(VT.NUMBER, 3)),
+    ('hashmap_keys', [], V.list_to_cons(
+        [V(VT.STRING, 'a'), V(VT.NUMBER, 2), V(VT.BOOLEAN, True)]
+    )),
+])
+def test_hashmap(op, test_case, expected):
+    assert handle(op, [_hashmap()] + test_case) == expected
+
+
+def test_hashmap_put_delete():
+    hashmap = _hashmap()
+    handle('hashmap_put', [hashmap, V(VT.STRING, 'a'), V(VT.NUMBER, 5)])
+    handle('hashmap_delete', [hashmap, V(VT.NUMBER, 2)])
+    handle('hashmap_delete', [hashmap, V(VT.NUMBER, 3)])
+    assert handle('hashmap_values', [hashmap]) == \
+        V.list_to_cons([V(VT.NUMBER, 5), V(VT.NIL)])
+
+
+@pytest.mark.parametrize('op,test_case', [
+    ('hashmap_get', [V(VT.STRING, 'x')]),
+    ('hashmap_get', [V.list_to_cons([V(VT.NUMBER, 1)])]),
+    ('hashmap_put', [V(VT.VECTOR, []), V(VT.NUMBER, 1)]),
+])
+def test_hashmap_errors(op, test_case):
+    with pytest.raises(RuntimeError):
+        handle(op, [_hashmap()] + test_case)
+
+
+def _list(*ns):
+    return V.list_to_cons(_numbers(*ns))
+
+
+@pytest.mark.parametrize('op,test_case,expected', [
+    ('range', _numbers(3), _list(0, 1, 2)),
+    ('range', _numbers(1, 3), _list(1, 2)),
+    ('range', _numbers(5, 0, -2), _list(5, 3, 1)),
+    ('reverse', [_list(1, 2, 3)], _list(3, 2, 1)),
+    ('reverse', [_list()], _list()),
+    ('nth', [_list(4, 5), V(VT.NUMBER, 1)], V(VT.NUMBER, 5)),
+    ('append', [], _list()),
+    ('append', [_list(1), _list(), _list(2, 3)], _list(1, 2, 3)),
+    ('zip', [_list(1, 2, 3), _list(4, 5)],
+        V.list_to_cons([_list(1, 4), _list(2, 5)])),
+    ('sort', [_list(3, 1, 2.5)], _list(1, 2.5, 3)),
+])
+def test_list_library(op, test_case, expected):
+    assert handle(op, test_case) == expected
+
+
+def test_append_shares_last():
+    last = _list(2, 3)
+    assert handle('append', [_list(1), last]).value.cdr is last
+
+
+@pytest.mark.parametrize('op,test_case', [
+    ('nth', [_list(4, 5), V(VT.NUMBER, 2)]),
+    ('range', [V(VT.NUMBER, 1.5)]),
+    ('reverse', [V(VT.NUMBER, 1)]),
+    ('sort', [V.list_to_cons([V(VT.NUMBER, 1), V(VT.STRING, 'a')])]),
+])
+def test_list_library_errors(op, test_case):
+    with pytest.raises(RuntimeError):
+        handle(op, test_case)
+
+
+def test_memoize_lru():
+    calls = []
+
+    def call(fn, args):
+        calls.append(args[0].value)
+        return args[0]
+
+    fn = handle('memoize', [V(VT.LAMBDA, None), V(VT.NUMBER, 2)])
+    memoized = fn.value
+    for n in [1, 2, 1, 3, 2, 1]:
+        memoized.call([V(VT.NUMBER, n)], call)
+    # 2 was the least recently used when 3 was added, then 1 was
+    assert calls == [1, 2, 3, 2, 1]
+    assert handle('memo_hits', [fn]) == V(VT.NUMBER, 1)
+    assert handle('memo_misses', [fn]) == V(VT.NUMBER, 5)
+    assert handle('memo_size', [fn]) == V(VT.NUMBER, 2)
+
+    # lists can't be hashed, so calls with them are not cached
+    memoized.call([V.list_to_cons([V(VT.NUMBER, 1)])], call)
+    assert handle('memo_misses', [fn]) == V(VT.NUMBER, 5)
+
+    handle('memo_clear', [fn])
+    assert handle('memo_size', [fn]) == V(VT.NUMBER, 0)
+    assert handle('memo_hits', [fn]) == V(VT.NUMBER, 0)
+
+
+def test_memoize_number_types():
+    def call(fn, args):
+        return V(VT.NUMBER, args[0].value * 2)
+
+    fn = handle('memoize', [V(VT.LAMBDA, None)])
+    assert fn.value.call([V(VT.NUMBER, 1)], call).value.__class__ is int
+    # equal to 1, but not the same argument
+    result = fn.value.call([V(VT.NUMBER, 1.0)], call)
+    assert result.value.__class__ is float
+    assert handle('memo_misses', [fn]) == V(VT.NUMBER, 2)
+    assert fn.value.call([V(VT.NUMBER, 1.0)], call) is result
+    assert handle('memo_hits', [fn]) == V(VT.NUMBER, 1)
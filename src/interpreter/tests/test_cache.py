@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from interpreter import cache, pipeline
+from interpreter.evaluator import Environment
+from interpreter.types import Value as V, ValueType as VT
+
+
+SOURCE = '''
+(def f (lambda (x) (if (< x 1.5) true false))) ; comment
+(def l (quote (a () b -3)))
+(f 1)
+'''
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.lisp'
+    path.write_text(SOURCE)
+    return str(path)
+
+
+def _entries(directory):
+    return os.listdir(directory) if os.path.exists(directory) else []
+
+
+def test_load(source, tmp_path):
+    directory = str(tmp_path / 'cache')
+    expected = cache.parse(SOURCE)
+    assert cache.load(source, directory) == expected
+    assert len(_entries(directory)) == 1
+    # from the cache
+    assert cache.load(source, directory) == expected
+    assert len(_entries(directory)) == 1
+
+
+def test_cached_forms_are_used(source, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'cache')
+    cache.load(source, directory)
+    monkeypatch.setattr(cache, 'parse', None)
+    assert cache.load(source, directory) == cache.load(source, directory)
+
+
+def test_shared_values(source, tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache.load(source, directory)
+    forms = cache.load(source, directory)
+    assert forms[0].value.car is V.symbol('def')
+    assert forms[2].value.cdr.value.car is V.number(1)
+
+
+def test_invalidation(source, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'cache')
+    cache.load(source, directory)
+    with open(source, 'a') as f:
+        f.write('(f 2)')
+    assert len(cache.load(source, directory)) == 4
+    monkeypatch.setattr(cache, '_version', b'another version')
+    cache.load(source, directory)
+    assert len(_entries(directory)) == 3
+
+
+def test_corrupt_entry(source, tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache.load(source, directory)
+    entry, = _entries(directory)
+    with open(os.path.join(directory, entry), 'wb') as f:
+        f.write(b'\x00garbage')
+    assert cache.load(source, directory) == cache.parse(SOURCE)
+
+
+def test_unwritable_directory(source, tmp_path):
+    # a file where the directory should be
+    directory = tmp_path / 'cache'
+    directory.write_text('')
+    assert cache.load(source, str(directory)) == cache.parse(SOURCE)
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_run_file(source, tmp_path, engine):
+    for _ in range(2):
+        env = Environment()
+        env.begin_toplevel()
+        assert pipeline.run_file(
+            env, source, engine, str(tmp_path / 'cache'),
+        ) == V(VT.BOOLEAN, True)
@@ -0,0 +1,145 @@
+import pytest
+
+from interpreter import (
+    compiler, desugarizer, lexer, parser, preprocessor,
+)
+from interpreter.evaluator import Environment
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+def _parse(code):
+    code = preprocessor.remove_comments(code)
+    return [parser.parse(tree) for tree in desugarizer.desugar(lexer.lex(code))]
+
+
+def _run_tree_walker(code):
+    env = Environment()
+    env.begin_toplevel()
+    for node in _parse(code):
+        value = env.eval(node)
+    return value
+
+
+def _run_compiled(code):
+    env = Environment()
+    env.begin_toplevel()
+    for node in _parse(code):
+        value = compiler.compile_node(node)(env, None)
+    return value
+
+
+testdata = [
+    ('number', '3', V(VT.NUMBER, 3)),
+    ('arithmetic', '(+ 1 (* 2 3))', V(VT.NUMBER, 7)),
+    ('if', '(if (< 1 2) 4 6)', V(VT.NUMBER, 4)),
+    ('block', '((def x 4), (+ x 1))', V(VT.NUMBER, 5)),
+    ('list', '(list 1 2)', V.list_to_cons([V(VT.NUMBER, 1), V(VT.NUMBER, 2)])),
+    ('quote', "'x", V.list_to_cons([V(VT.STRING, 'quote'), V(VT.STRING, 'x')])),
+    ('eval', "(eval '(+ 1 2))", V(VT.NUMBER, 3)),
+    ('apply inlined lambda', '((lambda () 8))', V(VT.NUMBER, 8)),
+    ('set', '(def x 1) (set x 2) x', V(VT.NUMBER, 2)),
+    ('closure', '''
+        (def adder (lambda (a) (lambda (b) (+ a b))))
+        ((adder 3) 4)
+     ''', V(VT.NUMBER, 7)),
+    ('recursion', '''
+        (def fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+        (fib 10)
+     ''', V(VT.NUMBER, 55)),
+]
+
+
+@pytest.mark.parametrize('name,code,expected', testdata)
+def test_compiled(name, code, expected):
+    assert _run_compiled(code) == expected
+
+
+@pytest.mark.parametrize('name,code,expected', testdata)
+def test_matches_tree_walker(name, code, expected):
+    assert _run_compiled(code) == _run_tree_walker(code)
+
+
+lexical_testdata = [
+    ('caller locals are not visible', '''
+        (def f (lambda () y))
+        (def g (lambda (y) (f)))
+        (def y 1)
+        (g 2)
+     ''', V(VT.NUMBER, 1)),
+    ('shared captured frame', '''
+        (def counter (lambda () ((def n 0), (lambda () (set n (+ n 1))))))
+        (def c (counter))
+        (c)
+        (c)
+     ''', V(VT.NUMBER, 2)),
+    ('block scope', '''
+        (def x 1)
+        ((def x 2), x)
+        x
+     ''', V(VT.NUMBER, 1)),
+    ('def in lambda body', '((lambda (x) ((def x 5), x)) 6)', V(VT.NUMBER, 5)),
+    ('deep capture', '''
+        (def f (lambda (a) (lambda (b) (lambda (c) (list a b c)))))
+        (((f 1) 2) 3)
+     ''', V.list_to_cons([V(VT.NUMBER, 1), V(VT.NUMBER, 2), V(VT.NUMBER, 3)])),
+    ('eval sees locals', "((lambda (x) (eval '(+ x 1))) 1)", V(VT.NUMBER, 2)),
+    ('eval defines globals', "(eval '(def z 3)) z", V(VT.NUMBER, 3)),
+]
+
+
+@pytest.mark.parametrize('name,code,expected', lexical_testdata)
+def test_lexical_scope(name, code, expected):
+    assert _run_compiled(code) == expected
+
+
+def test_slots():
+    # one frame for the lambda; `y` is a global
+    node, = _parse('(lambda (a) ((def b a), (+ a b y)))')
+    closure = compiler.compile_node(node)(None, None).value
+    assert closure.function.scope.names == {'a': 1, 'b': 2}
+    assert closure.function.scope.resolve('y') is None
+
+
+@pytest.mark.parametrize('code', [
+    '(+ 1 y)',
+    '((lambda () ((set q 1), q)))',
+    '((lambda () ((def f (lambda () q)), (f), (def q 1))))',
+])
+def test_undefined_variable(code):
+    with pytest.raises(RuntimeError):
+        _run_compiled(code)
+
+
+def test_arity():
+    with pytest.raises(RuntimeError):
+        _run_compiled('((lambda (x) x) 1 2)')
+
+
+tail_call_testdata = [
+    ('self', '''
+        (def count (lambda (n) (if (= n 0) 'done (count (- n 1)))))
+        (count 100000)
+     ''', V.list_to_cons([V(VT.STRING, 'quote'), V(VT.STRING, 'done')])),
+    ('mutual', '''
+        (def even (lambda (n) (if (= n 0) true (odd (- n 1)))))
+        (def odd (lambda (n) (if (= n 0) false (even (- n 1)))))
+        (even 100001)
+     ''', V(VT.BOOLEAN, False)),
+    ('through block', '''
+        (def count (lambda (n) ((def m (- n 1)), (if (< m 0) n (count m)))))
+        (count 100000)
+     ''', V(VT.NUMBER, 0)),
+    ('prelude', '''
+        (def build (lambda (n acc) (if (= n 0) acc (build (- n 1) (cons n acc)))))
+        (def l (build 20000 nil))
+        (reduce (lambda (a b) (+ a b))
+                (map (lambda (x) (* x 2))
+                     (filter (lambda (x) (= (% x 2) 0)) l))
+                0)
+     ''', V(VT.NUMBER, 200020000)),
+]
+
+
+@pytest.mark.parametrize('name,code,expected', tail_call_testdata)
+def test_tail_calls(name, code, expected, run):
+    assert run(code, prelude=True) == expected
@@ -0,0 +1,122 @@
+import pytest
+
+from interpreter import pipeline
+from interpreter.evaluator import Environment
+from interpreter.instrumentation import (
+    InstrumentedEnvironment, Limits, LimitExceeded,
+)
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+def _environment(**limits):
+    env = InstrumentedEnvironment(limits=Limits(**limits))
+    env.begin_toplevel()
+    return env
+
+
+def test_counters():
+    env = _environment()
+    value = pipeline.run_code(env, '''
+    (def f (lambda (n acc) (if (= n 0) acc (f (- n 1) (cons n acc)))))
+    (f 10 (list 1))
+    (append (list 1 2) (range 3) (list 4))
+    (zip (list 1 2) (list 3 4))
+    (eval_counters)
+    ''', 'tree')
+    counters = env.counters
+    # 11 calls of f, 31 of the builtins in it, and 4 other builtins
+    assert counters.calls == 46
+    # 1 + 10 for f, 2 + 3 + 1 and 5 copied by append, 4 + 6 for zip
+    assert counters.conses == 32
+    # the top-level scope, and the scope of each call of f
+    assert counters.max_depth == 12
+    assert counters.seconds > 0
+    assert value == V.list_to_cons([
+        V(VT.NUMBER, counters.nodes), V(VT.NUMBER, counters.calls),
+        V(VT.NUMBER, counters.conses), V(VT.NUMBER, counters.max_depth),
+    ])
+
+    env.reset()
+    assert env.counters.nodes == 0
+    pipeline.run_code(env, '(+ 1 (* 2 3))', 'tree')
+    assert (env.counters.nodes, env.counters.calls) == (5, 2)
+
+
+LOOP = '''
+(def loop (lambda (n acc)
+    (if (= n 0) acc (loop (- n 1) (cons n acc)))))
+'''
+
+
+@pytest.mark.parametrize('limits,code,message', [
+    (dict(steps=1000), '(loop 1000000 (list))',
+        'Evaluated more than 1000 nodes'),
+    (dict(depth=50), '(loop 1000000 (list))',
+        'Scopes nested more than 50 deep'),
+    (dict(allocations=20), '(loop 1000000 (list))',
+        'Made more than 20 cons cells'),
+    # stopped before the list is built
+    (dict(allocations=20), '(range 100000000)',
+        'Would make more than 20 cons cells'),
+    (dict(allocations=20), '(map (lambda (x) x) (range 15))',
+        'Would make more than 20 cons cells'),
+    # runs for a long time without recursing
+    (dict(timeout=0.05), '''
+    (map (lambda (x) (map (lambda (y) (* x y)) (range 1000))) (range 1000))
+    ''', 'Ran for more than 0.05 seconds'),
+    (dict(), '(loop 1000000 (list))', 'Recursed too deeply'),
+])
+def test_limits(limits, code, message):
+    env = _environment(**limits)
+    pipeline.run_code(env, LOOP, 'tree')
+    with pytest.raises(LimitExceeded, match=message):
+        pipeline.run_code(env, code, 'tree')
+    assert isinstance(LimitExceeded(), RuntimeError)
+
+    # The environment can still be used.
+    assert len(env.scopes) == 1
+    env.limits = Limits()
+    env.reset()
+    assert pipeline.run_code(env, '(loop 3 (list))', 'tree') == \
+        V.list_to_cons([V(VT.NUMBER, n) for n in (1, 2, 3)])
+
+
+def test_timeout_is_not_checked_in_builtins():
+    env = _environment(timeout=0.001)
+    # one call of a builtin that takes longer than the timeout
+    assert pipeline.run_code(env, '(length (range 300000))', 'tree') == \
+        V(VT.NUMBER, 300000)
+    assert env.counters.seconds > 0.001
+    # but the next form to evaluate enough nodes is stopped
+    with pytest.raises(LimitExceeded, match='Ran for more than'):
+        pipeline.run_code(env, '(map (lambda (x) x) (range 1000))', 'tree')
+
+
+def test_limits_add_up():
+    # each one evaluates 3 nodes
+    env = _environment(steps=7)
+    pipeline.run_code(env, '(+ 1 2)', 'tree')
+    pipeline.run_code(env, '(+ 1 2)', 'tree')
+    with pytest.raises(LimitExceeded):
+        pipeline.run_code(env, '(+ 1 2)', 'tree')
+    env.reset()
+    pipeline.run_code(env, '(+ 1 2)', 'tree')
+
+
+def test_errors_drop_scopes():
+    env = _environment()
+    with pytest.raises(RuntimeError):
+        pipeline.run_code(env, '''
+        (def f (lambda (x) (car x)))
+        (f 1)
+        ''', 'tree')
+    assert len(env.scopes) == 1
+    pipeline.run_code(env, '(def y 2)', 'tree')
+    assert env.scopes[0]['y'] == V(VT.NUMBER, 2)
+
+
+def test_eval_counters_needs_instrumentation():
+    env = Environment()
+    env.begin_toplevel()
+    with pytest.raises(RuntimeError):
+        pipeline.run_code(env, '(eval_counters)', 'tree')
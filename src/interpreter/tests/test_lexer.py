@@ -1,21 +1,26 @@
 import pytest
 
 from interpreter.desugarizer import TokenTree, desugar
-from interpreter.lexer import lex, Token as T, TokenType as TT
+from interpreter.lexer import lex, InvalidToken, Token as T, TokenType as TT
+from interpreter.types import ParseError
 
 
 testdata = [
     ('', []),
-    ('\'();', [
-        T(TT.QUOTE), T(TT.OPEN_PAREN), T(TT.CLOSE_PAREN), 
-        T(TT.SEMICOLON),
+    ('\'(),', [
+        T(TT.QUOTE), T(TT.OPEN_PAREN), T(TT.CLOSE_PAREN), T(TT.THEN),
         ]),
     ('  ', []),
     (' 3.5 abc', [T(TT.NUMBER, 3.5), T(TT.STRING, 'abc')]),
-    ('abc;(', [
-        T(TT.STRING, 'abc'), T(TT.SEMICOLON), T(TT.OPEN_PAREN),
+    ('abc,(', [
+        T(TT.STRING, 'abc'), T(TT.THEN), T(TT.OPEN_PAREN),
         ]),
-] 
+    ('(!= a-b -1)', [
+        T(TT.OPEN_PAREN), T(TT.OPERATOR, '!='), T(TT.STRING, 'a-b'),
+        T(TT.NUMBER, -1), T(TT.CLOSE_PAREN),
+        ]),
+    ('x ; comment (\ny', [T(TT.STRING, 'x'), T(TT.STRING, 'y')]),
+]
 
 
 @pytest.mark.parametrize('test_case,expected', testdata)
@@ -24,8 +29,21 @@ def test_lexer(test_case, expected):
     assert actual == expected
 
 
+def test_positions():
+    tokens = lex('(a\n  ; (\n  bc 12)')
+    assert [(t.line, t.column) for t in tokens] == [
+        (1, 1), (1, 2), (3, 3), (3, 6), (3, 8),
+    ]
+
+
+def test_invalid_token():
+    with pytest.raises(InvalidToken) as e:
+        lex('a\n 3x')
+    assert (e.value.line, e.value.column) == (2, 2)
+
+
 desugar_testdata = [
-    ("(a; b; '(c 4); 'd)", [TokenTree([
+    ("(a, b, '(c 4), 'd)", [TokenTree([
         T(TT.STRING, 'block'),
         T(TT.STRING, 'a'),
         T(TT.STRING, 'b'),
@@ -42,6 +60,12 @@ desugar_testdata = [
         ])
     ])]),
     ("d f", [T(TT.STRING, 'd'), T(TT.STRING, 'f')]),
+    ("[1, (a b) []]", [TokenTree([
+        T(TT.STRING, 'vector'),
+        T(TT.NUMBER, 1),
+        TokenTree([T(TT.STRING, 'a'), T(TT.STRING, 'b')]),
+        TokenTree([T(TT.STRING, 'vector')]),
+    ])]),
     ("''x y", [TokenTree(
         [T(TT.STRING, 'quote'), TokenTree(
             [T(TT.STRING, 'quote'), T(TT.STRING, 'x')]
@@ -55,3 +79,10 @@ def test_desugar(test_case, expected):
     actual = desugar(lexed)
     assert actual == expected
 
+
+@pytest.mark.parametrize('test_case', [
+    '(a', 'a)', "(a ')", "'", '[a)', '(a]', '[a',
+])
+def test_desugar_errors(test_case):
+    with pytest.raises(ParseError):
+        desugar(lex(test_case))
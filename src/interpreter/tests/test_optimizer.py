@@ -0,0 +1,209 @@
+import pytest
+
+from interpreter import desugarizer, lexer, optimizer, parser, pipeline
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+def _parse(code):
+    tree, = desugarizer.desugar_iter(lexer.tokenize(code))
+    return parser.parse(tree)
+
+
+optimize_testdata = [
+    ('(+ 1 2)', '3'),
+    ('(+ 1 (* 2 3) (- 10 4))', '13'),
+    ('(/ 1 2)', '0.5'),
+    ('(< 1 2)', 'true'),
+    ('(&& (= 1 1) (! false))', 'true'),
+    ('(+ x (* 2 3))', '(+ x 6)'),
+    ('(if (< 1 2) a b)', 'a'),
+    ('(if false a (+ 1 1))', '2'),
+    ('(if c (+ 1 1) b)', '(if c 2 b)'),
+    ('(lambda (x) (* x (+ 1 1)))', '(lambda (x) (* x 2))'),
+    ('(def x (+ 1 1))', '(def x 2)'),
+    ('(set x (if true 1 2))', '(set x 1)'),
+    ('(f (+ 1 1) (list (+ 1 1)))', '(f 2 (list 2))'),
+    ('(block (f 1) (block (g 2) (h 3)) (block (k 4)))',
+        '(block (f 1) (g 2) (h 3) (k 4))'),
+    ('(block (block (block x)))', '(block x)'),
+    # blocks that define names keep their scope
+    ('(block (f 1) (block (def x 1) x))', '(block (f 1) (block (def x 1) x))'),
+    ('(block (block (if c (def x 1) 0)) x)',
+        '(block (block (if c (def x 1) 0)) x)'),
+    ('(block (block (eval y)) x)', '(block (block (eval y)) x)'),
+    ('(block (block (lambda () (def x 1))) x)',
+        '(block (lambda () (def x 1)) x)'),
+    ('(block (block (block (def x 1))) x)', '(block (block (def x 1)) x)'),
+    # quoted forms are left as they are
+    ("(eval '(+ 1 2))", "(eval '(+ 1 2))"),
+    # folds that would fail are left for evaluation
+    ('(/ 1 0)', '(/ 1 0)'),
+    ('(car 1)', '(car 1)'),
+    ('(< 1 2 3)', '(< 1 2 3)'),
+    ('(if 1 a b)', '(if 1 a b)'),
+    ('(** 2 100000)', '(** 2 100000)'),
+    ('(** 2 10)', '1024'),
+]
+
+
+@pytest.mark.parametrize('code,expected', optimize_testdata)
+def test_optimize(code, expected):
+    assert optimizer.optimize(_parse(code)) == _parse(expected)
+
+
+def test_unchanged_forms_are_shared():
+    node = _parse('(lambda (x) (block (f x) (g (+ x 1))))')
+    assert optimizer.optimize(node) is node
+    node = _parse('(block (f 1) (block (g (+ 1 2))))')
+    before = str(node)
+    optimizer.optimize(node)
+    assert str(node) == before
+
+
+PROGRAM = '''
+(def scale (lambda (x) (* x (* 2 (+ 1 2)))))
+(def pick (lambda (x) (if (< 1 2) (block (scale x) (block (+ x (- 10 9)))) 0)))
+(def total 0)
+(block (set total (+ total (pick 1))) (block (set total (+ total (pick 2)))))
+(list total (scale 3) (if (> 1 2) (car 1) (** 2 10)))
+'''
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_same_results(engine, make_env):
+    assert pipeline.run_code(make_env(), PROGRAM, engine, optimize=True) == \
+        pipeline.run_code(make_env(), PROGRAM, engine) == \
+        V.list_to_cons([V(VT.NUMBER, n) for n in (5, 18, 1024)])
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_errors_are_deferred(engine, make_env):
+    env = make_env()
+    pipeline.run_code(env, '(def f (lambda (x) (if x (/ 1 0) 1)))', engine,
+                      optimize=True)
+    assert pipeline.run_code(env, '(f false)', engine, optimize=True) == \
+        V(VT.NUMBER, 1)
+    with pytest.raises((RuntimeError, ZeroDivisionError)):
+        pipeline.run_code(env, '(f true)', engine, optimize=True)
+
+
+def _parse_all(code):
+    return [parser.parse(tree)
+            for tree in desugarizer.desugar_iter(lexer.tokenize(code))]
+
+
+HELPERS = '''
+(def square (lambda (x) (* x x)))
+(def inc (lambda (x) (+ x 1)))
+(def total 0)
+(def bump (lambda (x) (set total (+ total x))))
+(def fact (lambda (n) (if (< n 2) 1 (* n (fact (- n 1))))))
+(def pair (lambda (a b) (cons a b)))
+(def safe (lambda (x) (if (= x 0) 0 (/ 1 x))))
+'''
+
+inline_testdata = [
+    ('(square 3)', '(* 3 3)', {'square': 1}),
+    ('(square y)', '(* y y)', {'square': 1}),
+    ('(square (inc y))', '(* (+ y 1) (+ y 1))', {'square': 1, 'inc': 1}),
+    ('(inc (car y))', '(+ (car y) 1)', {'inc': 1}),
+    ('(pair (f 1) (g 2))', '(cons (f 1) (g 2))', {'pair': 1}),
+    ('(lambda (y) (square y))', '(lambda (y) (* y y))', {'square': 1}),
+    # later functions are inlined with what they inlined
+    ('(def f (lambda (y) (inc (inc y)))) (f 1)',
+        '(def f (lambda (y) (+ (+ y 1) 1))) (+ (+ 1 1) 1)',
+        {'inc': 2, 'f': 1}),
+    # arguments with effects would be evaluated more than once, in another
+    # order, or only sometimes
+    ('(square (car y))', '(square (car y))', {}),
+    ('(pair (f 1) 2) (def swap (lambda (a b) (cons b a))) (swap (f 1) (g 2))',
+        '(cons (f 1) 2) (def swap (lambda (a b) (cons b a))) (swap (f 1) (g 2))',
+        {'pair': 1}),
+    ('(safe (f 1))', '(safe (f 1))', {}),
+    # or after the body reads a variable they may change
+    ('(def n 0) (def f (lambda (a) (+ n a))) (def g (lambda (a) (+ a n)))'
+     ' (f (bump 1)) (g (bump 1))',
+        '(def n 0) (def f (lambda (a) (+ n a))) (def g (lambda (a) (+ a n)))'
+        ' (f (bump 1)) (+ (bump 1) n)', {'g': 1}),
+    ('(def h (lambda (a) (+ (car total) a))) (h (bump 1))',
+        '(def h (lambda (a) (+ (car total) a))) (h (bump 1))', {}),
+    ('(safe y)', '(if (= y 0) 0 (/ 1 y))', {'safe': 1}),
+    # functions with effects, recursive ones, and ones that are set
+    ('(bump 1) (fact 3)', '(bump 1) (fact 3)', {}),
+    ('(square 2) (set square inc)', '(square 2) (set square inc)', {}),
+    ("(square 2) (eval '(set square inc))", "(square 2) (eval '(set square inc))",
+        {}),
+    # variables of the body that the caller binds
+    ('(def scale (lambda (x) (* x total))) (lambda (total) (scale 2)) (scale 2)',
+        '(def scale (lambda (x) (* x total))) (lambda (total) (scale 2))'
+        ' (* 2 total)', {'scale': 1}),
+    ('(inc 1 2) (square)', '(inc 1 2) (square)', {}),
+    # calls of builtins and keywords go to them, whatever is def'd
+    ('(def abs (lambda (x) (+ x 100))) (abs 1)',
+        '(def abs (lambda (x) (+ x 100))) (abs 1)', {}),
+    ('(def list (lambda (x) (+ x 1))) (list 1)',
+        '(def list (lambda (x) (+ x 1))) (list 1)', {}),
+]
+
+
+@pytest.mark.parametrize('code,expected,inlined', inline_testdata)
+def test_inline(code, expected, inlined):
+    inliner = optimizer.Inliner()
+    helpers = _parse_all(HELPERS)
+    assert inliner.inline(helpers + _parse_all(code))[len(helpers):] == \
+        _parse_all(expected)
+    assert inliner.inlined == inlined
+
+
+def test_inline_size():
+    code = '(def f (lambda (x) (+ x (+ x (+ x 1))))) (f 1)'
+    assert optimizer.Inliner(7).inline(_parse_all(code))[1] == \
+        _parse('(+ 1 (+ 1 (+ 1 1)))')
+    assert optimizer.Inliner(6).inline(_parse_all(code))[1] == _parse('(f 1)')
+    # copies of arguments count too
+    code = '(def sq (lambda (x) (* x x))) (sq (sq (sq (sq y))))'
+    assert optimizer.Inliner(8).inline(_parse_all(code))[1] == \
+        _parse('(sq (sq (* (* y y) (* y y))))')
+
+
+def test_inline_report():
+    inliner = optimizer.Inliner()
+    inliner.inline(_parse_all(HELPERS + '(square (inc 1)) (inc 2)'))
+    assert inliner.report().splitlines()[1:] == [
+        f'{"inc":<24} {2:>13}', f'{"square":<24} {1:>13}',
+    ]
+
+
+INLINED_PROGRAM = HELPERS + '''
+(def norm (lambda (a b) (+ (square a) (square b))))
+(def step (lambda (x) (block (bump x) (safe (inc x)))))
+(list (norm 3 4) (map (lambda (x) (norm x (inc x))) (list 1 2))
+      (step 1) (step -1) total (pair (step 2) (step 3)) total)
+'''
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+@pytest.mark.parametrize('optimize', [False, True])
+def test_inlined_results(engine, optimize, make_env):
+    inliner = optimizer.Inliner()
+    assert pipeline.run_code(
+        make_env(), INLINED_PROGRAM, engine, optimize, inliner,
+    ) == pipeline.run_code(make_env(), INLINED_PROGRAM, engine)
+    assert inliner.inlined['square'] == 2
+
+
+EFFECT_ORDER = '''
+(def n 0)
+(def f (lambda (a) (+ n a)))
+(def bump (lambda () (set n (+ n 1))))
+(f (bump))
+'''
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_inlining_keeps_effect_order(engine, make_env):
+    inliner = optimizer.Inliner()
+    env = make_env()
+    assert pipeline.run_code(env, EFFECT_ORDER, engine, False, inliner) == \
+        V(VT.NUMBER, 2)
+    assert not inliner.inlined
@@ -0,0 +1,64 @@
+import pytest
+
+from interpreter import parallel, pipeline
+from interpreter.evaluator import Environment
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(parallel, 'PROCESSES', 2)
+    yield
+    parallel.shutdown()
+
+
+def _numbers(*ns):
+    return V.list_to_cons([V(VT.NUMBER, n) for n in ns])
+
+
+@pytest.mark.parametrize('engine', ['closure', 'vm', 'tree'])
+@pytest.mark.parametrize('code,expected', [
+    ('(pmap (lambda (x) (* x x)) (range 10))',
+        _numbers(*[x * x for x in range(10)])),
+    ('(pmap (lambda (x) (* x x)) (range 10) 3)',
+        _numbers(*[x * x for x in range(10)])),
+    ('(pmap (lambda (x) x) (list))', V(VT.NIL)),
+    # globals, and the variables of enclosing functions
+    ('''
+    (def k 10)
+    (def g (lambda (x) (+ x k)))
+    ((lambda (y) (pmap (lambda (x) (* (g x) y)) (range 5) 1)) 2)
+    ''', _numbers(20, 22, 24, 26, 28)),
+    # pmap in the workers runs there
+    ('''
+    (pmap (lambda (x) (pmap (lambda (y) (+ x y)) (list 1 2))) (list 10 20) 1)
+    ''', V.list_to_cons([_numbers(11, 12), _numbers(21, 22)])),
+    ('''
+    (def fib (memoize (lambda (n)
+        (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))))
+    (pmap fib (range 6 10) 1)
+    ''', _numbers(8, 13, 21, 34)),
+])
+def test_pmap(engine, code, expected, run):
+    assert run(code, engine) == expected
+
+
+@pytest.mark.parametrize('engine', ['closure', 'vm', 'tree'])
+@pytest.mark.parametrize('code', [
+    '(pmap (lambda (x) (car x)) (range 10) 2)',
+    '(pmap 1 (range 10))',
+    '(pmap (lambda (x) x) (range 10) 0)',
+])
+def test_pmap_errors(engine, code, run):
+    with pytest.raises(RuntimeError):
+        run(code, engine)
+
+
+def test_workers_changes_are_not_seen():
+    env = Environment()
+    env.begin_toplevel()
+    assert pipeline.run_code(env, '''
+    (def count 0)
+    (pmap (lambda (x) (set count (+ count x))) (range 10) 2)
+    count
+    ''') == V(VT.NUMBER, 0)
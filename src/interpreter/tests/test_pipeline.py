@@ -0,0 +1,167 @@
+import io
+
+import pytest
+
+from interpreter import lexer, pipeline
+from interpreter.types import (
+    Value as V, ValueType as VT, ParseError, RuntimeError,
+)
+
+
+SOURCE = '''
+(def square (lambda (x) (* x x))) ; a comment (
+(def total 0)
+(set total (+ total (square 12)))
+(set total (+ total (square 3.5)))
+total
+'''
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1000])
+def test_tokenize_chunks(chunk_size):
+    chunks = [
+        SOURCE[i:i + chunk_size] for i in range(0, len(SOURCE), chunk_size)
+    ]
+    expected = [(t, t.line, t.column) for t in lexer.tokenize(SOURCE)]
+    actual = [(t, t.line, t.column) for t in lexer.tokenize_chunks(chunks)]
+    assert actual == expected
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_run_stream(engine, make_env):
+    env = make_env()
+    assert pipeline.run_stream(env, io.StringIO(SOURCE), engine) == \
+        V(VT.NUMBER, 156.25)
+
+
+def test_run_stream_chunks(make_env):
+    env = make_env()
+    chunks = iter(SOURCE.split('('))
+    chunks = (c if i == 0 else '(' + c for i, c in enumerate(chunks))
+    assert pipeline.run_stream(env, chunks) == V(VT.NUMBER, 156.25)
+
+
+def test_run_stream_evaluates_as_it_reads(make_env):
+    env = make_env()
+    with pytest.raises(ParseError):
+        pipeline.run_stream(env, io.StringIO('(def x 1) (def y 2) (def z'))
+    assert env.lookup('y') == V(VT.NUMBER, 2)
+
+
+def test_run_code_parses_first(make_env):
+    env = make_env()
+    with pytest.raises(ParseError):
+        pipeline.run_code(env, '(def x 1) (def y 2) (def z')
+    assert env.scopes[0] == {}
+
+
+def test_empty(make_env):
+    assert pipeline.run_stream(make_env(), io.StringIO('; nothing')) == \
+        V(VT.NIL)
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_vector_literal(engine, make_env):
+    source = '''
+    (def v [1 (+ 1 1) 'x])
+    (vector_set v 2 3)
+    (vector_push v (length v))
+    '''
+    env = make_env()
+    assert pipeline.run_stream(env, io.StringIO(source), engine) == V(
+        VT.VECTOR, [V(VT.NUMBER, n) for n in (1, 2, 3, 3)]
+    )
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_hashmap(engine, make_env):
+    source = '''
+    (def counts (hashmap))
+    (def count (lambda (words)
+        (if (> (length words) 0)
+            (block
+                (hashmap_put counts (car words)
+                    (+ 1 (hashmap_get counts (car words) 0)))
+                (count (cdr words)))
+            counts)))
+    (count (list 1 2 1.0))
+    (hashmap_get counts 1)
+    '''
+    env = make_env()
+    assert pipeline.run_stream(env, io.StringIO(source), engine) == \
+        V(VT.NUMBER, 2)
+
+
+higher_order_testdata = [
+    ('(map (lambda (x) (* x x)) (range 4))', '(list 0 1 4 9)'),
+    ('(filter (lambda (x) (> x 1)) (list 3 1 2))', '(list 3 2)'),
+    ('(reduce (lambda (a b) (- a b)) (list 1 2) 10)', '7'),
+    ('(foldr (lambda (a b) (- a b)) (list 1 2) 10)', '9'),
+    ('(foldr (lambda (x l) (cons x l)) (list 1 2) (list))', '(list 1 2)'),
+    ('(sort (list 1 3 2) (lambda (a b) (> a b)))', '(list 3 2 1)'),
+    # calls closures that capture local variables
+    ('((lambda (n) (map (lambda (x) (+ x n)) (list 1 2))) 10)', '(list 11 12)'),
+    # long lists don't use up the stack
+    ('(length (map (lambda (x) x) (range 100000)))', '100000'),
+]
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+@pytest.mark.parametrize('code,expected', higher_order_testdata)
+def test_higher_order_builtins(engine, code, expected, make_env):
+    env = make_env()
+    assert pipeline.run_code(env, code, engine) == \
+        pipeline.run_code(env, expected, engine)
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_higher_order_builtin_errors(engine, make_env):
+    with pytest.raises(RuntimeError):
+        pipeline.run_code(
+            make_env(), '(filter (lambda (x) 1) (list 1))', engine,
+        )
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_memoize(engine, make_env):
+    source = '''
+    (def fib (memoize (lambda (n)
+        (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))))
+    (def result (fib 60))
+    (list result (memo_hits fib) (memo_misses fib) (memo_size fib))
+    '''
+    env = make_env()
+    assert pipeline.run_stream(env, io.StringIO(source), engine) == \
+        V.list_to_cons([V(VT.NUMBER, n) for n in (1548008755920, 58, 61, 61)])
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_memoize_tail_call(engine, make_env):
+    source = '''
+    (def square (memoize (lambda (x) (* x x))))
+    (def f (lambda (x) (square x)))
+    (list (f 3) (f 3) (memo_hits square))
+    '''
+    env = make_env()
+    assert pipeline.run_stream(env, io.StringIO(source), engine) == \
+        V.list_to_cons([V(VT.NUMBER, n) for n in (9, 9, 1)])
+
+
+closure_testdata = [
+    ('(def add (lambda (a) (lambda (b) (lambda (c) (+ a (+ b c))))))'
+     ' (((add 1) 2) 3)', V(VT.NUMBER, 6)),
+    # a closure returned through another function keeps what it captured
+    ('(def identity (lambda (f) f))'
+     ' (def make_adder (lambda (n) (lambda (x) (+ x n))))'
+     ' (def g ((lambda (n) (identity (make_adder n))) 5))'
+     ' ((lambda (n) (g 1)) 100)', V(VT.NUMBER, 6)),
+    ('(def make_adder (lambda (n) (lambda (x) (+ x n))))'
+     ' (map (lambda (f) (f 1)) (map make_adder (list 1 2 3)))',
+     V.list_to_cons([V(VT.NUMBER, n) for n in (2, 3, 4)])),
+]
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+@pytest.mark.parametrize('code,expected', closure_testdata)
+def test_closures(engine, code, expected, make_env):
+    assert pipeline.run_code(make_env(), code, engine) == expected
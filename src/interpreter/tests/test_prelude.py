@@ -0,0 +1,125 @@
+import concurrent.futures
+
+import pytest
+
+from interpreter import parallel, pipeline, snapshot
+from interpreter.evaluator import Overlay, Prelude
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+SETUP = '''
+(def total 0)
+(def square (lambda (x) (* x x)))
+(def identity (lambda (x) x))
+(def make_adder (lambda (n) (lambda (x) (+ x n))))
+(def fib (memoize (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))))
+'''
+
+
+@pytest.fixture
+def make_prelude(make_env):
+    def make_prelude(engine):
+        env = make_env(engine)
+        pipeline.run_code(env, SETUP, engine)
+        return Prelude.freeze(env)
+    return make_prelude
+
+
+def test_overlay():
+    base = {'a': V(VT.NUMBER, 1)}
+    overlay = Overlay(base)
+    assert 'a' in overlay and 'b' not in overlay
+    assert overlay['a'] == V(VT.NUMBER, 1)
+    overlay['a'] = V(VT.NUMBER, 2)
+    assert overlay['a'] == V(VT.NUMBER, 2)
+    assert base['a'] == V(VT.NUMBER, 1)
+    with pytest.raises(KeyError):
+        overlay['b']
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_environments_are_separate(engine, make_prelude):
+    prelude = make_prelude(engine)
+    a = prelude.environment()
+    b = prelude.environment()
+    pipeline.run_code(a, '(def mine 1) (set total 5) (set square 0)', engine)
+    assert pipeline.run_code(a, '(list mine total)', engine) == \
+        V.list_to_cons([V(VT.NUMBER, 1), V(VT.NUMBER, 5)])
+
+    assert pipeline.run_code(b, '(list total (square 3))', engine) == \
+        V.list_to_cons([V(VT.NUMBER, 0), V(VT.NUMBER, 9)])
+    with pytest.raises(RuntimeError):
+        pipeline.run_code(b, 'mine', engine)
+    assert prelude.globals['total'] == V(VT.NUMBER, 0)
+    with pytest.raises(TypeError):
+        prelude.globals['total'] = V(VT.NUMBER, 1)
+
+
+def test_shared_lambdas_are_not_changed(make_prelude):
+    prelude = make_prelude('tree')
+    square = prelude.globals['square'].value
+    env = prelude.environment()
+    pipeline.run_code(env, '(def f ((lambda (y) (identity square)) 2))', 'tree')
+    assert pipeline.run_code(env, '(f 3)', 'tree') == V(VT.NUMBER, 9)
+    assert square.scope is None
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_threads(engine, make_prelude):
+    prelude = make_prelude(engine)
+
+    def run(i):
+        env = prelude.environment()
+        return pipeline.run_code(env, f'''
+        (def mine {i})
+        (set total (+ total mine))
+        (def add (make_adder mine))
+        (list total (add 1) (square mine) (fib 15))
+        ''', engine)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(run, range(200)))
+    assert results == [
+        V.list_to_cons([V(VT.NUMBER, n) for n in (i, i + 1, i * i, 610)])
+        for i in range(200)
+    ]
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_pmap(engine, monkeypatch, make_prelude):
+    monkeypatch.setattr(parallel, 'PROCESSES', 2)
+    env = make_prelude(engine).environment()
+    try:
+        assert pipeline.run_code(env, '''
+        (def k 10)
+        (pmap (lambda (x) (+ (square x) k)) (range 20))
+        ''', engine) == \
+            V.list_to_cons([V(VT.NUMBER, x * x + 10) for x in range(20)])
+    finally:
+        parallel.shutdown()
+
+
+def test_snapshot(make_prelude):
+    env = make_prelude('tree').environment()
+    pipeline.run_code(env, '(def mine 3) (set total 5)', 'tree')
+    restored = snapshot.loads(snapshot.dumps(env))
+    assert pipeline.run_code(
+        restored, '(list mine total (square 4))', 'tree',
+    ) == V.list_to_cons([V(VT.NUMBER, n) for n in (3, 5, 16)])
+    # the prelude's globals are still shared, and can't be changed
+    assert isinstance(restored.scopes[0], Overlay)
+    with pytest.raises(TypeError):
+        restored.scopes[0].base['total'] = V(VT.NUMBER, 1)
+
+
+def test_freeze_overlay(make_prelude):
+    env = make_prelude('tree').environment()
+    pipeline.run_code(env, '(def mine 3) (set total 5)', 'tree')
+    prelude = Prelude.freeze(env)
+    assert prelude.globals['mine'] == V(VT.NUMBER, 3)
+    assert prelude.globals['total'] == V(VT.NUMBER, 5)
+    # from the prelude it was made from, though never read through `env`
+    assert 'make_adder' in prelude.globals
+    assert pipeline.run_code(
+        prelude.environment(), '(+ mine (square total))', 'tree',
+    ) == V(VT.NUMBER, 28)
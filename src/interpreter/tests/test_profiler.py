@@ -0,0 +1,102 @@
+import itertools
+
+import pytest
+
+from interpreter import pipeline, profiler
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+def _profile(code):
+    env = profiler.ProfilingEnvironment()
+    # each reading of the clock is one second later
+    env.profiler.clock = itertools.count().__next__
+    env.begin_toplevel()
+    return env, pipeline.run_code(env, code, 'tree')
+
+
+def test_calls():
+    env, value = _profile('''
+    (def fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+    (def square (lambda (x) (* x x)))
+    (set square square)
+    (map square (list 1 2 3))
+    (fib 5)
+    ''')
+    assert value == V(VT.NUMBER, 5)
+    calls = {name: s.calls for name, s in env.profiler.functions.items()}
+    assert calls == {
+        'fib': 15, '<': 15, '-': 14, '+': 7, 'map': 1, 'square': 3, '*': 3,
+    }
+
+
+def test_times():
+    env, _ = _profile('''
+    (def inner (lambda (x) x))
+    (def outer (lambda (x) (inner (inner x))))
+    (def count (lambda (n) (if (= n 0) 0 (count (- n 1)))))
+    (outer 1)
+    (count 1)
+    ''')
+    functions = env.profiler.functions
+    # enters at 0, 1 and 3, exits at 2, 4 and 5
+    assert (functions['outer'].inclusive, functions['outer'].exclusive) == \
+        (5, 3)
+    assert (functions['inner'].inclusive, functions['inner'].exclusive) == \
+        (2, 2)
+    # Recursive calls only count towards the inclusive time once.
+    count = functions['count']
+    assert count.calls == 2
+    assert count.inclusive == sum(s for names, s in env.profiler.stacks()
+                                  if names[0] == 'count')
+    assert count.exclusive < count.inclusive
+
+    assert list(env.profiler.stacks())[:2] == [
+        (('outer',), 3), (('outer', 'inner'), 2),
+    ]
+    assert env.profiler.collapsed().splitlines()[:2] == [
+        'outer 3000000', 'outer;inner 2000000',
+    ]
+
+
+def test_names():
+    env, _ = _profile('''
+    (def adder (lambda (n) (lambda (x) (+ x n))))
+    (def add5 (adder 5))
+    (def fib (memoize (lambda (n)
+        (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))))
+    (add5 1)
+    ((lambda (x) x) 1)
+    (fib 10)
+    ''')
+    calls = {name: s.calls for name, s in env.profiler.functions.items()}
+    assert calls['adder'] == 1
+    assert calls['add5'] == 1
+    assert calls['<lambda>'] == 1
+    # only the calls that missed the cache
+    assert calls['fib'] == 11
+
+
+def test_errors():
+    env = profiler.ProfilingEnvironment()
+    env.begin_toplevel()
+    with pytest.raises(RuntimeError):
+        pipeline.run_code(env, '''
+        (def f (lambda (x) (car x)))
+        (f 1)
+        ''', 'tree')
+    # the calls that were in progress are finished
+    assert env.profiler.functions['f'].calls == 1
+    assert pipeline.run_code(env, '(f (list 2))', 'tree') == V(VT.NUMBER, 2)
+    assert [names for names, _ in env.profiler.stacks()][:2] == \
+        [('f',), ('f', 'car')]
+
+
+def test_table(tmp_path):
+    env, _ = _profile('(def f (lambda (x) (+ x 1))) (f 1)')
+    lines = env.profiler.table().splitlines()
+    assert lines[0].split()[:2] == ['function', 'calls']
+    assert [line.split()[:2] for line in lines[1:]] == [['f', '1'], ['+', '1']]
+    path = str(tmp_path / 'stacks.txt')
+    env.profiler.save_collapsed(path)
+    with open(path) as f:
+        assert f.read() == 'f 2000000\nf;+ 1000000\n'
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+SRC = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+RUN = os.path.join(SRC, 'run.py')
+
+
+def _run(*args):
+    return subprocess.run(
+        [sys.executable, RUN, *args], capture_output=True, text=True,
+        check=True,
+    )
+
+
+@pytest.mark.parametrize('engine', ['closure', 'vm', 'tree'])
+def test_expression(engine):
+    result = _run('--engine', engine, '-e', '(def x 4) (+ x (length (list 1 2)))')
+    assert result.stdout == '6\n'
+
+
+def test_file(tmp_path):
+    path = tmp_path / 'program.lisp'
+    path.write_text('(def square (lambda (x) (* x x)))\n(square 7) ; done\n')
+    assert _run(str(path)).stdout == '49\n'
+    assert _run('--no-builtins', str(path)).stdout == '49\n'
+    assert _run('-O', str(path)).stdout == '49\n'
+
+
+def test_inline(tmp_path):
+    path = tmp_path / 'program.lisp'
+    path.write_text('(def square (lambda (x) (* x x)))\n(square (square 3))\n')
+    for args in [(str(path),), ('-e', path.read_text())]:
+        result = _run('--inline', *args)
+        assert result.stdout == '81\n'
+        assert result.stderr.splitlines()[1].split() == ['square', '2']
+    result = _run('--inline', '--inline-size', '2', str(path))
+    assert result.stdout == '81\n'
+    assert len(result.stderr.splitlines()) == 1
+
+
+def test_startup_time():
+    result = _run('--startup-time', '-e', '1')
+    assert result.stdout == '1\n'
+    stages = [line.split()[0] for line in result.stderr.splitlines()[1:]]
+    assert stages == ['imports', 'builtins', 'program', 'total']
+
+
+def test_lean_imports():
+    # Running code with the default engine doesn't import the REPL, the CLI,
+    # the VM or the disk cache.
+    code = (
+        'import sys, runpy; '
+        f'sys.argv = ["run.py", "-e", "(+ 1 2)"]; '
+        f'runpy.run_path({RUN!r}, run_name="__main__"); '
+        'print(sorted(m for m in ["click", "readline", "interpreter.vm", '
+        '"interpreter.cache", "numpy"] if m in sys.modules))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True,
+        check=True, cwd=SRC,
+    )
+    assert result.stdout == '3\n[]\n'
+
+
+def test_profile(tmp_path):
+    path = str(tmp_path / 'stacks.txt')
+    result = _run('--profile', path, '-e',
+                  '(def f (lambda (x) (* x x))) (map f (range 3))')
+    assert result.stdout == '(0 : (1 : (4 : nil)))\n'
+    assert 'f ' in result.stderr
+    with open(path) as f:
+        assert 'map;f' in {line.rsplit(' ', 1)[0] for line in f}
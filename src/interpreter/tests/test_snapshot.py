@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from interpreter import pipeline, snapshot
+from interpreter.types import Value as V, ValueType as VT
+
+
+SETUP = '''
+(def cycle (list 1 2 3))
+(set_cdr (cdr (cdr cycle)) cycle)
+(def shared (list 4 5))
+(def pair (cons shared shared))
+(def make_adder (lambda (n) (lambda (x) (+ x n))))
+(def add3 (make_adder 3))
+(def items [1])
+(def table (hashmap 1 [2 3] 4 (int_vector 5 6)))
+(def fib (memoize (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))))
+(fib 10)
+(def long (range 5000))
+'''
+
+snapshot_testdata = [
+    ('(car (cdr (cdr (cdr cycle))))', '1'),
+    ('((set_car (car pair) 7), (car (cdr pair)))', '7'),
+    ('(add3 4)', '7'),
+    ('((vector_push items 2), (length items))', '2'),
+    ('(vector_get (hashmap_get table 1) 1)', '3'),
+    ('(vector_get (hashmap_get table 4) 1)', '6'),
+    ('((fib 12), (list (memo_hits fib) (memo_misses fib)))', '(list 11 13)'),
+    ('(reduce (lambda (a b) (+ a b)) long 0)', '12497500'),
+    ('(map (lambda (x) (* x 2)) (list 1 2))', '(list 2 4)'),
+]
+
+
+@pytest.fixture
+def setup_env(make_env):
+    def setup_env(engine):
+        env = make_env(engine)
+        pipeline.run_code(env, SETUP, engine)
+        return env
+    return setup_env
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+@pytest.mark.parametrize('code,expected', snapshot_testdata)
+def test_restore(engine, code, expected, setup_env):
+    restored = snapshot.loads(snapshot.dumps(setup_env(engine)))
+    assert pipeline.run_code(restored, code, engine) == \
+        pipeline.run_code(setup_env(engine), code, engine)
+    assert pipeline.run_code(setup_env(engine), code, engine) == \
+        pipeline.run_code(setup_env(engine), expected, engine)
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_restore_is_independent(engine, setup_env):
+    env = setup_env(engine)
+    restored = snapshot.loads(snapshot.dumps(env))
+    pipeline.run_code(restored, '(vector_push items 2)', engine)
+    assert pipeline.run_code(env, '(length items)', engine) == V(VT.NUMBER, 1)
+
+
+def test_restore_in_another_process(tmp_path, setup_env):
+    path = tmp_path / 'image'
+    with open(path, 'wb') as f:
+        snapshot.dump(setup_env('closure'), f)
+    code = (
+        'import sys\n'
+        'from interpreter import pipeline, snapshot\n'
+        f'env = snapshot.load(open({str(path)!r}, "rb"))\n'
+        'print(pipeline.run_code(env, "(+ (add3 1) (fib 15))"))\n'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], check=True, capture_output=True,
+        text=True, cwd=os.path.dirname(os.path.dirname(pipeline.__file__)),
+    ).stdout
+    assert output == '614\n'
+
+
+@pytest.mark.parametrize('data', [b'', b'junk', snapshot.marshal.dumps(
+    (snapshot._FORMAT, (), ()),
+)])
+def test_bad_images(data):
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.loads(data)
+
+
+@pytest.mark.parametrize('engine', sorted(pipeline.ENGINES))
+def test_objects(engine, setup_env):
+    env = setup_env(engine)
+    add3 = env.scopes[0]['add3']
+    fn, items = snapshot.loads_object(
+        snapshot.dumps_object((add3, [V(VT.NUMBER, 1), env.scopes[0]['pair']]))
+    )
+    assert pipeline.call(env, fn, [items[0]], engine) == V(VT.NUMBER, 4)
+    assert items[1] == env.scopes[0]['pair']
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.loads(snapshot.dumps_object(items))
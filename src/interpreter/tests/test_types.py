@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 
 from interpreter.types import (
@@ -17,3 +19,68 @@ def test_list(op, test_case):
 
     for from_cons, from_list in zip(cons, test_case):
         assert from_cons.value.car == from_list, (from_cons, from_list)
+
+
+def test_shared_instances():
+    assert V.number(3) is V.number(3)
+    assert V.number(3) == V(VT.NUMBER, 3)
+    assert V.number(10 ** 6) == V(VT.NUMBER, 10 ** 6)
+    # not confused with the equal float or bool
+    assert V.number(1.0).value.__class__ is float
+    assert V.boolean(True) is V.boolean(1 == 1)
+    assert V.symbol('abc') is V.symbol('abc')
+    assert Cons().car is Cons().cdr
+
+
+def test_cons_is_value():
+    cons = Cons(V.number(1), V.number(2))
+    assert cons.variant == VT.CONS
+    assert cons.value is cons
+    assert cons == V(VT.CONS, Cons(V.number(1), V.number(2)))
+    assert cons != Cons(V.number(1), V.number(3))
+    # only the two slots it uses, and none from Value
+    assert sys.getsizeof(cons) <= sys.getsizeof(object()) + 2 * 8 + 16
+    assert not hasattr(cons, '__weakref__') and not hasattr(cons, '__dict__')
+
+
+def test_long_list():
+    values = [V.number(i) for i in range(100000)]
+    assert V.list_to_cons(values) == V.list_to_cons(values)
+    assert len(V.list_to_cons(values)) == 100000
+    assert str(V.list_to_cons(values)).startswith('(0 : (1 : ')
+
+
+@pytest.mark.parametrize('value,expected', [
+    (V.number(0), False),
+    (V.number(2), True),
+    (V.symbol(''), False),
+    (V.boolean(False), False),
+    (V(VT.NIL), False),
+    (Cons(), True),
+])
+def test_truthiness(value, expected):
+    assert bool(value) == expected
+
+
+def test_cyclic_lists_are_compared():
+    def cycle(*ns):
+        cells = V.list_to_cons([V.number(n) for n in ns])
+        last = cells
+        while last.cdr.variant == VT.CONS:
+            last = last.cdr
+        last.cdr = cells
+        return cells
+
+    assert cycle(1, 2) == cycle(1, 2)
+    # the same infinite list
+    assert cycle(1, 2) == cycle(1, 2, 1, 2)
+    assert cycle(1, 2) != cycle(1, 3)
+    assert cycle(1, 2) != cycle(1, 2, 1)
+    assert str(cycle(1, 2)) == '(1 : (2 : ...))'
+
+
+def test_lambdas_are_compared_by_identity():
+    f = LambdaValue(V.list_to_cons([V.symbol('x')]), V.symbol('x'))
+    g = LambdaValue(V.list_to_cons([V.symbol('x')]), V.symbol('x'))
+    assert V(VT.LAMBDA, f) == V(VT.LAMBDA, f)
+    assert V(VT.LAMBDA, f) != V(VT.LAMBDA, g)
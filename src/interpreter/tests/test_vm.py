@@ -0,0 +1,99 @@
+import pytest
+
+from interpreter import bytecode, desugarizer, lexer, parser
+from interpreter.types import Value as V, ValueType as VT, RuntimeError
+
+
+testdata = [
+    ('number', '3', V(VT.NUMBER, 3)),
+    ('arithmetic', '(+ 1 (* 2 3))', V(VT.NUMBER, 7)),
+    ('if', '(if (< 1 2) 4 6)', V(VT.NUMBER, 4)),
+    ('block', '((def x 4), (+ x 1))', V(VT.NUMBER, 5)),
+    ('empty list', '(list)', V(VT.NIL)),
+    ('quote', "'x", V.list_to_cons([V(VT.STRING, 'quote'), V(VT.STRING, 'x')])),
+    ('eval', "(eval '(+ 1 2))", V(VT.NUMBER, 3)),
+    ('eval sees locals', "((lambda (x) (eval '(+ x 1))) 1)", V(VT.NUMBER, 2)),
+    ('eval with local def', "((lambda (x) (eval '((def y 2), (+ x y)))) 1)",
+        V(VT.NUMBER, 3)),
+    ('set', '(def x 1) (set x 2) x', V(VT.NUMBER, 2)),
+    ('closure', '''
+        (def adder (lambda (a) (lambda (b) (+ a b))))
+        ((adder 3) 4)
+     ''', V(VT.NUMBER, 7)),
+    ('shared captured frame', '''
+        (def counter (lambda () ((def n 0), (lambda () (set n (+ n 1))))))
+        (def c (counter))
+        (c)
+        (c)
+     ''', V(VT.NUMBER, 2)),
+    ('outer variable', '''
+        (def f (lambda (a) ((def g (lambda () ((def b 1), (+ a b)))), (g))))
+        (f 4)
+     ''', V(VT.NUMBER, 5)),
+    ('recursion', '''
+        (def fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+        (fib 10)
+     ''', V(VT.NUMBER, 55)),
+    ('prelude', '''
+        (reduce (lambda (a b) (+ a b))
+                (map (lambda (x) (* x x)) (filter (lambda (x) (> x 1)) (list 1 2 3)))
+                0)
+     ''', V(VT.NUMBER, 13)),
+    ('list functions as values', '''
+        (def twice (lambda (g f l) (g f (g f l))))
+        (def sum (lambda (fold l) (fold (lambda (a b) (+ a b)) l 0)))
+        (list (twice map (lambda (x) (* x 2)) (list 1 2))
+              (twice filter (lambda (x) (> x 1)) (list 1 2 3))
+              (sum reduce (list 1 2 3))
+              (sum foldr (list 1 2 3))
+              ((lambda (r) (r (list 1 2))) reverse))
+     ''', V.list_to_cons([
+        V.list_to_cons([V(VT.NUMBER, 4), V(VT.NUMBER, 8)]),
+        V.list_to_cons([V(VT.NUMBER, 2), V(VT.NUMBER, 3)]),
+        V(VT.NUMBER, 6),
+        V(VT.NUMBER, 6),
+        V.list_to_cons([V(VT.NUMBER, 2), V(VT.NUMBER, 1)]),
+     ])),
+]
+
+
+@pytest.mark.parametrize('name,code,expected', testdata)
+def test_vm(name, code, expected, run):
+    assert run(code, 'vm', prelude=True) == expected
+
+
+@pytest.mark.parametrize('name,code,expected', testdata)
+def test_matches_closure_compiler(name, code, expected, run):
+    assert run(code, 'vm', prelude=True) == run(code, 'closure', prelude=True)
+
+
+def test_deep_recursion(run):
+    # Calls in the VM don't use the Python stack, even outside tail position.
+    assert run('''
+        (def sum (lambda (n) (if (= n 0) 0 (+ n (sum (- n 1))))))
+        (sum 50000)
+    ''', 'vm', prelude=True) == V(VT.NUMBER, 1250025000)
+
+
+@pytest.mark.parametrize('code', [
+    '(+ 1 y)',
+    '((lambda () ((set q 1), q)))',
+    '((lambda (x) x) 1 2)',
+    '(1 2)',
+    '(if 1 2 3)',
+])
+def test_errors(code, run):
+    with pytest.raises(RuntimeError):
+        run(code, 'vm', prelude=True)
+
+
+def test_disassemble():
+    node, = [
+        parser.parse(tree)
+        for tree in desugarizer.desugar(lexer.lex('(if (< x 2) x y)'))
+    ]
+    lines = bytecode.disassemble(bytecode.compile_toplevel(node)).splitlines()
+    assert [line.split()[1] for line in lines] == [
+        'LOAD_GLOBAL', 'CONST', 'CALL_BUILTIN', 'JUMP_IF_FALSE', 'LOAD_GLOBAL',
+        'JUMP', 'LOAD_GLOBAL', 'RETURN',
+    ]
@@ -1,5 +1,6 @@
+import array
 from enum import Enum, auto
-from typing import Any, List, Dict, Optional, Union
+from typing import Any, Iterator, List, Dict, Optional, Union
 
 import attr
 
@@ -8,6 +9,8 @@ class TokenType:
     # Syntactic elements
     OPEN_PAREN = 'open_paren'
     CLOSE_PAREN = 'close_paren'
+    OPEN_BRACKET = 'open_bracket'
+    CLOSE_BRACKET = 'close_bracket'
     QUOTE = 'quote'
     THEN = 'then'
 
@@ -22,6 +25,9 @@ class TokenType:
 class Token:
     variant: TokenType
     value: Any = None
+    # position in the source, starting at 1; 0 if unknown
+    line: int = attr.ib(default=0, eq=False)
+    column: int = attr.ib(default=0, eq=False)
 
 
 @attr.s(auto_attribs=True, slots=True)
@@ -39,6 +45,14 @@ class ValueType(Enum):
     # Non-node types
     LAMBDA = 'lambda'
     NIL = 'nil'
+    # `value` is a list of Values, or for vectors of numbers only, an
+    # array.array of the numbers themselves
+    VECTOR = 'vector'
+    # `value` is a dict from Values to Values; only values of the types in
+    # HASHABLE can be keys
+    HASHMAP = 'hashmap'
+    # `value` is a NumPy array; see arrays.py
+    NDARRAY = 'ndarray'
 
 
 class LispTypeError(Exception):
@@ -53,44 +67,87 @@ class ParseError(Exception):
     pass
 
 
-@attr.s(auto_attribs=True, slots=True)
-class Value:
-    variant: ValueType
-    # for LAMBDA, it's a tuple with first arg the representation of the lambda,
-    # and the second is the local scope
-    # In turn, the first argument is the list of arguments, and the second is
-    # the body.
-    value: Any = None
+class _Node:
+    """What values and conses have in common: comparing, hashing, iterating
+    over and printing them. It has no fields, so that `Cons` doesn't carry
+    the unused fields of `Value`."""
+    __slots__ = ()
 
     def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, _Node):
+            return NotImplemented
         if self.variant != other.variant:
             return False
-
-        if self.variant in {
-            ValueType.NIL,
-            ValueType.NUMBER,
-            ValueType.STRING,
-            ValueType.BOOLEAN,
-        }:
+        if self.variant == ValueType.VECTOR:
+            a = self.value
+            b = other.value
+            return len(a) == len(b) and all(
+                x == y for x, y in zip(vector_items(a), vector_items(b))
+            )
+        if self.variant == ValueType.NDARRAY:
+            a = self.value
+            b = other.value
+            return a.shape == b.shape and bool((a == b).all())
+        if self.variant == ValueType.LAMBDA:
+            # as the closures of the other engines are compared
+            return self.value is other.value
+        if self.variant != ValueType.CONS:
             return self.value == other.value
-        elif self.variant in {ValueType.CONS, ValueType.LAMBDA}:
-            return self is other
-        else:
-            raise NotImplemented(f'Equality not defined for {self.variant}.')
+
+        # Compare lists cell by cell instead of recursing down the cdrs, so
+        # that long lists don't overflow the stack.
+        a = self.value
+        b = other.value
+        cells = 0
+        seen = None
+        while True:
+            if a is b:
+                return True
+            if a.car != b.car:
+                return False
+            a = a.cdr
+            b = b.cdr
+            if a.variant != ValueType.CONS or b.variant != ValueType.CONS:
+                return a == b
+            a = a.value
+            b = b.value
+            cells += 1
+            if cells > _UNTRACKED_CELLS:
+                # Lists this long may be cyclic (see `set_cdr`). If a pair of
+                # cells comes round again, everything from there on has
+                # already been found equal.
+                if seen is None:
+                    seen = set()
+                pair = (id(a), id(b))
+                if pair in seen:
+                    return True
+                seen.add(pair)
+
+    def __ne__(self, other) -> bool:
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self) -> int:
+        if self.variant not in HASHABLE:
+            raise LispTypeError(f'Cannot hash values of type {self.variant}')
+        # 1 and 1.0 are equal numbers, and hash the same in Python too
+        return hash((self.variant, self.value))
 
     def __bool__(self) -> bool:
-        if self.variant == ValueType.NUMBER:
+        variant = self.variant
+        if variant == ValueType.BOOLEAN:
+            return self.value
+        elif variant == ValueType.NUMBER:
             return self.value != 0
-        elif self.variant == ValueType.STRING:
+        elif variant == ValueType.STRING:
             return self.value != ''
-        elif self.variant == ValueType.BOOLEAN:
-            return self.value
-        elif self.variant in (ValueType.CONS, ValueType.BOOLEAN):
-            return True
-        elif self.variant == ValueType.NIL:
+        elif variant == ValueType.NIL:
             return False
-        else:
-            raise NotImplemented(f'Truthiness not defined for {self.variant}.')
+        return True
 
     def _value_comparison(f):
         def wrapped(v1, v2):
@@ -99,7 +156,7 @@ class Value:
                     f'Args to {f.__name__} must have same type but got: '
                     f'{v1}, {v2}' 
                 )
-            elif v1.variant in (ValueType.CONS, ValueType.BOOLEAN):
+            elif v1.variant not in (ValueType.NUMBER, ValueType.STRING):
                 raise LispTypeError(
                     f'Cannot compare values of type {v1.variant}.'
                 )
@@ -108,36 +165,30 @@ class Value:
 
     @_value_comparison
     def __lt__(self, other):
-        return super().__lt__(self, other)
+        return self.value < other.value
 
     @_value_comparison
-    def __lte__(self, other):
-        return super().__le__(self, other)
+    def __le__(self, other):
+        return self.value <= other.value
 
     @_value_comparison
     def __gt__(self, other):
-        return super().__gt__(self, other)
+        return self.value > other.value
 
     @_value_comparison
-    def __gte__(self, other):
-        return super().__gte__(self, other)
+    def __ge__(self, other):
+        return self.value >= other.value
 
     @classmethod
     def list_to_cons(cls, values: List['Value']) -> 'Value':
-        if not values:
-            return cls(ValueType.NIL)
-        result_cons = Cons()
-        curr = result_cons
-        for v in values[:-1]:
-            curr.car = v
-            curr.cdr = cls(ValueType.CONS, Cons())
-            curr = curr.cdr.value
-        curr.car = values[-1]
-        return cls(ValueType.CONS, result_cons)
+        result = NIL
+        for v in reversed(values):
+            result = Cons(v, result)
+        return result
 
     def __iter__(self):
         if self.variant in (ValueType.CONS, ValueType.NIL):
-            return Cons._Iterator(self)
+            return _iterate(self)
         raise ValueError(
             f'Iteration only allowed on CONS and NIL values, but got '
             f'{self.variant}'
@@ -150,65 +201,176 @@ class Value:
         return result
 
     def __str__(self):
-        if self.variant in {
+        if self.variant in (
             ValueType.NUMBER,
             ValueType.STRING,
             ValueType.BOOLEAN,
+            ValueType.NDARRAY,
             # these two are already defined elsewhere
             ValueType.CONS,
             ValueType.LAMBDA,
-        }:
+        ):
             return str(self.value)
         elif self.variant == ValueType.NIL:
             return 'nil'
+        elif self.variant == ValueType.VECTOR:
+            return '[' + ' '.join(map(str, vector_items(self.value))) + ']'
+        elif self.variant == ValueType.HASHMAP:
+            return '{' + ', '.join(
+                f'{key} {value}' for key, value in self.value.items()
+            ) + '}'
         else:
             raise ValueError(f'Unknown variant: {self.variant}')
 
 
+# Values are compared and hashed by hand in _Node, so attrs only provides
+# __init__ and __repr__. Nothing takes weak references to values, so they
+# have no slot for them.
+@attr.s(auto_attribs=True, slots=True, eq=False, weakref_slot=False)
+class Value(_Node):
+    variant: ValueType
+    # for LAMBDA, it's a tuple with first arg the representation of the lambda,
+    # and the second is the local scope
+    # In turn, the first argument is the list of arguments, and the second is
+    # the body.
+    value: Any = None
+
+    # Values are shared freely (nil, booleans, small numbers and symbols are
+    # even interned; see below), so they must not be changed after they are
+    # made. The only mutable values are the cars and cdrs of conses, and the
+    # elements of vectors and hashmaps.
+
+    @staticmethod
+    def number(n) -> 'Value':
+        if n.__class__ is int and _SMALL_INT_MIN <= n < _SMALL_INT_MAX:
+            return _SMALL_INTS[n - _SMALL_INT_MIN]
+        return Value(ValueType.NUMBER, n)
+
+    @staticmethod
+    def boolean(b: bool) -> 'Value':
+        return TRUE if b else FALSE
+
+    @staticmethod
+    def symbol(name: str) -> 'Value':
+        """An interned STRING value."""
+        value = _SYMBOLS.get(name)
+        if value is None:
+            value = Value(ValueType.STRING, name)
+            if len(_SYMBOLS) < _MAX_SYMBOLS:
+                _SYMBOLS[name] = value
+        return value
+
+
     LAMBDA = 'lambda'
     NIL = 'nil'
     QUOTED = 'quoted'
 
 
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Captured:
+    """The variables a lambda made by the tree-walker captured: the scope of
+    the arguments of the call that returned it, linked to what the function
+    called had captured in turn. Closures share these rather than copying
+    them."""
+    variables: Dict[str, Value]
+    parent: Optional['Captured'] = None
+
+
 @attr.s(auto_attribs=True, slots=True)
 class LambdaValue:
     """`value` of a lambda."""
     args: Value
     body: Value
-    scope: Dict[str, Value]
+    scope: Optional[Captured] = None
 
     def __str__(self):
         arg_str = ' '.join([arg.value.car.value for arg in self.args])
         return f'<lambda: ({arg_str})>'
 
 
-@attr.s(auto_attribs=True, slots=True)
-class Cons:
-    car: Any = attr.ib(factory=lambda: Value(ValueType.NIL))
-    cdr: Any = attr.ib(factory=lambda: Value(ValueType.NIL))
+class Cons(_Node):
+    """A cons cell.
+
+    A cons is its own CONS value, so that a list cell is a single object:
+    `cons.value` is `cons` itself. `Value(ValueType.CONS, Cons(...))` is still
+    accepted wherever a cons is, but costs an extra object per cell.
+
+    It shares its methods with Value through `_Node` rather than subclassing
+    it, so that a cell only has the two slots it uses."""
+    __slots__ = ('car', 'cdr')
+
+    variant = ValueType.CONS
+
+    def __init__(self, car: Value = None, cdr: Value = None):
+        self.car = NIL if car is None else car
+        self.cdr = NIL if cdr is None else cdr
+
+    @property
+    def value(self) -> 'Cons':
+        return self
+
+    def __repr__(self):
+        return f'Cons(car={self.car!r}, cdr={self.cdr!r})'
 
     def __str__(self):
-        cdr_to_str = self.cdr if self.cdr.variant else self.cdr.value
-        return f'({self.car.value} : {cdr_to_str})'
-
-    @attr.s(auto_attribs=True, slots=True)
-    class _Iterator:
-        cons: Value
-        idx: int = 0
-        current: Optional[Value] = None
-
-        def __attrs_post_init__(self):
-            self.current = self.cons
-
-        def __next__(self):
-            if self.current.variant == ValueType.NIL:
-                raise StopIteration
-            elif self.current.variant == ValueType.CONS:
-                result = self.current
-                self.current = self.current.value.cdr
-                self.idx += 1
-                return result
-            # todo error handling??
-            raise ValueError(
-                f'Received non-cons at position {idx}: {self.current}'
-            )
+        # Built in a loop rather than recursively along the cdrs, so that long
+        # lists can be printed. A list made cyclic by `set_cdr` ends in '...'
+        # where it comes round again.
+        parts = []
+        seen = set()
+        curr = self
+        while curr.variant == ValueType.CONS:
+            curr = curr.value
+            if id(curr) in seen:
+                parts.append('...')
+                break
+            seen.add(id(curr))
+            parts.append(f'({curr.car.value} : ')
+            curr = curr.cdr
+        else:
+            parts.append(str(curr))
+        parts.append(')' * (len(parts) - 1))
+        return ''.join(parts)
+
+
+def vector_items(vector) -> Iterator[Value]:
+    """The elements of the `value` of a VECTOR, as Values."""
+    if isinstance(vector, array.array):
+        return map(Value.number, vector)
+    return iter(vector)
+
+
+def _iterate(value: Value):
+    """Yields the cons cells of a list."""
+    current = value
+    idx = 0
+    while current.variant == ValueType.CONS:
+        yield current
+        current = current.value.cdr
+        idx += 1
+    if current.variant != ValueType.NIL:
+        # todo error handling??
+        raise ValueError(
+            f'Received non-cons at position {idx}: {current}'
+        )
+
+
+# cells of two lists compared before checking whether they have cycles
+_UNTRACKED_CELLS = 1000
+
+HASHABLE = (ValueType.NUMBER, ValueType.STRING, ValueType.BOOLEAN)
+
+NIL = Value(ValueType.NIL)
+TRUE = Value(ValueType.BOOLEAN, True)
+FALSE = Value(ValueType.BOOLEAN, False)
+
+_SMALL_INT_MIN = -128
+_SMALL_INT_MAX = 1024
+_SMALL_INTS = [
+    Value(ValueType.NUMBER, n) for n in range(_SMALL_INT_MIN, _SMALL_INT_MAX)
+]
+
+# Symbols are interned up to this many distinct names, so that programs that
+# make many one-off strings don't grow the table forever.
+_MAX_SYMBOLS = 1 << 16
+_SYMBOLS: Dict[str, Value] = {}
@@ -0,0 +1,278 @@
+import time
+from typing import List, Optional, Union
+
+import attr
+
+from .types import ValueType, Value, RuntimeError
+from .evaluator import Environment, to_list
+from .resolver import Frame, UNDEFINED
+from .builtin_handlers import Memoized
+from .bytecode import (
+    CodeObject, compile_eval,
+    CONST, LOAD_LOCAL, LOAD_OUTER, LOAD_GLOBAL, SET_LOCAL, DEF_LOCAL,
+    SET_GLOBAL, DEF_GLOBAL, POP, JUMP, JUMP_IF_FALSE, ENTER_SCOPE,
+    LEAVE_SCOPE, MAKE_CLOSURE, CALL, TAIL_CALL, CALL_BUILTIN, LIST, EVAL,
+    RAISE, RETURN,
+)
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Closure:
+    """`value` of a lambda created by the VM."""
+    function: CodeObject
+    frame: Optional[Frame]
+
+    def __str__(self):
+        arg_str = ' '.join([arg.value.car.value for arg in self.function.args])
+        return f'<lambda: ({arg_str})>'
+
+
+def _undefined(name):
+    return RuntimeError(f'Variable {name} not defined')
+
+
+def _is_quoted(value: Value) -> bool:
+    return (
+        (value.variant == ValueType.CONS) and
+        (value.value.car.variant == ValueType.STRING) and
+        (value.value.car.value == 'quote')
+    )
+
+
+class DeadlinePassed(RuntimeError):
+    pass
+
+
+def call(
+    env: Environment, fn: Value, args: List[Value],
+    deadline: Optional[float] = None,
+) -> Value:
+    """Calls the lambda `fn` from Python, for builtins that take functions.
+    Raises DeadlinePassed if it is still running at `deadline`, by
+    time.monotonic."""
+    if fn.variant == ValueType.LAMBDA and fn.value.__class__ is Memoized:
+        return fn.value.call(
+            args, lambda fn, args: call(env, fn, args, deadline),
+        )
+    if fn.variant != ValueType.LAMBDA or fn.value.__class__ is not Closure:
+        raise RuntimeError(f'Cannot call {fn}')
+    closure = fn.value
+    function = closure.function
+    if len(args) != function.arity:
+        raise RuntimeError(
+            f'{closure} takes {function.arity} argument(s) but got '
+            f'{len(args)}'
+        )
+    return _run(
+        env, function, 0, [closure.frame, *args, *function.padding], [], [],
+        None, deadline,
+    )
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class Suspended:
+    """Where `start` or `resume` stopped when they ran out of steps, to pass
+    to `resume`."""
+    code_object: CodeObject
+    pc: int
+    frame: Optional[Frame]
+    stack: List[Value]
+    calls: List[tuple]
+
+
+def execute(
+    env: Environment, code_object: CodeObject, frame: Optional[Frame] = None,
+) -> Value:
+    """Runs top-level bytecode from `bytecode.compile_toplevel`, or the code
+    of a function given the `frame` of its call."""
+    return _run(env, code_object, 0, frame, [], [], None)
+
+
+def start(
+    env: Environment, code_object: CodeObject, steps: int,
+    deadline: Optional[float] = None,
+) -> Union[Value, Suspended]:
+    """Like `execute`, but stops after `steps` calls of lambdas, and returns
+    where it stopped if it didn't finish. Calls made from builtins, such as
+    `map`, can't be stopped there, so they run to the end within a step,
+    unless they are still running at `deadline`, by time.monotonic, when
+    DeadlinePassed is raised."""
+    return _run(env, code_object, 0, None, [], [], steps, deadline)
+
+
+def resume(
+    env: Environment, suspended: Suspended, steps: int,
+    deadline: Optional[float] = None,
+) -> Union[Value, Suspended]:
+    """Carries on from where `start` or `resume` stopped, for up to `steps`
+    more calls."""
+    return _run(
+        env, suspended.code_object, suspended.pc, suspended.frame,
+        suspended.stack, suspended.calls, steps, deadline,
+    )
+
+
+def _run(
+    env: Environment, code_object: CodeObject, pc: int,
+    frame: Optional[Frame], stack: List[Value], calls: List[tuple],
+    steps: Optional[int], deadline: Optional[float] = None,
+) -> Union[Value, Suspended]:
+    # `calls` has the (code object, pc, frame) to return to, for every call
+    # in progress.
+    globals_ = env.scopes[0]
+    code = code_object.code
+    consts = code_object.consts
+    push = stack.append
+    pop = stack.pop
+
+    while True:
+        op = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+
+        if op == LOAD_LOCAL:
+            value = frame[arg]
+            if value is UNDEFINED:
+                raise _undefined(code_object.local_names[pc - 2])
+            push(value)
+        elif op == CONST:
+            push(consts[arg])
+        elif op == LOAD_GLOBAL:
+            try:
+                push(globals_[code_object.names[arg]])
+            except KeyError:
+                raise _undefined(code_object.names[arg]) from None
+        elif op == CALL_BUILTIN:
+            handler, count, calls_functions = consts[arg]
+            if count:
+                args = stack[-count:]
+                del stack[-count:]
+            else:
+                args = []
+            if not calls_functions:
+                push(handler(args))
+            elif calls_functions == 1:
+                push(handler(
+                    args, lambda fn, args: call(env, fn, args, deadline),
+                ))
+            else:
+                push(handler(
+                    args, lambda fn, args: call(env, fn, args, deadline),
+                    env,
+                ))
+        elif op == JUMP_IF_FALSE:
+            cond_result = pop()
+            if cond_result.variant != ValueType.BOOLEAN or \
+                    not isinstance(cond_result.value, bool):
+                raise RuntimeError(
+                    f'Condition returned non-bool value: {cond_result}'
+                )
+            if not cond_result.value:
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == CALL or op == TAIL_CALL:
+            fn = pop()
+            if arg:
+                args = stack[-arg:]
+                del stack[-arg:]
+            else:
+                args = []
+            if fn.variant != ValueType.LAMBDA or \
+                    fn.value.__class__ is not Closure:
+                if fn.variant != ValueType.LAMBDA or \
+                        fn.value.__class__ is not Memoized:
+                    raise RuntimeError(f'Cannot call {fn}')
+                push(call(env, fn, args, deadline))
+                if op == TAIL_CALL:
+                    # returns the result, as RETURN does
+                    if not calls:
+                        return pop()
+                    code_object, pc, frame = calls.pop()
+                    code = code_object.code
+                    consts = code_object.consts
+                continue
+            closure = fn.value
+            function = closure.function
+            if arg != function.arity:
+                raise RuntimeError(
+                    f'{closure} takes {function.arity} argument(s) but got '
+                    f'{arg}'
+                )
+            if op == CALL:
+                calls.append((code_object, pc, frame))
+            code_object = function
+            code = function.code
+            consts = function.consts
+            pc = 0
+            frame = [closure.frame, *args, *function.padding]
+            if steps is not None:
+                steps -= 1
+                if not steps:
+                    return Suspended(code_object, pc, frame, stack, calls)
+            elif deadline is not None and time.monotonic() > deadline:
+                # in a call from a builtin, which can't be suspended
+                raise DeadlinePassed('Ran past the deadline')
+        elif op == RETURN:
+            if not calls:
+                return pop()
+            code_object, pc, frame = calls.pop()
+            code = code_object.code
+            consts = code_object.consts
+        elif op == POP:
+            pop()
+        elif op == LOAD_OUTER:
+            outer = frame
+            for _ in range(arg >> 16):
+                outer = outer[0]
+            value = outer[arg & 0xFFFF]
+            if value is UNDEFINED:
+                raise _undefined(code_object.local_names[pc - 2])
+            push(value)
+        elif op == MAKE_CLOSURE:
+            push(Value(ValueType.LAMBDA, Closure(consts[arg], frame)))
+        elif op == ENTER_SCOPE:
+            frame = [frame, *([UNDEFINED] * arg)]
+        elif op == LEAVE_SCOPE:
+            frame = frame[0]
+        elif op == SET_LOCAL or op == DEF_LOCAL:
+            outer = frame
+            for _ in range(arg >> 16):
+                outer = outer[0]
+            slot = arg & 0xFFFF
+            if op == SET_LOCAL and outer[slot] is UNDEFINED:
+                raise _undefined(code_object.local_names[pc - 2])
+            outer[slot] = stack[-1]
+        elif op == DEF_GLOBAL:
+            globals_[code_object.names[arg]] = stack[-1]
+        elif op == SET_GLOBAL:
+            name = code_object.names[arg]
+            if name not in globals_:
+                raise _undefined(name)
+            globals_[name] = stack[-1]
+        elif op == LIST:
+            if arg:
+                values = stack[-arg:]
+                del stack[-arg:]
+            else:
+                values = []
+            push(to_list(values))
+        elif op == EVAL:
+            to_reeval = pop()
+            # Each evaluation removes one layer of quoting, if necessary. The
+            # quoted code is only known now, so it is compiled on the spot and
+            # run like a call that shares the current frame.
+            if not _is_quoted(to_reeval):
+                push(to_reeval)
+                continue
+            calls.append((code_object, pc, frame))
+            code_object = compile_eval(to_reeval.value.cdr.value.car, consts[arg])
+            code = code_object.code
+            consts = code_object.consts
+            pc = 0
+            if code_object.scope is not None:
+                frame = [frame, *code_object.padding]
+        elif op == RAISE:
+            raise RuntimeError(consts[arg])
+        else:
+            raise RuntimeError(f'Unknown opcode {op}')
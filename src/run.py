@@ -0,0 +1,127 @@
+"""Runs a file, or an expression given with -e, and prints the value of its
+last form. Unlike interactive.py, this doesn't import click or readline, so
+that it starts quickly.
+
+`--startup-time` reports how long the imports and loading the builtins took,
+on stderr, `--profile` reports the time spent in each Lisp function and
+builtin (see interpreter/profiler.py), and `--inline` reports the calls of
+the program it inlined (see interpreter/optimizer.py)."""
+import time
+
+_start = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+from interpreter import evaluator, optimizer, pipeline
+
+_imported = time.perf_counter()
+
+
+BUILTINS = os.path.join(os.path.dirname(__file__), 'interpreter', 'builtins.lisp')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('file', nargs='?', help='the file to run')
+    source.add_argument('-e', '--expression', help='the code to run')
+    parser.add_argument('--engine', choices=sorted(pipeline.ENGINES),
+        help="default: 'tree' with --profile, 'closure' otherwise")
+    parser.add_argument('--builtins', default=BUILTINS,
+        help='the file of builtins to load first')
+    parser.add_argument('--no-builtins', dest='builtins', action='store_const',
+        const=None, help="don't load any builtins")
+    parser.add_argument('--cache', action='store_true',
+        help='cache the parsed forms of the files on disk')
+    parser.add_argument('-O', '--optimize', action='store_true',
+        help='fold constants and remove dead branches before running; see '
+        'interpreter/optimizer.py')
+    parser.add_argument('--inline', action='store_true',
+        help='inline calls of small functions of the program, and report '
+        'them on stderr')
+    parser.add_argument('--inline-size', metavar='SIZE', type=int,
+        default=optimizer.INLINE_SIZE,
+        help='the most atoms in the bodies of the functions inlined '
+        '(default: %(default)s)')
+    parser.add_argument('--startup-time', action='store_true',
+        help='report the time taken to start up on stderr')
+    parser.add_argument('--profile', metavar='PATH',
+        help='report the time spent in each function on stderr, and save the '
+        'stacks of calls to PATH for flame graph tools; needs the tree engine')
+    args = parser.parse_args(argv)
+    if args.engine is None:
+        args.engine = 'tree' if args.profile else 'closure'
+    if args.profile and args.engine != 'tree':
+        parser.error('--profile needs the tree engine')
+    return args
+
+
+def _run_file(env, path, engine, cache, optimize, inliner=None):
+    if cache:
+        return pipeline.run_file(
+            env, path, engine, optimize=optimize, inliner=inliner,
+        )
+    with open(path) as f:
+        if inliner is not None:
+            # inlining needs the whole program
+            return pipeline.run_code(env, f.read(), engine, optimize, inliner)
+        return pipeline.run_stream(env, f, engine, optimize)
+
+
+def startup_report(times) -> str:
+    lines = [f'{"stage":<12} {"time (ms)":>10}']
+    for name, seconds in times:
+        lines.append(f'{name:<12} {seconds * 1000:>10.3f}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    times = [('imports', _imported - _start)]
+
+    start = time.perf_counter()
+    if args.profile:
+        from interpreter import profiler
+        env = profiler.ProfilingEnvironment()
+    else:
+        env = evaluator.Environment()
+    env.begin_toplevel()
+    if args.builtins:
+        _run_file(
+            env, args.builtins, args.engine, args.cache, args.optimize,
+        )
+    times.append(('builtins', time.perf_counter() - start))
+    if args.profile:
+        # only the program is profiled
+        env.profiler = profiler.Profiler()
+
+    inliner = None
+    if args.inline:
+        inliner = optimizer.Inliner(args.inline_size)
+
+    start = time.perf_counter()
+    if args.expression is not None:
+        value = pipeline.run_code(
+            env, args.expression, args.engine, args.optimize, inliner,
+        )
+    else:
+        value = _run_file(
+            env, args.file, args.engine, args.cache, args.optimize, inliner,
+        )
+    times.append(('program', time.perf_counter() - start))
+
+    print(value)
+    if inliner is not None:
+        print(inliner.report(), file=sys.stderr)
+    if args.profile:
+        print(env.profiler.table(), file=sys.stderr)
+        env.profiler.save_collapsed(args.profile)
+    if args.startup_time:
+        times.append(('total', time.perf_counter() - _start))
+        print(startup_report(times), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()